@@ -0,0 +1,70 @@
+"""
+Compare the single-pass tokenizer with the original regex tokenizer on the pages of a dump:
+pages/sec of each and how closely the terms they extract per field agree.
+
+Agreement of a field is sum(min(tf_a, tf_b)) / sum(max(tf_a, tf_b)) over every (page, term) of that field,
+1.0 when both tokenizers extract exactly the same terms with the same frequencies.
+Exits with status 1 if the agreement of any field is below --min-agreement.
+
+usage: python -m benchmarks.bench_tokenizer <path_to_wiki_dump> [--min-agreement 0.9]
+"""
+import argparse
+import sys
+import time
+from collections import Counter, defaultdict
+
+from src import constants
+from src.helpers import Helpers
+from src.parser import iter_pages
+from src.tokenizer import Tokenizer, RegexTokenizer
+
+
+def run(tokenizer_class, pages):
+    """Returns the termid frequencies of every page and the time taken to tokenize them."""
+    start = time.perf_counter()
+    results = []
+    for title, text in pages:
+        results.append(tokenizer_class(title).tokenize(text))
+    return results, time.perf_counter() - start
+
+
+def agreement(pages, results_a, results_b):
+    """Returns {field: agreement} of the two tokenizations."""
+    term_of = {termid: term for term, termid in Helpers.term_termid_map.items()}
+    common, total = defaultdict(int), defaultdict(int)
+    for a, b in zip(results_a, results_b):
+        a = Counter({term_of[termid] + field: tf for termid, tfs in a.items()
+                     for field, tf in zip(constants.FIELDS, tfs) if tf})
+        b = Counter({term_of[termid] + field: tf for termid, tfs in b.items()
+                     for field, tf in zip(constants.FIELDS, tfs) if tf})
+        for term in a.keys() | b.keys():
+            field = term[-1]
+            common[field] += min(a[term], b[term])
+            total[field] += max(a[term], b[term])
+    return {field: common[field] / total[field] for field in constants.FIELDS if total[field]}
+
+
+if __name__ == "__main__":
+    argparser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    argparser.add_argument("dump_path")
+    argparser.add_argument("--min-agreement", type=float, default=0.9)
+    args = argparser.parse_args()
+
+    Helpers.load_stopwords(constants.STOPWORDS_FILE_PATH)
+    pages = [(page.title, page.text) for page in iter_pages(args.dump_path)]
+
+    # warm the stem cache so that neither run pays for stemming a word the first time
+    run(Tokenizer, pages)
+    single_pass, single_pass_time = run(Tokenizer, pages)
+    regex, regex_time = run(RegexTokenizer, pages)
+
+    print(f"pages: {len(pages)}")
+    print(f"{'':12}{'time (s)':>12}{'pages/s':>12}")
+    for name, elapsed in (("regex", regex_time), ("single-pass", single_pass_time)):
+        print(f"{name:12}{elapsed:12.3f}{len(pages) / elapsed:12.1f}")
+    print(f"speedup: {regex_time / single_pass_time:.2f}x")
+
+    fields = agreement(pages, regex, single_pass)
+    print("agreement: " + ", ".join(f"{field}={value:.3f}" for field, value in fields.items()))
+    if any(value < args.min_agreement for value in fields.values()):
+        sys.exit(1)
@@ -0,0 +1,48 @@
+"""
+Compare WAND top-k evaluation with exhaustive evaluation on the same query file.
+
+usage: python -m benchmarks.bench_topk <path_to_index_folder> <path_to_query_file> [--k 10] [--lazy]
+"""
+import argparse
+import time
+
+from search import Search
+
+
+def run(search, queries):
+    """Returns the results of every query, the time taken and the no. of postings scored."""
+    search.scored_postings = 0
+    start = time.perf_counter()
+    results = [search.search(query) for query in queries]
+    return results, time.perf_counter() - start, search.scored_postings
+
+
+if __name__ == "__main__":
+    argparser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    argparser.add_argument("index_dir")
+    argparser.add_argument("queryfile")
+    argparser.add_argument("--k", type=int, default=10)
+    argparser.add_argument("--lazy", action="store_true")
+    args = argparser.parse_args()
+
+    with open(args.queryfile, "r") as fp:
+        queries = [line for line in fp if line.strip()]
+
+    exhaustive = Search(lazy=args.lazy, top_k=args.k, pruning=False, result_cache_size=0)
+    exhaustive.load(args.index_dir)
+    pruned = Search(lazy=args.lazy, top_k=args.k, pruning=True, result_cache_size=0)
+    pruned.load(args.index_dir)
+
+    exhaustive_results, exhaustive_time, exhaustive_scored = run(exhaustive, queries)
+    pruned_results, pruned_time, pruned_scored = run(pruned, queries)
+
+    mismatches = sum(1 for a, b in zip(exhaustive_results, pruned_results) if a != b)
+
+    print(f"queries: {len(queries)}, k: {args.k}")
+    print(f"{'':12}{'time (s)':>12}{'queries/s':>12}{'postings scored':>18}")
+    for name, elapsed, scored in (("exhaustive", exhaustive_time, exhaustive_scored),
+                                  ("wand", pruned_time, pruned_scored)):
+        print(f"{name:12}{elapsed:12.3f}{len(queries) / elapsed:12.1f}{scored:18}")
+    print(f"speedup: {exhaustive_time / pruned_time:.2f}x, "
+          f"postings skipped: {1 - pruned_scored / max(exhaustive_scored, 1):.1%}, "
+          f"queries with different top-{args.k}: {mismatches}")
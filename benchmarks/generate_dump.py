@@ -0,0 +1,181 @@
+"""
+Generate a synthetic MediaWiki XML dump for benchmarks, along with queries over its vocabulary.
+
+Pages look like those of a wikipedia dump as far as the tokenizer is concerned: an infobox (on most pages),
+sections of text with internal links and <ref>{{cite ...}}</ref> references, a references section,
+an external links section and categories. Words are made up from syllables and drawn from a Zipfian
+distribution (the frequency of the word of rank r is proportional to 1 / r^zipf), so posting list lengths
+are as skewed as those of real text. The same --seed always generates the same dump.
+
+usage: python -m benchmarks.generate_dump <path_to_dump (.xml, .xml.bz2 or .xml.gz)> [--pages 5000]
+           [--vocabulary 50000] [--zipf 1.1] [--seed 1] [--queries path_to_query_file] [--no-of-queries 100]
+"""
+import argparse
+import bz2
+import gzip
+import itertools
+import random
+from xml.sax.saxutils import escape
+
+from src import constants
+
+SYLLABLES = ["ka", "ri", "to", "me", "lan", "sor", "vi", "du", "pel", "gra", "no", "shi", "ter", "bo", "zen",
+             "ma", "qui", "ra", "dor", "fel", "thu", "wen", "cas", "li", "om", "ar", "ven", "ush", "pi", "ga"]
+INFOBOX_TYPES = ["person", "settlement", "river", "film", "album", "company", "university", "football club"]
+CITE_TYPES = ["web", "book", "news", "journal"]
+INFOBOX_PROBABILITY = 0.7
+QUERY_FIELDS = ["title", "body", "infobox", "category", "ref", "link"]
+
+
+def make_vocabulary(size, rng):
+    """size distinct made-up words (none of them a stopword), most frequent first."""
+    stopwords = set()
+    with open(constants.STOPWORDS_FILE_PATH, "r") as fp:
+        for line in fp:
+            stopwords.add(line.strip())
+    words = []
+    seen = set()
+    while len(words) < size:
+        word = "".join(rng.choice(SYLLABLES) for _ in range(rng.randint(1, 4)))
+        if word not in seen and word not in stopwords:
+            seen.add(word)
+            words.append(word)
+    return words
+
+
+class ZipfWords:
+    """Draws words of a vocabulary (sorted by rank) with probability proportional to 1 / rank^s."""
+
+    def __init__(self, vocabulary, s, rng):
+        self.vocabulary = vocabulary
+        self.cum_weights = list(itertools.accumulate(1 / rank ** s for rank in range(1, len(vocabulary) + 1)))
+        self.rng = rng
+
+    def words(self, n):
+        return self.rng.choices(self.vocabulary, cum_weights=self.cum_weights, k=n)
+
+    def text(self, n):
+        return " ".join(self.words(n))
+
+    def title(self, n):
+        return " ".join(word.capitalize() for word in self.words(n))
+
+
+def make_paragraph(words, rng):
+    """A paragraph of running text with internal links and cited references."""
+    parts = []
+    for _ in range(rng.randint(3, 8)):
+        parts.append(words.text(rng.randint(5, 25)))
+        choice = rng.random()
+        if choice < 0.4:
+            parts.append(f"[[{words.title(rng.randint(1, 3))}]]")
+        elif choice < 0.6:
+            parts.append(f"[[{words.title(2)}|{words.text(rng.randint(1, 2))}]]")
+        elif choice < 0.8:
+            parts.append(f"<ref>{{{{cite {rng.choice(CITE_TYPES)} |title={words.title(rng.randint(2, 5))} "
+                         f"|url=http://www.{words.text(1)}.com/{words.text(1)} |publisher={words.title(2)} "
+                         f"|year={rng.randint(1900, 2019)}}}}}</ref>")
+        elif choice < 0.85:
+            parts.append(f"<ref name=\"{words.text(1)}\" />")
+    return " ".join(parts) + "."
+
+
+def make_page_text(title, words, rng):
+    lines = []
+    if rng.random() < INFOBOX_PROBABILITY:
+        lines.append(f"{{{{Infobox {rng.choice(INFOBOX_TYPES)}")
+        lines.append(f"| name = {title}")
+        for _ in range(rng.randint(4, 12)):
+            value = words.text(rng.randint(1, 4))
+            if rng.random() < 0.3:
+                value = f"[[{words.title(rng.randint(1, 2))}]]"
+            elif rng.random() < 0.1:
+                value = f"{{{{nowrap|{value}}}}}"
+            lines.append(f"| {words.text(1)} = {value}")
+        lines.append("}}")
+    lines.append(f"'''{title}''' {make_paragraph(words, rng)}")
+    for _ in range(rng.randint(1, 5)):
+        lines.append(f"== {words.title(rng.randint(1, 3))} ==")
+        for _ in range(rng.randint(1, 3)):
+            lines.append(make_paragraph(words, rng))
+            lines.append("")
+    lines.append("== References ==")
+    lines.append("{{reflist}}")
+    lines.append("")
+    lines.append("== External links ==")
+    for _ in range(rng.randint(1, 4)):
+        lines.append(f"* [http://www.{words.text(1)}.org/{words.text(1)} {words.title(rng.randint(1, 4))}]")
+    lines.append("")
+    for _ in range(rng.randint(1, 5)):
+        lines.append(f"[[Category:{words.title(rng.randint(1, 3))}]]")
+    return "\n".join(lines)
+
+
+def generate_pages(no_of_pages, words, rng):
+    """Yields the <page> element of every page, page ids increasing with gaps as in real dumps."""
+    page_id = 0
+    for _ in range(no_of_pages):
+        page_id += rng.randint(1, 3)
+        title = words.title(rng.randint(1, 4))
+        text = make_page_text(title, words, rng)
+        yield (f"  <page>\n    <title>{escape(title)}</title>\n    <ns>0</ns>\n    <id>{page_id}</id>\n"
+               f"    <revision>\n      <id>{page_id + 10000000}</id>\n"
+               f"      <text xml:space=\"preserve\">{escape(text)}</text>\n    </revision>\n  </page>\n")
+
+
+def open_output(path):
+    if path.endswith(".bz2"):
+        return bz2.open(path, "wt", encoding="utf-8")
+    if path.endswith(".gz"):
+        return gzip.open(path, "wt", encoding="utf-8")
+    return open(path, "w", encoding="utf-8")
+
+
+def generate_dump(path, no_of_pages, vocabulary_size=50000, zipf=1.1, seed=1):
+    """Writes a synthetic dump of no_of_pages pages to path, returns its vocabulary (most frequent first)."""
+    rng = random.Random(seed)
+    vocabulary = make_vocabulary(vocabulary_size, rng)
+    words = ZipfWords(vocabulary, zipf, rng)
+    with open_output(path) as fp:
+        fp.write('<mediawiki xmlns="http://www.mediawiki.org/xml/export-0.10/" xml:lang="en">\n')
+        for page in generate_pages(no_of_pages, words, rng):
+            fp.write(page)
+        fp.write("</mediawiki>\n")
+    return vocabulary
+
+
+def generate_queries(vocabulary, no_of_queries, zipf=1.1, seed=1):
+    """
+    Returns {query type: queries} for one word, free text and field queries,
+    whose words are drawn from the same Zipfian distribution as the text.
+    """
+    rng = random.Random(seed + 1)
+    words = ZipfWords(vocabulary, zipf, rng)
+    field_queries = []
+    for _ in range(no_of_queries):
+        fields = rng.sample(QUERY_FIELDS, rng.randint(1, 3))
+        field_queries.append(" ".join(f"{field}:{word}" for field, word in zip(fields, words.words(len(fields)))))
+    return {
+        "one_word": words.words(no_of_queries),
+        "free_text": [words.text(rng.randint(2, 4)) for _ in range(no_of_queries)],
+        "field": field_queries,
+    }
+
+
+if __name__ == "__main__":
+    argparser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    argparser.add_argument("dump_path")
+    argparser.add_argument("--pages", type=int, default=5000)
+    argparser.add_argument("--vocabulary", type=int, default=50000, help="no. of distinct words")
+    argparser.add_argument("--zipf", type=float, default=1.1, help="exponent of the Zipfian word distribution")
+    argparser.add_argument("--seed", type=int, default=1)
+    argparser.add_argument("--queries", default=None, help="also write queries of every type to this file")
+    argparser.add_argument("--no-of-queries", type=int, default=100, help="no. of queries of each type")
+    args = argparser.parse_args()
+
+    vocabulary = generate_dump(args.dump_path, args.pages, args.vocabulary, args.zipf, args.seed)
+    if args.queries:
+        with open(args.queries, "w") as fp:
+            for queries in generate_queries(vocabulary, args.no_of_queries, args.zipf, args.seed).values():
+                for query in queries:
+                    print(query, file=fp)
@@ -0,0 +1,88 @@
+"""
+Load generator for server.py: --connections concurrent clients send the queries of a query file
+(cycling through it) in requests of --batch-size queries, for --duration seconds.
+Prints the throughput and the latency percentiles seen by the clients, then those reported by the server.
+
+usage: python -m benchmarks.load_generator <path_to_query_file> [--host 127.0.0.1] [--port 8765]
+           [--connections 8] [--batch-size 1] [--duration 10]
+"""
+import argparse
+import asyncio
+import itertools
+import json
+import time
+
+from src import constants
+from src.latency import LatencyWindow, LATENCY_WINDOW_SIZE
+
+
+async def client(host, port, queries, batch_size, deadline, latencies):
+    """Send requests on one connection till deadline, returns the no. of queries answered."""
+    reader, writer = await asyncio.open_connection(host, port)
+    answered = 0
+    try:
+        while time.perf_counter() < deadline:
+            batch = [next(queries) for _ in range(batch_size)]
+            request = {"queries": batch} if batch_size > 1 else {"query": batch[0]}
+            start = time.perf_counter()
+            writer.write(json.dumps(request).encode() + b"\n")
+            await writer.drain()
+            response = json.loads(await reader.readline())
+            latencies.record(time.perf_counter() - start)
+            if "error" in response:
+                raise RuntimeError(response["error"])
+            answered += len(batch)
+    finally:
+        writer.close()
+    return answered
+
+
+async def get_server_stats(host, port):
+    reader, writer = await asyncio.open_connection(host, port)
+    writer.write(b'{"stats": true}\n')
+    await writer.drain()
+    stats = json.loads(await reader.readline())
+    writer.close()
+    return stats
+
+
+async def run(args, queries):
+    latencies = LatencyWindow(size=None)  # keep every sample
+    deadline = time.perf_counter() + args.duration
+    queries = itertools.cycle(queries)  # shared by the clients, so they send different queries
+    start = time.perf_counter()
+    answered = await asyncio.gather(*[client(args.host, args.port, queries, args.batch_size, deadline, latencies)
+                                      for _ in range(args.connections)])
+    elapsed = time.perf_counter() - start
+    return sum(answered), elapsed, latencies.stats(), await get_server_stats(args.host, args.port)
+
+
+if __name__ == "__main__":
+    argparser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    argparser.add_argument("queryfile")
+    argparser.add_argument("--host", default=constants.SERVER_HOST)
+    argparser.add_argument("--port", type=int, default=constants.SERVER_PORT)
+    argparser.add_argument("--connections", type=int, default=8)
+    argparser.add_argument("--batch-size", type=int, default=1)
+    argparser.add_argument("--duration", type=float, default=10)
+    args = argparser.parse_args()
+
+    with open(args.queryfile, "r") as fp:
+        queries = [line.rstrip("\n") for line in fp if line.strip()]
+
+    answered, elapsed, client_stats, server_stats = asyncio.run(run(args, queries))
+    print(f"connections: {args.connections}, batch size: {args.batch_size}, duration: {elapsed:.1f}s")
+    print(f"queries: {answered}, queries/s: {answered / elapsed:.1f}, requests/s: {client_stats['per_sec']:.1f}")
+    print(f"client request latency (ms): p50 {client_stats['p50_ms']:.2f}, p99 {client_stats['p99_ms']:.2f}, "
+          f"max {client_stats['max_ms']:.2f}")
+    for name in ("query", "request"):
+        stats = server_stats[name]
+        print(f"server {name} latency (ms): p50 {stats['p50_ms']:.2f}, p99 {stats['p99_ms']:.2f}, "
+              f"max {stats['max_ms']:.2f} over the last {min(stats['count'], LATENCY_WINDOW_SIZE)}")
+    for pid, stats in server_stats["worker_stats"].items():
+        print(f"server caches of {pid}: {json.dumps({name: stats[name] for name in ('results', 'postings')})}")
+        if "profile" in stats:
+            for query_type, type_stats in stats["profile"]["types"].items():
+                print(f"  {query_type}: {type_stats['count']} queries, p50 <= {type_stats['p50_ms']} ms, "
+                      f"p99 <= {type_stats['p99_ms']} ms")
+            print(f"  time per phase (ms): {json.dumps(stats['profile']['phases_ms'])}")
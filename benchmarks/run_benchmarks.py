@@ -0,0 +1,246 @@
+"""
+Benchmark suite that runs offline: generates a synthetic dump (see benchmarks/generate_dump.py), indexes it with
+build_index.py and measures indexing throughput, index size on disk, search startup time, the latency of
+one word, free text and field queries (eager and --lazy, result cache disabled) and the throughput of
+batch evaluation of all of them (search.py --batch, if numpy is installed).
+Text postings can't be memory-mapped, so --postings-format text is only measured eager.
+Results are saved as JSON along with the commit they were measured on, --compare prints the change of every
+metric against the results of another run.
+
+usage: python -m benchmarks.run_benchmarks [--pages 5000] [--seed 1] [--dump path_to_dump] [--work-dir bench]
+           [--workers 1] [--postings-format varint] [--positions] [--no-of-queries 100] [--repeat 3]
+           [--output path_to_results.json] [--compare path_to_previous_results.json] [--threshold 0.05]
+"""
+import argparse
+import datetime
+import json
+import os
+import platform
+import shutil
+import subprocess
+import sys
+import time
+
+from benchmarks.generate_dump import generate_dump, generate_queries
+from search import Search, ONE_WORD_QUERY, FREE_TEXT_QUERY, FIELD_QUERY
+from src import constants
+from src.batch import BatchSearch
+from src.latency import LatencyWindow
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# metric => whether higher is better, for --compare
+COMPARED_METRICS = {
+    "indexing.pages_per_sec": True,
+    "indexing.tokens_per_sec": True,
+    "indexing.peak_rss": False,
+    "index_size.total_bytes": False,
+    "startup.eager_s": False,
+    "startup.lazy_s": False,
+}
+for _mode in ("eager", "lazy"):
+    for _query_type in ("one_word", "free_text", "field"):
+        COMPARED_METRICS[f"queries.{_mode}.{_query_type}.p50_ms"] = False
+        COMPARED_METRICS[f"queries.{_mode}.{_query_type}.p99_ms"] = False
+    COMPARED_METRICS[f"queries.{_mode}.batch.per_sec"] = True
+
+
+def get_commit():
+    """Returns (commit hash, whether the work tree has uncommitted changes), (None, None) outside a git repo."""
+    try:
+        commit = subprocess.check_output(["git", "rev-parse", "HEAD"], cwd=REPO_DIR, stderr=subprocess.DEVNULL)
+        status = subprocess.check_output(["git", "status", "--porcelain", "--untracked-files=no"], cwd=REPO_DIR)
+    except (OSError, subprocess.CalledProcessError):
+        return None, None
+    return commit.decode().strip(), bool(status.strip())
+
+
+def build_index(dump_path, index_dir, args):
+    """Runs build_index.py in a process of its own, returns its wall clock time and build profile."""
+    if os.path.exists(index_dir):
+        shutil.rmtree(index_dir)
+    os.makedirs(index_dir)
+    profile_path = f"{index_dir}/{constants.BUILD_PROFILE_FILE_NAME}"
+    command = [sys.executable, "build_index.py", dump_path, index_dir, "--workers", str(args.workers),
+               "--postings-format", args.postings_format, "--profile-report", profile_path]
+    if args.positions:
+        command.append("--positions")
+    start = time.perf_counter()
+    subprocess.run(command, cwd=REPO_DIR, check=True, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    elapsed = time.perf_counter() - start
+    with open(profile_path, "r") as fp:
+        return elapsed, json.load(fp)
+
+
+def get_index_size(index_dir):
+    """Returns the total no. of bytes of the files of the index and the no. of bytes of each file."""
+    files = {}
+    for dir_path, _, file_names in os.walk(index_dir):
+        for file_name in file_names:
+            if file_name != constants.BUILD_PROFILE_FILE_NAME:
+                path = os.path.join(dir_path, file_name)
+                files[os.path.relpath(path, index_dir)] = os.path.getsize(path)
+    return {"total_bytes": sum(files.values()), "files": dict(sorted(files.items()))}
+
+
+def load_search(index_dir, lazy, repeat):
+    """Returns a loaded Search and the best time (out of repeat) taken to load it."""
+    best = None
+    for _ in range(repeat):
+        search = Search(lazy=lazy, result_cache_size=0)
+        start = time.perf_counter()
+        search.load(index_dir)
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return search, best
+
+
+def time_queries(search, queries, repeat):
+    """Latency stats of queries, each one evaluated repeat times (titles of the results included)."""
+    latencies = LatencyWindow(size=None)  # keep every sample
+    for _ in range(repeat):
+        for query in queries:
+            start = time.perf_counter()
+            search.answer(query)
+            latencies.record(time.perf_counter() - start)
+    stats = latencies.stats()
+    stats["per_sec"] = 1000 / stats["mean_ms"] if stats["mean_ms"] else 0.0  # not since the Search was created
+    return stats
+
+
+def time_batch(search, queries, repeat):
+    """Best throughput (out of repeat) of the batch evaluation of queries, titles of the results included."""
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        BatchSearch(search).answer(queries)
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return {"queries": len(queries), "per_sec": len(queries) / best if best else 0.0}
+
+
+def run(args):
+    os.makedirs(args.work_dir, exist_ok=True)
+    results = {"params": vars(args)}
+    results["commit"], results["dirty"] = get_commit()
+    results["date"] = datetime.datetime.now().isoformat(timespec="seconds")
+    results["python"] = platform.python_version()
+    results["platform"] = platform.platform()
+    results["cpus"] = os.cpu_count()
+
+    dump_path = os.path.abspath(args.dump or f"{args.work_dir}/synthetic-{args.pages}-{args.seed}.xml")
+    if args.dump:
+        queries = None
+    else:
+        start = time.perf_counter()
+        vocabulary = generate_dump(dump_path, args.pages, args.vocabulary, args.zipf, args.seed)
+        queries = generate_queries(vocabulary, args.no_of_queries, args.zipf, args.seed)
+        results["dump"] = {"generate_s": time.perf_counter() - start}
+    results.setdefault("dump", {})["bytes"] = os.path.getsize(dump_path)
+
+    index_dir = os.path.abspath(f"{args.work_dir}/index")
+    elapsed, profile = build_index(dump_path, index_dir, args)
+    results["indexing"] = {
+        "wall_s": elapsed,
+        "pages": profile["counters"].get("pages", 0),
+        "pages_per_sec": profile["rates"].get("pages_per_sec", 0.0),
+        "tokens_per_sec": profile["rates"].get("tokens_per_sec", 0.0),
+        "dump_bytes_per_sec": results["dump"]["bytes"] / elapsed,
+        "peak_rss": profile["peak_rss"],
+        "stages": profile["stages"],
+    }
+    print(f"indexed {results['indexing']['pages']} pages in {elapsed:.2f}s "
+          f"({results['indexing']['pages_per_sec']:.0f} pages/s)")
+    results["index_size"] = get_index_size(index_dir)
+    print(f"index size: {results['index_size']['total_bytes'] / (1 << 20):.2f} MB")
+
+    if queries is None:
+        with open(args.queryfile, "r") as fp:
+            lines = [line.rstrip("\n") for line in fp if line.strip()]
+        queries = {"one_word": [], "free_text": [], "field": []}
+        for query in lines:
+            query_type = Search.get_query_type(query)
+            if query_type == ONE_WORD_QUERY:
+                queries["one_word"].append(query)
+            elif query_type == FREE_TEXT_QUERY:
+                queries["free_text"].append(query)
+            elif query_type == FIELD_QUERY:
+                queries["field"].append(query)
+
+    results["startup"] = {}
+    results["queries"] = {}
+    modes = [("eager", False), ("lazy", True)]
+    if args.postings_format == "text":
+        modes.pop()  # text postings can't be memory-mapped, search always loads them
+        print("lazy mode skipped: text postings")
+    for mode, lazy in modes:
+        search, results["startup"][f"{mode}_s"] = load_search(index_dir, lazy, args.repeat)
+        print(f"{mode} startup: {1000 * results['startup'][f'{mode}_s']:.1f}ms")
+        results["queries"][mode] = {}
+        for query_type, type_queries in queries.items():
+            if type_queries:
+                stats = time_queries(search, type_queries, args.repeat)
+                results["queries"][mode][query_type] = stats
+                print(f"{mode} {query_type} queries (ms): p50 {stats['p50_ms']:.2f}, p99 {stats['p99_ms']:.2f}, "
+                      f"mean {stats['mean_ms']:.2f}")
+        if BatchSearch.available():
+            stats = time_batch(search, [query for type_queries in queries.values() for query in type_queries],
+                               args.repeat)
+            results["queries"][mode]["batch"] = stats
+            print(f"{mode} batch of {stats['queries']} queries: {stats['per_sec']:.1f} queries/s")
+    return results
+
+
+def get_metric(results, name):
+    for key in name.split("."):
+        if not isinstance(results, dict) or key not in results:
+            return None
+        results = results[key]
+    return results
+
+
+def compare(previous, results, threshold=0.05):
+    """
+    Prints every metric of COMPARED_METRICS in the previous and the current results,
+    flagging those that got worse by more than threshold (relative change).
+    """
+    print(f"\nchange since {previous.get('commit') or 'unknown commit'} ({previous.get('date')}):")
+    for name, higher_is_better in COMPARED_METRICS.items():
+        old, new = get_metric(previous, name), get_metric(results, name)
+        if not old or new is None:
+            continue
+        change = (new - old) / old
+        worse = -change > threshold if higher_is_better else change > threshold
+        print(f"  {name:<32} {old:>14.3f} -> {new:>14.3f}  {100 * change:+7.1f}%{'  (worse)' if worse else ''}")
+
+
+if __name__ == "__main__":
+    argparser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    argparser.add_argument("--pages", type=int, default=5000, help="no. of pages of the synthetic dump")
+    argparser.add_argument("--vocabulary", type=int, default=50000)
+    argparser.add_argument("--zipf", type=float, default=1.1)
+    argparser.add_argument("--seed", type=int, default=1)
+    argparser.add_argument("--dump", default=None, help="benchmark this dump instead of a synthetic one")
+    argparser.add_argument("--queryfile", default=constants.QUERY_FILE, help="queries of --dump")
+    argparser.add_argument("--work-dir", default="bench", help="where the dump and the index are written")
+    argparser.add_argument("--workers", type=int, default=1)
+    argparser.add_argument("--postings-format", choices=["varint", "gamma", "text"], default=constants.POSTINGS_FORMAT)
+    argparser.add_argument("--positions", action="store_true")
+    argparser.add_argument("--no-of-queries", type=int, default=100, help="no. of queries of each type")
+    argparser.add_argument("--repeat", type=int, default=3, help="no. of times each query is evaluated")
+    argparser.add_argument("--output", default=None,
+                           help="where to save the results (default: bench-<commit>.json in --work-dir)")
+    argparser.add_argument("--compare", default=None, help="results of a previous run to compare with")
+    argparser.add_argument("--threshold", type=float, default=0.05,
+                           help="relative change beyond which --compare flags a metric as worse")
+    args = argparser.parse_args()
+
+    results = run(args)
+    output = args.output or f"{args.work_dir}/bench-{(results['commit'] or 'unknown')[:10]}.json"
+    with open(output, "w") as fp:
+        json.dump(results, fp, indent=2)
+    print(f"results written to {output}")
+
+    if args.compare:
+        with open(args.compare, "r") as fp:
+            compare(json.load(fp), results, args.threshold)
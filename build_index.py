@@ -1,21 +1,27 @@
+import argparse
 import logging
+import os
+import subprocess
 import sys
 import time
-from collections import defaultdict
 
 from src import constants
+from src.buildprofile import BuildProfile
 from src.helpers import Helpers
+from src.dumps import iter_dump_pages
 from src.indexer import Indexer
 from src.parser import XMLParser
+from src.pipeline import index_parallel
+from src.stemmer import CachedStemmer
+from src.postings import postings_writer, TEXT
+from src.segments import create_segment, publish_segment, merge_policy
+from src.termdict import write_term_dictionary, write_term_termid_map
+from src.titles import TitleStoreWriter
+from src.tokenizer import Tokenizer
 
 logging.basicConfig(format='%(levelname)s: %(filename)s-%(funcName)s()-%(message)s',
                     level=logging.INFO)  # STOPSHIP
 
-logging.debug("sys.argv %s", sys.argv)
-
-DUMP_PATH = sys.argv[1] if len(sys.argv) > 1 else constants.DEFAULT_DUMP_PATH
-INDEX_DIR = sys.argv[2] if len(sys.argv) > 2 else constants.DEFAULT_INDEX_DIR
-
 # TODO: Steps[Build][Integrate]
 # 1. Parsing[][]
 # 2. Tokenizing[][]
@@ -24,32 +30,110 @@ INDEX_DIR = sys.argv[2] if len(sys.argv) > 2 else constants.DEFAULT_INDEX_DIR
 # 5. Stemming[][]
 # 6. Inverted Index Creation[][]
 # 7. Field queries
-x_start = time.process_time()
+if __name__ == "__main__":  # guard needed so that worker processes do not re-run the build
+    logging.debug("sys.argv %s", sys.argv)
+
+    argparser = argparse.ArgumentParser(description="Build the inverted index of a wikipedia dump")
+    argparser.add_argument("dump_path", nargs="?", default=constants.DEFAULT_DUMP_PATH)
+    argparser.add_argument("index_dir", nargs="?", default=constants.DEFAULT_INDEX_DIR)
+    argparser.add_argument("--workers", type=int, default=1,
+                           help="no. of processes that tokenize pages in parallel (default: 1, no parallelism)")
+    argparser.add_argument("--stem-cache-size", type=int, default=constants.STEM_CACHE_SIZE,
+                           help="max. no. of words whose stems are memoized")
+    argparser.add_argument("--stem-table", default=None,
+                           help=f"preload stems from a {constants.STEM_TABLE_FILE_NAME} saved with a previous index")
+    argparser.add_argument("--multistream-index", default=None,
+                           help="index of a multistream .bz2 dump, its streams are then decompressed by --workers "
+                                "processes (default: the *-multistream-index.txt.bz2 next to the dump, if any)")
+    argparser.add_argument("--incremental", action="store_true",
+                           help="index the (delta) dump into a new segment of the existing index in index_dir, "
+                                "replacing the older versions of its pages")
+    argparser.add_argument("--deleted-ids", default=None,
+                           help="with --incremental, file of page ids (one per line) to delete from the index")
+    argparser.add_argument("--no-merge", action="store_true",
+                           help="with --incremental, don't merge small segments after adding the new one")
+    argparser.add_argument("--merge-only", action="store_true",
+                           help="only merge the small segments of index_dir (dump_path is ignored), which is what "
+                                "--incremental starts in the background")
+    argparser.add_argument("--postings-format", choices=["varint", "gamma", "text"], default=constants.POSTINGS_FORMAT,
+                           help="compression of the postings file, text keeps the human readable format for debugging")
+    argparser.add_argument("--positions", action="store_true",
+                           help="also index the positions of the terms, needed for phrase and NEAR/k queries "
+                                "(not with --postings-format text)")
+    argparser.add_argument("--profile-report", default=None,
+                           help="where to write the JSON report of the time, memory and counts of every stage "
+                                f"of the build (default: {constants.BUILD_PROFILE_FILE_NAME} in index_dir)")
+    args = argparser.parse_args()
+    if args.positions and args.postings_format == TEXT:
+        argparser.error("--positions needs a binary --postings-format")
+
+    DUMP_PATH = args.dump_path
+    INDEX_DIR = args.index_dir
+
+    if args.merge_only:
+        merge_policy(INDEX_DIR, args.postings_format)
+        sys.exit()
+
+    x_start = time.time()  # wall clock, process_time() would miss the time spent in worker processes
+    BuildProfile.start()
+
+    Helpers.load_stopwords(constants.STOPWORDS_FILE_PATH)
+    logging.debug("AppGlobals.stopwords", Helpers.stopwords)
+    Tokenizer.positional = args.positions
+    Helpers.stemmer = CachedStemmer(args.stem_cache_size)
+    if args.stem_table:
+        Helpers.stemmer.load_table(args.stem_table)
 
-Helpers.load_stopwords(constants.STOPWORDS_FILE_PATH)
-logging.debug("AppGlobals.stopwords", Helpers.stopwords)
+    # a full build writes the index folder itself, an incremental one a new segment folder inside it
+    segment_name, BUILD_DIR = create_segment(INDEX_DIR) if args.incremental else (None, INDEX_DIR)
+    stem_table_path = f"{INDEX_DIR}/{constants.STEM_TABLE_FILE_NAME}"
+    if args.incremental and os.path.exists(stem_table_path):
+        Helpers.stemmer.load_table(stem_table_path)
 
-xmlparser = XMLParser()
-xmlparser.parse(DUMP_PATH)
+    Indexer.index_dir = BUILD_DIR  # SPIMI blocks are written to the index folder
+    Indexer.title_store = TitleStoreWriter(BUILD_DIR)
 
-# TODO: verify whether python GC bug still exists: https://stackoverflow.com/a/2480015/5463404
-# print("termid_docid_list", Indexer.termid_docid_list)
-Indexer.termid_docid_list.sort()
-# print("termid_docid_list sorted", Indexer.termid_docid_list)
-postings_list = defaultdict(list)
-for termid, docid in Indexer.termid_docid_list:
-    postings_list[termid].append(docid)
+    # .bz2 and .gz dumps are read without decompressing them to disk first
+    pages = BuildProfile.timed_iter("parse", iter_dump_pages(DUMP_PATH, args.workers, args.multistream_index))
+    if args.workers > 1:
+        index_parallel(pages, args.workers, stem_table_path=args.stem_table)
+    else:
+        xmlparser = XMLParser()
+        xmlparser.parse(pages)
 
-with open(f"{INDEX_DIR}/{constants.POSTINGS_FILE_NAME}", "w") as fp:  # format=> termid:docid1,docid2,docid3....\n
-    for termid in postings_list:
-        print(f"{termid}{constants.TERM_POSTINGS_SEP}{constants.DOCIDS_SEP.join(postings_list[termid])}", file=fp)
+    with BuildProfile.stage("titles"):
+        Indexer.title_store.close()  # merge_blocks() reads the field lengths of the documents from the title store
+        Indexer.write_stats(BUILD_DIR)
+    with BuildProfile.stage("merge_blocks"):
+        with postings_writer(BUILD_DIR, args.postings_format, args.positions) as writer:
+            Indexer.merge_blocks(writer)
+    with BuildProfile.stage("term_dictionary"):
+        if args.postings_format != TEXT:
+            write_term_dictionary(BUILD_DIR, Helpers.term_termid_map)
+        else:
+            write_term_termid_map(BUILD_DIR, Helpers.term_termid_map)
+    with BuildProfile.stage("stem_table"):
+        Helpers.stemmer.save_table(stem_table_path)
+    logging.info("Stem cache: %s", Helpers.stemmer.stats())
+    BuildProfile.write_report(args.profile_report or f"{INDEX_DIR}/{constants.BUILD_PROFILE_FILE_NAME}", BUILD_DIR,
+                              {"dump": DUMP_PATH, "workers": args.workers, "postings_format": args.postings_format,
+                               "positions": args.positions, "stem_cache": Helpers.stemmer.stats()})
 
-with open(f"{INDEX_DIR}/{constants.TERM_ID_MAPPING_FILE_NAME}", "w") as fp:
-    for term in Helpers.term_termid_map:
-        print(f"{term}:{Helpers.term_termid_map[term]}", file=fp)
+    if args.incremental:
+        deleted_ids = []
+        if args.deleted_ids:
+            with open(args.deleted_ids, "r") as fp:
+                deleted_ids = [line.strip() for line in fp if line.strip()]
+        publish_segment(INDEX_DIR, segment_name, deleted_ids)  # searchable from here on
 
-with open(f"{INDEX_DIR}/{constants.DOC_ID_TITLE_MAPPING_FILE_NAME}", "w") as fp:
-    fp.write(str(Helpers.docid_docname_map))
+        if not args.no_merge:
+            # merging can take a while, it runs in a detached process that outlives this one (see src/segments.py)
+            merge_log_path = f"{INDEX_DIR}/{constants.MERGE_LOG_FILE_NAME}"
+            with open(merge_log_path, "a") as merge_log:
+                subprocess.Popen([sys.executable, os.path.abspath(__file__), DUMP_PATH, INDEX_DIR, "--merge-only",
+                                  "--postings-format", args.postings_format],
+                                 stdin=subprocess.DEVNULL, stdout=merge_log, stderr=merge_log, start_new_session=True)
+            logging.info("Merging segments in the background, see %s", merge_log_path)
 
-x_end = time.process_time()
-print("Indexed in ", x_end - x_start)
+    x_end = time.time()
+    print("Indexed in ", x_end - x_start)
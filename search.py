@@ -1,17 +1,31 @@
 import logging as log
+import os
 import re
+import time
+from collections import defaultdict, Counter
 
 from src import constants
+from src.batch import BatchSearch
+from src.compression import POPCOUNT
 from src.constants import STOPWORDS_FILE_PATH, FIELD_QUERY_OPERATOR
+from src.constants import ONE_WORD_QUERY, FREE_TEXT_QUERY, FIELD_QUERY, PROXIMITY_QUERY
+from src.cache import LRUCache, PostingsCache
 from src.helpers import Helpers
-from src.stemmer import PorterStemmer
+from src.positions import positional_match
+from src.queryprofile import QueryProfiler, SLOW_QUERY_MS
+from src.ranking import bm25_idf, bm25_tf, UPPER_BOUND_SLACK
+from src.segments import Segment, read_segment_names
+from src.topk import UnionCursor, intersect, wand
 
 log.basicConfig(format='%(levelname)s: %(filename)s-%(funcName)s()-%(message)s',
                 level=log.INFO)  # STOPSHIP
 
-ONE_WORD_QUERY = "ONE_WORD_QUERY"
-FREE_TEXT_QUERY = "FREE_TEXT_QUERY"
-FIELD_QUERY = "FIELD_QUERY"
+# Phrase and proximity queries (need an index built with --positions):
+#  "mahatma gandhi" matches the documents having the terms next to each other in a field,
+#  salt NEAR/5 march those having them at most 5 terms apart in a field.
+#  Operators chain ("mahatma gandhi" NEAR/10 salt) and whitespace separated clauses must all match.
+proximity_token_pattern = re.compile(r'"[^"]*"|NEAR/\d+|\S+')
+near_operator_pattern = re.compile(r"NEAR/(\d+)")
 
 field_type_map = {
     "title": "T",
@@ -24,146 +38,392 @@ field_type_map = {
 
 
 class Search:
-    def __init__(self):
-        self.index = {}
-        self.term_termid_map = {}
-        self.docid_title_map = {}
-
-    def load_docid_title(self, path):
-        with open(f"{path}/{constants.DOC_ID_TITLE_MAPPING_FILE_NAME}", 'r') as fp:
-            self.docid_title_map = eval(fp.read())
-
-    def load_term_termid(self, path):
-        # with open(f"{path}/{constants.TERM_ID_MAPPING_FILE_NAME}", 'r') as fp:
-        #     self.term_termid_map = eval(fp.read())
-
-        with open(f"{path}/{constants.TERM_ID_MAPPING_FILE_NAME}", 'r') as fp:
-            for line in fp:
-                term, termid = line.split(":")
-                self.term_termid_map[term] = int(termid)
-
-    def load_index(self, path):
-        with open(f"{path}/{constants.POSTINGS_FILE_NAME}") as fp:
-            for line in fp:
-                line = line.strip()
-                termid, postings = line.split(constants.TERM_POSTINGS_SEP)
-                postings = [int(x) for x in postings.split(constants.DOCIDS_SEP)]
-                self.index[int(termid)] = postings
+    def __init__(self, lazy=False, field_weights=None, top_k=10, pruning=True,
+                 result_cache_size=constants.RESULT_CACHE_SIZE, postings_cache_budget=constants.POSTINGS_CACHE_BUDGET):
+        # lazy => posting lists are decoded on demand from the memory-mapped postings file
+        self.lazy = lazy
+        self.field_weights = field_weights or constants.FIELD_WEIGHTS
+        self.top_k = top_k  # no. of results returned per query
+        self.pruning = pruning  # use WAND instead of scoring every posting
+        self.scored_postings = 0  # no. of postings scored so far, to measure the effect of pruning
+        self.segments = []  # oldest first, see src/segments.py
+        # statistics of the live documents of all segments
+        self.no_of_docs = 0
+        self.avg_field_lengths = {}
+        # no. of documents of all segments, dead ones included like in the document frequencies of the terms
+        self.no_of_indexed_docs = 0
+        # normalized query -> results, and the decoded posting lists of hot terms (lazy only), see src/cache.py
+        # both hold what was computed from the segments loaded last, load() empties them
+        self.result_cache = LRUCache(result_cache_size)
+        self.postings_cache = PostingsCache(postings_cache_budget)
 
     def get_terms(self, line):
         line = line.lower()
         line = re.sub(r'[^a-z0-9 ]', ' ', line)  # put spaces instead of non-alphanumeric characters
         line = line.split()
         line = [x for x in line if x not in Helpers.stopwords]
-        stemmer = PorterStemmer()
-        line = [stemmer.stem(word, 0, len(word) - 1) for word in line]
+        line = [Helpers.stemmer.stem(word) for word in line]
         return line
 
-    def search_index(self, path, queryfile, outputfile):
+    def load(self, path):
         Helpers.load_stopwords(STOPWORDS_FILE_PATH)
-        self.load_index(path)
-        self.load_term_termid(path)
-        self.load_docid_title(path)
+        if os.path.exists(f"{path}/{constants.STEM_TABLE_FILE_NAME}"):
+            Helpers.stemmer.load_table(f"{path}/{constants.STEM_TABLE_FILE_NAME}")
+
+        self.segments = [Segment(f"{path}/{name}", self.lazy) for name in read_segment_names(path)]
+        self.result_cache.clear()
+        self.postings_cache.clear()
+        for segment in self.segments:
+            segment.load()
+            if self.lazy:
+                segment.postings_cache = self.postings_cache
+        self.load_stats()
+
+    def load_stats(self):
+        """BM25 statistics over the live documents of every segment, and the no. of documents idf is computed with."""
+        self.no_of_docs = sum(segment.no_of_live_docs for segment in self.segments)
+        self.no_of_indexed_docs = sum(segment.no_of_docs for segment in self.segments)
+        self.avg_field_lengths = {
+            field: sum(segment.live_field_lengths[field] for segment in self.segments) / self.no_of_docs
+            if self.no_of_docs else 0 for field in constants.FIELDS}
+
+    def answer(self, query):
+        """Returns the titles of the best self.top_k results of query."""
+        return self.get_doc_names_from_ids(self.search(query))
+
+    def search(self, query):
+        """Returns the docids of the best self.top_k results of query."""
+        key = self.normalize_query(query)
+        results = self.result_cache.get(key)
+        if results is None:
+            results = self.evaluate(query)
+            self.result_cache.put(key, results)
+        return list(results)
+
+    def evaluate(self, query):
+        """Returns the docids of the best self.top_k results of query, without looking at the result cache."""
+        query_type = self.get_query_type(query)
+        if query_type == ONE_WORD_QUERY:
+            results = self.one_word_query(query)
+        elif query_type == FREE_TEXT_QUERY:
+            results = self.free_text_query(query)
+        elif query_type == PROXIMITY_QUERY:
+            results = self.proximity_query(query)
+        else:
+            results = self.field_query(query)
+        return results[:self.top_k]
+
+    def normalize_query(self, query):
+        """
+        Key of query in the result cache: its type and terms (after get_terms) along with their fields
+        or operators, so that queries differing only in case, punctuation, stopwords or inflections share results.
+        """
+        query_type = self.get_query_type(query)
+        if query_type == PROXIMITY_QUERY:
+            return query_type, tuple((tuple(terms), tuple(windows))
+                                     for terms, windows in self.parse_proximity_query(query))
+        if query_type == FIELD_QUERY:
+            return query_type, tuple((field, tuple(terms)) for field, terms in self.parse_field_query(query))
+        # a one word query is a free text query of one term
+        return FREE_TEXT_QUERY, tuple(term for term in self.get_terms(query) if not term.isspace())
+
+    def cache_stats(self):
+        """Hit rate, size and evictions of the result and postings caches so far."""
+        return {"results": self.result_cache.stats(), "postings": self.postings_cache.stats()}
+
+    def search_index(self, path, queryfile, outputfile, batch=False):
+        """Answers the queries of queryfile, one by one or (batch) all at once with BatchSearch."""
+        self.load(path)
 
-        log.debug("Index", self.index)
         queryfp = open(queryfile, "r")
         outputfp = open(outputfile, "w")
 
+        start = time.perf_counter()
+        if batch:
+            queries = list(queryfp)
+            answers = zip(queries, BatchSearch(self).answer(queries))
+        else:
+            answers = ((query, self.answer(query)) for query in queryfp)
+        no_of_queries = 0
         # Loop over each query
-        for query in queryfp:
-            results = []
-            query_type = self.get_query_type(query)
-            if query_type == ONE_WORD_QUERY:
-                results = self.one_word_query(query)
-            elif query_type == FREE_TEXT_QUERY:
-                results = self.free_text_query(query)
-            elif query_type == FIELD_QUERY:
-                results = self.field_query(query)
-
-            results = list(results)
+        for query, results in answers:
+            no_of_queries += 1
             log.info("Results for query: %s", query.rstrip())
-            for result in results[:10]:  # print only 10 results
+            for result in results:
                 log.info(result)
                 print(result, file=outputfp)
             print(file=outputfp)
             log.info("")
+        elapsed = time.perf_counter() - start
 
         queryfp.close()
         outputfp.close()
+        log.info("Answered %d queries in %.3fs (%.1f queries/s)", no_of_queries, elapsed,
+                 no_of_queries / elapsed if elapsed else 0.0)
+        log.info("Caches: %s", self.cache_stats())
 
     def one_word_query(self, query):
         terms = self.get_terms(query)
         if len(terms) == 0:
-            return
+            return []
         elif len(terms) > 1:
             return self.free_text_query(query)
 
         # else terms contains 1 term
         term = terms[0]
-        docids = set()
-        # import ipdb
-        # ipdb.set_trace()
-
-        docids |= set(self.get_postings(f"{term}{constants.FIELD_SEP}T") or [])  # Search in title text
-        docids |= set(self.get_postings(f"{term}{constants.FIELD_SEP}B") or [])  # Search in title text
-        docids |= set(self.get_postings(f"{term}{constants.FIELD_SEP}I") or [])  # Search in title text
-        # TODO: add search in other fields
-
-        return self.get_doc_names_from_ids(docids)
+        return self.top_k_query([(term, field) for field in constants.FIELDS])
 
     def free_text_query(self, query):
         terms = self.get_terms(query)
-        docids = set()
-        for term in terms:
-            if not term.isspace():
-                docids |= set(self.get_postings(f"{term}{constants.FIELD_SEP}T") or [])  # Search in title text
-                docids |= set(self.get_postings(f"{term}{constants.FIELD_SEP}B") or [])  # Search in title text
-                docids |= set(self.get_postings(f"{term}{constants.FIELD_SEP}I") or [])  # Search in title text
-                docids |= set(self.get_postings(f"{term}{constants.FIELD_SEP}C") or [])  # Search in title text
-                docids |= set(self.get_postings(f"{term}{constants.FIELD_SEP}R") or [])  # Search in title text
-                docids |= set(self.get_postings(f"{term}{constants.FIELD_SEP}L") or [])  # Search in title text
-        return self.get_doc_names_from_ids(docids)
+        return self.top_k_query([(term, field) for term in terms if not term.isspace() for field in constants.FIELDS])
 
     def field_query(self, field_query):
         # TODO: decide OR vs AND
         # title:gandhi body:arjun infobox:gandhi category:gandhi ref:gandhi
-        docids = set()
-        field_terms = field_query.split()  # will now contain ['t:Sachin', 'b:Tendulkar', ...]
+        clauses = self.parse_field_query(field_query)  # will now contain [('T', ['sachin']), ('B', ...), ...]
 
         if FIELD_QUERY_OPERATOR == "OR":
-            for extended_term in field_terms:
-                ft, query = extended_term.split(":")
-                terms = self.get_terms(query)
-                for term in terms:
-                    if not term.isspace():
-                        docids |= set(
-                            self.get_postings(f"{term}{constants.FIELD_SEP}{field_type_map[ft].upper()}") or [])
+            return self.top_k_query([(term, field) for field, terms in clauses for term in terms])
 
         else:  # use AND instead of OR
-            # Logic: fill docids of first field type,
-            # then perform intersection with subsequent field types
-            ft, query = field_terms[0].split(":")
-            terms = self.get_terms(query)
+            # Logic: OR the terms of first field type into a single operand,
+            # then intersect it with the postings of every term of subsequent field types.
+            # Segments hold disjoint sets of live documents, so each one is intersected on its own.
+            field, terms = clauses[0]
+            # Perform OR
+            first_cursors = defaultdict(list)  # segment no. -> cursors
             for term in terms:
-                if not term.isspace():
-                    # Perform OR
-                    docids |= set(
-                        self.get_postings(f"{term}{constants.FIELD_SEP}{field_type_map[ft].upper()}") or [])
-
-            for extended_term in field_terms[1:]:
-                ft, query = extended_term.split(":")
-                terms = self.get_terms(query)
+                for segment_no, cursor in self.get_cursors(term, {field: 1}).items():
+                    first_cursors[segment_no].append(cursor)
+            if not first_cursors:
+                return []
+
+            other_cursors = []  # one {segment no.: cursor} per term
+            for field, terms in clauses[1:]:
                 for term in terms:
-                    if not term.isspace():
-                        # Perform AND (intersection)
-                        docids.intersection_update(set(
-                            self.get_postings(f"{term}{constants.FIELD_SEP}{field_type_map[ft].upper()}") or []))
+                    # Perform AND (intersection)
+                    cursors = self.get_cursors(term, {field: 1})
+                    if not cursors:
+                        return []
+                    other_cursors.append(cursors)
 
-        return self.get_doc_names_from_ids(docids)
+            results = []
+            for segment_no, cursors in first_cursors.items():
+                if any(segment_no not in term_cursors for term_cursors in other_cursors):
+                    continue  # a term has no postings in this segment
+                cursors = [UnionCursor(cursors) if len(cursors) > 1 else cursors[0]]
+                cursors += [term_cursors[segment_no] for term_cursors in other_cursors]
+                results += intersect(cursors, self.top_k, self.segments[segment_no].deleted, scored=True)
+            return self.merge_results(results)
+
+    def parse_field_query(self, query):
+        """
+        Returns the (field, terms) of every field:terms part of a field query,
+        raises ValueError if a part is not one of those.
+        """
+        clauses = []
+        for field_term in query.split():
+            ft, sep, field_query = field_term.partition(":")
+            if not sep or ft not in field_type_map:
+                raise ValueError(f"{field_term!r} is not field:terms with field one of {', '.join(field_type_map)}")
+            clauses.append((field_type_map[ft].upper(), [term for term in self.get_terms(field_query)
+                                                         if not term.isspace()]))
+        return clauses
+
+    def parse_proximity_query(self, query):
+        """
+        Returns the clauses of a phrase / proximity query, as (terms, windows) pairs
+        with windows[i] the allowed (min., max.) position of terms[i + 1] minus that of terms[i].
+        """
+        clauses = []
+        window = None  # of a NEAR/k operator waiting for its right operand
+        for token in proximity_token_pattern.findall(query):
+            near = near_operator_pattern.fullmatch(token)
+            if near:
+                window = (-int(near.group(1)), int(near.group(1)))
+                continue
+            # the terms of a phrase, or of a word split by punctuation, are next to each other
+            terms = self.get_terms(token.strip('"'))
+            if not terms:
+                continue  # only stopwords
+            windows = [(1, 1)] * (len(terms) - 1)
+            if window and clauses:
+                clauses[-1][0].extend(terms)
+                clauses[-1][1].extend([window] + windows)
+            else:
+                clauses.append((terms, windows))
+            window = None
+        return clauses
+
+    def proximity_query(self, query):
+        """
+        Returns the best self.top_k docids matching every clause of a phrase / proximity query,
+        ranked by the BM25 score of their terms in every field.
+        Documents are intersected first, positions are only read for the documents having every term.
+        """
+        clauses = self.parse_proximity_query(query)
+        if not clauses:
+            return []
+        all_fields = dict.fromkeys(constants.FIELDS, 1)
+        term_cursors = {}  # term -> {segment no.: cursor}
+        for terms, _ in clauses:
+            for term in terms:
+                if term not in term_cursors:
+                    term_cursors[term] = self.get_cursors(term, all_fields)
+
+        results = []
+        for segment_no, segment in enumerate(self.segments):
+            if segment.positions is None:
+                log.warning("%s has no positional index, rebuild it with --positions for phrase queries",
+                            segment.path)
+                continue
+            if any(segment_no not in cursors for cursors in term_cursors.values()):
+                continue  # a term has no postings in this segment
+            cursors = {term: term_cursors[term][segment_no] for term in term_cursors}
+
+            def accept():
+                positions = {term: cursor.current_positions() for term, cursor in cursors.items()}
+                return all(self.match_clause(positions, terms, windows) for terms, windows in clauses)
+
+            results += intersect(list(cursors.values()), self.top_k, segment.deleted, scored=True, accept=accept)
+        return self.merge_results(results)
+
+    @staticmethod
+    def match_clause(positions, terms, windows):
+        """Whether the terms of a clause are in the same field at positions allowed by windows."""
+        fields = set.intersection(*[set(positions[term]) for term in terms])
+        return any(positional_match([positions[term][field_no] for term in terms], windows) for field_no in fields)
+
+    def top_k_query(self, term_fields):
+        """Returns the best self.top_k docids for the OR of the (term, field) pairs in term_fields."""
+        # a term has a single posting list for all its fields, read once however many of its fields are queried
+        term_field_counts = defaultdict(Counter)  # term -> {field: no. of times queried}
+        for term, field in term_fields:
+            term_field_counts[term][field] += 1
+
+        if not self.pruning:
+            scores = defaultdict(float)
+            for term, field_counts in term_field_counts.items():
+                self.score_postings(scores, term, field_counts)
+            return self.rank(scores)[:self.top_k]
+
+        segment_cursors = defaultdict(list)
+        for term, field_counts in term_field_counts.items():
+            for segment_no, cursor in self.get_cursors(term, field_counts).items():
+                segment_cursors[segment_no].append(cursor)
+
+        results = []
+        for segment_no, cursors in segment_cursors.items():
+            results += wand(cursors, self.top_k, self.segments[segment_no].deleted, scored=True)
+        return self.merge_results(results)
+
+    def merge_results(self, results):
+        """The best self.top_k docids of the (score, docid) results of several segments."""
+        results.sort(key=lambda result: (-result[0], result[1]))
+        return [docid for _, docid in results[:self.top_k]]
+
+    @staticmethod
+    def get_field_mask(fields):
+        """Mask of fields for Segment.lookup() and the cursors, None when it holds every field."""
+        if set(constants.FIELDS) <= set(fields):
+            return None
+        mask = 0
+        for field in fields:
+            mask |= 1 << constants.FIELDS.index(field)
+        return mask
+
+    def lookup(self, term, field_mask=None):
+        """
+        Returns [(segment no., entry)] for every segment holding postings of term in the fields of field_mask,
+        see Segment.lookup()
+        """
+        entries = []
+        for segment_no, segment in enumerate(self.segments):
+            entry = segment.lookup(term, field_mask)
+            if entry:
+                entries.append((segment_no, entry))
+        return entries
+
+    def get_weighted_idfs(self, entries, field_counts):
+        """
+        Returns [(field no., weighted idf)] of the fields in field_counts ({field: no. of times queried}).
+        The document frequency counts the dead documents as well, so idf compares it with the no. of documents
+        of every segment dead ones included (counting only the live ones, common terms would get df > N).
+        """
+        weighted_idfs = []
+        for field_no, field in enumerate(constants.FIELDS):
+            df = sum(entry[1][field_no] for _, entry in entries)
+            if field in field_counts and df:
+                weight = self.field_weights.get(field, 0) * field_counts[field]
+                weighted_idfs.append((field_no, weight * bm25_idf(df, self.no_of_indexed_docs)))
+        return weighted_idfs
+
+    def get_cursors(self, term, field_counts):
+        """
+        Returns {segment no.: cursor over the postings of term in the fields of field_counts in that segment}
+        scoring with the sum of the weighted BM25 scores of those fields.
+        """
+        field_mask = self.get_field_mask(field_counts)
+        entries = self.lookup(term, field_mask)
+        weighted_idfs = self.get_weighted_idfs(entries, field_counts)
+
+        cursors = {}
+        for segment_no, entry in entries:
+            segment = self.segments[segment_no]
+            upper_bound = 0
+            for field_no, weighted_idf in weighted_idfs:
+                field = constants.FIELDS[field_no]
+                # max. scores were computed with the average length of the segment, BM25 tf grows with the average
+                # length, by at most the ratio of the averages (see src/ranking.py)
+                scale = max(1.0, (self.avg_field_lengths.get(field) or 1) /
+                            (segment.avg_field_lengths.get(field) or 1))
+                upper_bound += weighted_idf * entry[2][field_no] * scale
+            cursors[segment_no] = segment.get_cursor(entry, upper_bound * UPPER_BOUND_SLACK,
+                                                     self.get_scorer(segment, weighted_idfs), field_mask)
+        return cursors
+
+    def get_scorer(self, segment, weighted_idfs):
+        fields = [(field_no, 1 << field_no, (1 << field_no) - 1, weighted_idf,
+                   self.avg_field_lengths.get(constants.FIELDS[field_no]) or 1)
+                  for field_no, weighted_idf in weighted_idfs]
+
+        def score(docid, mask, tfs):
+            self.scored_postings += 1
+            lengths = segment.get_field_lengths(docid)
+            total = 0.0
+            for field_no, bit, lower_bits, weighted_idf, avg_length in fields:
+                if mask & bit:
+                    # tfs only holds the frequencies of the fields in mask, in field order
+                    total += weighted_idf * bm25_tf(tfs[POPCOUNT[mask & lower_bits]], lengths[field_no], avg_length)
+            return total
+
+        return score
+
+    def score_postings(self, scores, term, field_counts):
+        """
+        Add the BM25 score in the fields of field_counts of every live document in the postings of term
+        to scores, weighted by the weight of each field.
+        """
+        field_mask = self.get_field_mask(field_counts)
+        entries = self.lookup(term, field_mask)
+        weighted_idfs = self.get_weighted_idfs(entries, field_counts)
+        for segment_no, entry in entries:
+            segment = self.segments[segment_no]
+            score = self.get_scorer(segment, weighted_idfs)
+            for docid, mask, tfs in zip(*segment.get_postings(entry)):
+                if docid not in segment.deleted and (field_mask is None or mask & field_mask):
+                    scores[docid] += score(docid, mask, tfs)
+
+    @staticmethod
+    def rank(scores):
+        """docids sorted by decreasing score"""
+        return sorted(scores, key=lambda docid: (-scores[docid], docid))
 
     @staticmethod
     def get_query_type(query):
-        if ":" in query:
+        if '"' in query or near_operator_pattern.search(query):
+            return PROXIMITY_QUERY
+        elif ":" in query:
             return FIELD_QUERY
         elif len(query.split()) > 1:
             return FREE_TEXT_QUERY
@@ -171,21 +431,67 @@ class Search:
             return ONE_WORD_QUERY
 
     def get_doc_names_from_ids(self, docs):
-        docnames = set()
-        for docid in docs:
-            docnames.add(self.docid_title_map.get(str(docid)))
-        return docnames
+        return [self.get_title(docid) for docid in docs]
 
-    def get_postings(self, extended_term):
-        return self.index.get(self.term_termid_map.get(extended_term))
+    def get_title(self, docid):
+        for segment in reversed(self.segments):  # a live document is in exactly one segment
+            title = segment.get_title(docid)
+            if title is not None:
+                return title
+        return None
 
 
 if __name__ == "__main__":
-    srchobj = Search()
-    import sys
-
-    path = sys.argv[1] if len(sys.argv) > 1 else constants.DEFAULT_INDEX_DIR
-    queryfile = sys.argv[2] if len(sys.argv) > 2 else constants.QUERY_FILE
-    outputfile = sys.argv[3] if len(sys.argv) > 3 else constants.OUTPUT_FILE
-
-    srchobj.search_index(path, queryfile, outputfile)
+    import argparse
+
+    argparser = argparse.ArgumentParser(description="Answer the queries in queryfile using the index in path")
+    argparser.add_argument("path", nargs="?", default=constants.DEFAULT_INDEX_DIR)
+    argparser.add_argument("queryfile", nargs="?", default=constants.QUERY_FILE)
+    argparser.add_argument("outputfile", nargs="?", default=constants.OUTPUT_FILE)
+    argparser.add_argument("--field-weights", default=None,
+                           help="BM25 weight of each field, eg. T=3,I=2,B=1,C=1,R=0.5,L=0.5 (fields not given get 0)")
+    argparser.add_argument("--exhaustive", action="store_true",
+                           help="score every posting instead of using WAND dynamic pruning")
+    argparser.add_argument("--lazy", action="store_true",
+                           help="memory-map the postings file and term dictionary, "
+                                "decode only the posting lists a query needs")
+    argparser.add_argument("--result-cache-size", type=int, default=constants.RESULT_CACHE_SIZE,
+                           help="max. no. of queries whose results are cached (0 disables the cache)")
+    argparser.add_argument("--postings-cache-mb", type=float, default=constants.POSTINGS_CACHE_BUDGET / (1 << 20),
+                           help="with --lazy, memory budget of the cache of decoded posting lists of hot terms")
+    argparser.add_argument("--batch", action="store_true",
+                           help="evaluate the whole query file at once with numpy: posting lists are decoded once "
+                                "for every query using them, and scored exhaustively (the result cache is unused)")
+    argparser.add_argument("--profile-queries", action="store_true",
+                           help="time the phases of every query, log latency histograms per query type "
+                                "and the queries slower than --slow-query-ms (not with --batch)")
+    argparser.add_argument("--slow-query-ms", type=float, default=SLOW_QUERY_MS)
+    argparser.add_argument("--slow-query-log", default=None, help="with --profile-queries, also append slow queries "
+                                                                   "to this file, one JSON object per line")
+    argparser.add_argument("--cprofile", default=None,
+                           help="with --profile-queries, run 1 query in --cprofile-every under cProfile "
+                                "and write its statistics to this file")
+    argparser.add_argument("--cprofile-every", type=int, default=1)
+    args = argparser.parse_args()
+    if args.batch and not BatchSearch.available():
+        argparser.error("--batch needs numpy")
+    if args.batch and args.profile_queries:
+        argparser.error("--profile-queries times queries one by one, it can't be used with --batch")
+
+    field_weights = None
+    if args.field_weights:
+        field_weights = {field.upper(): float(weight) for field, weight in
+                         (field_weight.split("=") for field_weight in args.field_weights.split(","))}
+
+    srchobj = Search(lazy=args.lazy, field_weights=field_weights, pruning=not args.exhaustive,
+                     result_cache_size=args.result_cache_size,
+                     postings_cache_budget=int(args.postings_cache_mb * (1 << 20)))
+    profiler = None
+    if args.profile_queries:
+        profiler = QueryProfiler(args.slow_query_ms, args.slow_query_log, args.cprofile_every if args.cprofile else 0)
+        profiler.attach(srchobj)
+    srchobj.search_index(args.path, args.queryfile, args.outputfile, args.batch)
+    if profiler:
+        profiler.log_stats()
+        profiler.dump_cprofile(args.cprofile)
+        profiler.close()
@@ -0,0 +1,245 @@
+import argparse
+import asyncio
+import json
+import logging as log
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor, wait
+
+from src import constants
+from src.latency import LatencyWindow
+from src.queryprofile import QueryProfiler, SLOW_QUERY_MS
+from search import Search
+
+# Long-running query service: the index is loaded (or memory-mapped, --lazy) once and queries are answered over
+#  a line protocol on TCP, one request and one response per line:
+#      {"query": "mahatma gandhi"}            => {"results": ["title", ...], "latency_ms": ...}
+#      {"queries": ["gandhi", "title:river"]} => {"results": [["title", ...], [...]], "latency_ms": ...}
+#      {"stats": true}                        => {"query": {"p50_ms": ..., "p99_ms": ...}, "request": {...}, ...}
+#  a line that is not a JSON object is taken as a single query.
+#  Connections are served concurrently by asyncio, while queries are evaluated one at a time by a single
+#  search thread (Search is not thread-safe and evaluation is CPU bound), so a slow query delays the others
+#  but never blocks reading requests and writing responses. A batch is evaluated in one go, without going
+#  back to the event loop between its queries.
+#
+# Multi-process serving (--workers N): queries are evaluated by N worker processes instead of the search thread,
+#  each with its own Search over the memory-mapped index (always lazy), so the index files are shared through the
+#  page cache instead of being loaded once per process: memory stays close to one copy of the index plus the
+#  private caches of each worker, and throughput grows with the no. of cores. The front process only runs the
+#  event loop and hands each query (batches are split in up to N contiguous chunks) to the next idle worker.
+#
+# Latencies are kept for the most recent queries (time spent evaluating a query) and requests (time from reading
+#  a request to having its response ready, including the time spent waiting for the search thread or a worker).
+#  The query latencies are measured in the search thread or the workers, and the cache statistics are reported
+#  per worker (by pid) as each worker has caches of its own.
+#  --profile-queries adds the latency histograms per query type and the time per phase of every worker to the
+#  stats, and logs slow queries (see src/queryprofile.py).
+
+MAX_BATCH_SIZE = 1000
+MAX_REQUEST_SIZE = 1 << 20  # max. no. of bytes of a request line, longer ones are answered with an error
+
+
+class SearchWorker:
+    """The Search of the search thread, or of a worker process when serving with several processes."""
+    search = None
+    profiler = None  # QueryProfiler of search, if queries are profiled
+
+    @staticmethod
+    def init(path, search_options, profiler_options=None):
+        SearchWorker.search = Search(**search_options)
+        SearchWorker.search.load(path)
+        if profiler_options is not None:
+            SearchWorker.profiler = QueryProfiler(**profiler_options)
+            SearchWorker.profiler.attach(SearchWorker.search)
+
+    @staticmethod
+    def answer(queries):
+        """
+        Returns the titles of the results of every query, the time taken by each one,
+        the pid of the process and the statistics of its caches (and of its profiler).
+        """
+        results = []
+        latencies = []
+        for query in queries:
+            start = time.perf_counter()
+            results.append(SearchWorker.search.answer(query))
+            latencies.append(time.perf_counter() - start)
+        stats = SearchWorker.search.cache_stats()
+        if SearchWorker.profiler:
+            stats["profile"] = SearchWorker.profiler.stats()
+        return results, latencies, os.getpid(), stats
+
+    @staticmethod
+    def ping():
+        time.sleep(0.1)  # keeps this worker busy so that the next ping starts another one
+        return os.getpid()
+
+
+class SearchServer:
+    def __init__(self, executor, workers=1):
+        self.executor = executor  # the search thread, or the pool of worker processes
+        self.workers = workers
+        self.query_latencies = LatencyWindow()
+        self.request_latencies = LatencyWindow()
+        self.connections = 0
+        self.worker_stats = {}  # pid -> statistics of the caches (and profiler) of the Search of that process
+
+    async def answer(self, queries):
+        """Returns the titles of the results of every query, evaluating chunks of queries in parallel."""
+        if not queries:
+            return []
+        loop = asyncio.get_running_loop()
+        no_of_chunks = min(self.workers, len(queries))
+        chunk_size = -(-len(queries) // no_of_chunks)
+        answers = await asyncio.gather(*[loop.run_in_executor(self.executor, SearchWorker.answer,
+                                                              queries[start:start + chunk_size])
+                                         for start in range(0, len(queries), chunk_size)])
+        results = []
+        for chunk_results, latencies, pid, worker_stats in answers:
+            results += chunk_results
+            for latency in latencies:
+                self.query_latencies.record(latency)
+            self.worker_stats[pid] = worker_stats
+        return results
+
+    def stats(self):
+        return {
+            "query": self.query_latencies.stats(),
+            "request": self.request_latencies.stats(),
+            "connections": self.connections,
+            "workers": self.workers,
+            "worker_stats": self.worker_stats,
+        }
+
+    async def respond(self, line):
+        """Returns the response to a request line."""
+        start = time.perf_counter()
+        try:
+            request = json.loads(line)
+        except ValueError:
+            request = None
+        if not isinstance(request, dict):
+            request = {"query": line.strip()}
+
+        if request.get("stats"):
+            return self.stats()
+        if "queries" in request:
+            queries = request["queries"]
+            if not isinstance(queries, list) or not all(isinstance(query, str) for query in queries):
+                return {"error": "queries must be a list of strings"}
+            if len(queries) > MAX_BATCH_SIZE:
+                return {"error": f"more than {MAX_BATCH_SIZE} queries in a batch"}
+        elif isinstance(request.get("query"), str):
+            queries = [request["query"]]
+        else:
+            return {"error": "expected a query, a list of queries or stats"}
+
+        try:
+            results = await self.answer(queries)
+        except ValueError as e:  # a query that can't be parsed, eg. an unknown field
+            return {"error": str(e)}
+        except Exception as e:  # nor must anything else going wrong take the server down
+            log.exception("Failed to answer %s", queries)
+            return {"error": f"{type(e).__name__}: {e}"}
+        latency = time.perf_counter() - start
+        self.request_latencies.record(latency)
+        return {"results": results if "queries" in request else results[0], "latency_ms": 1000 * latency}
+
+    @staticmethod
+    async def skip_line(reader, size):
+        """Discards the rest of a request line longer than the limit of reader, size bytes of which are buffered."""
+        while True:
+            await reader.readexactly(size)
+            try:
+                await reader.readuntil(b"\n")
+                return
+            except asyncio.LimitOverrunError as e:
+                size = e.consumed
+
+    async def handle(self, reader, writer):
+        self.connections += 1
+        try:
+            while True:
+                try:
+                    line = await reader.readuntil(b"\n")
+                except asyncio.IncompleteReadError as e:
+                    line = e.partial  # a last line without newline, empty at the end of the stream
+                except asyncio.LimitOverrunError as e:
+                    await self.skip_line(reader, e.consumed)
+                    line = None
+                if line is None:
+                    response = {"error": f"request longer than {MAX_REQUEST_SIZE} bytes"}
+                elif not line:
+                    break
+                elif not line.strip():
+                    continue
+                else:
+                    response = await self.respond(line.decode("utf-8", errors="replace"))
+                writer.write(json.dumps(response).encode() + b"\n")
+                await writer.drain()
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass  # client went away
+        finally:
+            self.connections -= 1
+            writer.close()
+
+    async def serve(self, host, port):
+        server = await asyncio.start_server(self.handle, host, port, limit=MAX_REQUEST_SIZE)
+        log.info("Serving on %s:%d", host, port)
+        async with server:
+            await server.serve_forever()
+
+
+if __name__ == "__main__":
+    argparser = argparse.ArgumentParser(description="Answer queries over TCP using the index in path")
+    argparser.add_argument("path", nargs="?", default=constants.DEFAULT_INDEX_DIR)
+    argparser.add_argument("--host", default=constants.SERVER_HOST)
+    argparser.add_argument("--port", type=int, default=constants.SERVER_PORT)
+    argparser.add_argument("--workers", type=int, default=1,
+                           help="no. of worker processes evaluating queries over the shared memory-mapped index "
+                                "(default: 1, a search thread in this process)")
+    argparser.add_argument("--top-k", type=int, default=10, help="no. of results returned per query")
+    argparser.add_argument("--exhaustive", action="store_true",
+                           help="score every posting instead of using WAND dynamic pruning")
+    argparser.add_argument("--lazy", action="store_true",
+                           help="memory-map the postings file and term dictionary instead of loading them "
+                                "(always the case with several --workers)")
+    argparser.add_argument("--result-cache-size", type=int, default=constants.RESULT_CACHE_SIZE,
+                           help="max. no. of queries whose results are cached by each worker")
+    argparser.add_argument("--postings-cache-mb", type=float, default=constants.POSTINGS_CACHE_BUDGET / (1 << 20),
+                           help="memory budget of the posting lists cache, shared out between the workers")
+    argparser.add_argument("--profile-queries", action="store_true",
+                           help="time the phases of every query, keep latency histograms per query type "
+                                "and log the queries slower than --slow-query-ms")
+    argparser.add_argument("--slow-query-ms", type=float, default=SLOW_QUERY_MS)
+    argparser.add_argument("--slow-query-log", default=None, help="with --profile-queries, also append slow queries "
+                                                                   "to this file, one JSON object per line")
+    args = argparser.parse_args()
+
+    search_options = {
+        "lazy": args.lazy or args.workers > 1,
+        "top_k": args.top_k,
+        "pruning": not args.exhaustive,
+        "result_cache_size": args.result_cache_size,
+        "postings_cache_budget": int(args.postings_cache_mb * (1 << 20) / args.workers),
+    }
+    profiler_options = None
+    if args.profile_queries:
+        profiler_options = {"slow_query_ms": args.slow_query_ms, "slow_query_log": args.slow_query_log}
+    load_start = time.perf_counter()
+    if args.workers > 1:
+        executor = ProcessPoolExecutor(args.workers, initializer=SearchWorker.init,
+                                       initargs=(args.path, search_options, profiler_options))
+        # start every worker (and open the index in each) before serving, and before the event loop exists
+        wait([executor.submit(SearchWorker.ping) for _ in range(args.workers)])
+    else:
+        SearchWorker.init(args.path, search_options, profiler_options)
+        executor = ThreadPoolExecutor(max_workers=1)
+    log.info("Loaded %s in %.3fs", args.path, time.perf_counter() - load_start)
+
+    try:
+        asyncio.run(SearchServer(executor, args.workers).serve(args.host, args.port))
+    except KeyboardInterrupt:
+        pass
+    finally:
+        executor.shutdown()
@@ -0,0 +1,239 @@
+import itertools
+from collections import Counter, defaultdict
+from functools import reduce
+
+try:
+    import numpy as np  # only batch evaluation needs numpy
+except ImportError:
+    np = None
+
+from src import constants
+from src.compression import POPCOUNT
+from src.constants import FIELD_QUERY_OPERATOR
+from src.ranking import bm25_tf
+
+# Batch evaluation of a whole query file (search.py --batch):
+#  every query is parsed up front, identical queries (same normalize_query() key) are evaluated once and the queries
+#  are ordered so that those sharing terms run one after the other. The posting list of a term is decoded once for
+#  the whole batch into NumPy arrays (row of each live document in the table of its segment, field mask, BM25 tf
+#  component of each field) and dropped as soon as the last query using it has been evaluated.
+#  A query is then a few vectorized operations per segment: the weighted scores of each term are a sum of rows of
+#  its tf components, the documents of the OR of the terms (np.unique of their rows) get the sum of their scores
+#  (np.bincount), those of an AND are the np.intersect1d of the np.union1d of the first field's terms with every
+#  other term, and the top k are picked out with np.partition.
+#  Every posting of the query's terms is scored (no dynamic pruning), in the same order and with the same floating
+#  point operations as Search with pruning=False, so results are the same as those of exhaustive evaluation.
+#  Phrase and proximity queries need positions and are evaluated one by one by Search.evaluate().
+#  The result cache is neither read nor filled.
+
+
+class SegmentTable:
+    """docids (sorted), field lengths and liveness of the documents of a segment, indexed by row."""
+
+    def __init__(self, segment):
+        entry_dtype = np.dtype([("docid", "<u4"), ("offset", "<u8"), ("size", "<u4"),
+                                ("lengths", "<u4", (len(constants.FIELDS),))])  # see TITLE_ENTRY
+        entries = segment.title_store.entries
+        entries = np.frombuffer(entries, entry_dtype) if entries else np.zeros(0, entry_dtype)
+        self.docids = entries["docid"].astype(np.int64)
+        self.lengths = entries["lengths"]
+        self.live = np.ones(len(entries), dtype=bool)
+        if segment.deleted:
+            self.live[np.searchsorted(self.docids, np.fromiter(segment.deleted, np.int64))] = False
+
+
+class TermPostings:
+    """The live postings of a term in a segment: rows in the SegmentTable, field masks and BM25 tf components."""
+
+    def __init__(self, rows, masks, tf_components):
+        self.rows = rows
+        self.masks = masks
+        self.tf_components = tf_components  # [field no., posting], 0 where the field is not in the mask
+
+
+class BatchSearch:
+    def __init__(self, search):
+        if np is None:
+            raise ImportError("batch evaluation needs numpy")
+        self.search = search  # a loaded Search
+        self.tables = [SegmentTable(segment) for segment in search.segments]
+        self.popcounts = np.array(POPCOUNT, dtype=np.int64)
+        self.terms = {}  # term -> ([(segment no., entry)], {segment no.: TermPostings}) of the terms in use
+        self.uses = Counter()  # term -> no. of queries yet to be evaluated using it
+
+    @staticmethod
+    def available():
+        """Whether numpy, which batch evaluation needs, is installed."""
+        return np is not None
+
+    def answer(self, queries):
+        """Returns the titles of the best search.top_k results of every query."""
+        return [self.search.get_doc_names_from_ids(docids) for docids in self.search_batch(queries)]
+
+    def search_batch(self, queries):
+        """Returns the docids of the best search.top_k results of every query."""
+        plans = {}  # normalize_query() key -> evaluation plan of the queries with that key
+        keys = []
+        for query in queries:
+            key = self.search.normalize_query(query)
+            if key not in plans:
+                plans[key] = self.plan(query)
+            keys.append(key)
+
+        for plan in plans.values():
+            self.uses.update(plan[1])
+
+        # queries sharing their most used term are evaluated one after the other,
+        # so that posting lists are freed soon after they are decoded
+        def group(key):
+            return sorted(plans[key][1], key=lambda term: (-self.uses[term], term))
+
+        results = {}
+        for key in sorted(plans, key=group):
+            evaluate, terms, *args = plans[key]
+            results[key] = evaluate(*args)[:self.search.top_k]
+            for term in terms:
+                self.uses[term] -= 1
+                if not self.uses[term]:
+                    del self.uses[term]
+                    self.terms.pop(term, None)
+        return [results[key] for key in keys]
+
+    def plan(self, query):
+        """Returns (evaluation method, distinct terms, *arguments of the method) of query."""
+        search = self.search
+        query_type = search.get_query_type(query)
+        if query_type == constants.PROXIMITY_QUERY:
+            return search.evaluate, (), query
+
+        if query_type == constants.FIELD_QUERY:
+            clauses = search.parse_field_query(query)
+            if FIELD_QUERY_OPERATOR != "OR":
+                first = [(term, clauses[0][0]) for term in clauses[0][1]]
+                others = [(term, field) for field, terms in clauses[1:] for term in terms]
+                terms = tuple(dict.fromkeys(term for term, _ in first + others))
+                return self.and_query, terms, first, others
+            term_fields = [(term, field) for field, terms in clauses for term in terms]
+        else:
+            term_fields = [(term, field) for term in search.get_terms(query) for field in constants.FIELDS]
+
+        term_field_counts = defaultdict(Counter)  # term -> {field: no. of times queried}, as in Search.top_k_query()
+        for term, field in term_fields:
+            term_field_counts[term][field] += 1
+        return self.or_query, tuple(term_field_counts), term_field_counts
+
+    def get_term(self, term):
+        """Returns the lookup() entries of term and its decoded postings in each segment."""
+        if term not in self.terms:
+            entries = self.search.lookup(term)
+            self.terms[term] = entries, {segment_no: self.decode(segment_no, entry) for segment_no, entry in entries}
+        return self.terms[term]
+
+    def decode(self, segment_no, entry):
+        segment = self.search.segments[segment_no]
+        table = self.tables[segment_no]
+        count = entry[0]
+        docids, masks, tfs = segment.get_postings(entry)
+        docids = np.fromiter(docids, np.int64, count)
+        masks = np.fromiter(masks, np.int64, count)
+        # the tfs of every posting one after the other, those of posting i start at starts[i]
+        sizes = self.popcounts[masks]
+        flat_tfs = np.fromiter(itertools.chain.from_iterable(tfs), np.int64, int(sizes.sum()))
+        starts = np.cumsum(sizes) - sizes
+
+        rows = np.searchsorted(table.docids, docids)
+        live = table.live[rows]
+        rows, masks, starts = rows[live], masks[live], starts[live]
+
+        tf_components = np.zeros((len(constants.FIELDS), len(rows)))
+        for field_no, field in enumerate(constants.FIELDS):
+            present = np.flatnonzero(masks & (1 << field_no))
+            if len(present):
+                # tfs only holds the frequencies of the fields in mask, in field order
+                tf = flat_tfs[starts[present] + self.popcounts[masks[present] & ((1 << field_no) - 1)]]
+                tf_components[field_no, present] = bm25_tf(tf, table.lengths[rows[present], field_no],
+                                                           self.search.avg_field_lengths.get(field) or 1)
+        return TermPostings(rows, masks, tf_components)
+
+    def get_scores(self, term, field_counts):
+        """
+        Returns {segment no.: (rows, scores)} of the live postings of term in the fields of field_counts,
+        scored like Search.get_scorer() does.
+        """
+        entries, postings = self.get_term(term)
+        field_mask = self.search.get_field_mask(field_counts)
+        weighted_idfs = self.search.get_weighted_idfs(entries, field_counts)
+        segment_scores = {}
+        for segment_no, term_postings in postings.items():
+            rows, masks, tf_components = term_postings.rows, term_postings.masks, term_postings.tf_components
+            if field_mask is not None:
+                selected = np.flatnonzero(masks & field_mask)
+                rows, tf_components = rows[selected], tf_components[:, selected]
+            scores = np.zeros(len(rows))
+            for field_no, weighted_idf in weighted_idfs:
+                scores += weighted_idf * tf_components[field_no]
+            self.search.scored_postings += len(rows)
+            segment_scores[segment_no] = rows, scores
+        return segment_scores
+
+    def or_query(self, term_field_counts):
+        """The best search.top_k docids for the OR of the terms of term_field_counts, see Search.top_k_query()."""
+        segment_scores = defaultdict(list)  # segment no. -> [(rows, scores)] of every term
+        for term, field_counts in term_field_counts.items():
+            for segment_no, rows_scores in self.get_scores(term, field_counts).items():
+                segment_scores[segment_no].append(rows_scores)
+
+        results = []
+        for segment_no, term_scores in segment_scores.items():
+            results += self.top_k(segment_no, *self.sum_scores(term_scores))
+        return self.search.merge_results(results)
+
+    def and_query(self, first, others):
+        """
+        The best search.top_k docids having one of the (term, field) pairs of first
+        and every one of others, see the AND operator of Search.field_query().
+        """
+        first_scores = [self.get_scores(term, {field: 1}) for term, field in first]
+        other_scores = [self.get_scores(term, {field: 1}) for term, field in others]
+        if not first_scores:
+            return []
+
+        results = []
+        for segment_no in range(len(self.tables)):
+            if any(segment_no not in scores for scores in other_scores):
+                continue  # a term has no postings in this segment
+            first_rows = [scores[segment_no][0] for scores in first_scores if segment_no in scores]
+            if not first_rows:
+                continue
+            rows = reduce(np.union1d, first_rows)
+            for scores in other_scores:
+                rows = np.intersect1d(rows, scores[segment_no][0], assume_unique=True)
+            if not len(rows):
+                continue
+            term_scores = []
+            for scores in first_scores + other_scores:
+                if segment_no in scores:
+                    term_rows, term_row_scores = scores[segment_no]
+                    selected = np.isin(term_rows, rows, assume_unique=True)
+                    term_scores.append((term_rows[selected], term_row_scores[selected]))
+            results += self.top_k(segment_no, *self.sum_scores(term_scores))
+        return self.search.merge_results(results)
+
+    @staticmethod
+    def sum_scores(term_scores):
+        """Returns the distinct rows of [(rows, scores)] and the sum of their scores."""
+        rows, inverse = np.unique(np.concatenate([rows for rows, _ in term_scores]), return_inverse=True)
+        # bincount adds up the scores of a row in the order of the terms, as Search.score_postings() does
+        return rows, np.bincount(inverse.ravel(), weights=np.concatenate([scores for _, scores in term_scores]))
+
+    def top_k(self, segment_no, rows, scores):
+        """(score, docid) of the best search.top_k rows, by decreasing score and increasing docid."""
+        docids = self.tables[segment_no].docids[rows]
+        k = self.search.top_k
+        if len(scores) > k:
+            threshold = np.partition(scores, len(scores) - k)[len(scores) - k]
+            best = np.flatnonzero(scores >= threshold)  # ties with the k-th score included
+            docids, scores = docids[best], scores[best]
+        order = np.lexsort((docids, -scores))[:k]
+        return list(zip(scores[order].tolist(), docids[order].tolist()))
+
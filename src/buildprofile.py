@@ -0,0 +1,157 @@
+import json
+import logging as log
+import os
+import time
+from collections import OrderedDict, defaultdict
+from contextlib import contextmanager
+
+try:
+    import resource  # not available on Windows
+except ImportError:
+    resource = None
+
+# Build instrumentation:
+#  every stage of a build records its wall clock and CPU time (CPU time of the thread running it), how many times
+#  it ran and the peak memory of the process when it last finished, while counters record the no. of pages, tokens,
+#  postings, blocks... Stages run once per page (parse, tokenize, invert) or once per build (merge_blocks...),
+#  never once per token, so instrumentation costs next to nothing; stemming is timed per field of a page (the stem
+#  stage is recorded once per page) and stem cache misses are counted by the cache.
+#  Stages nest: stem is part of tokenize, flush_block of invert.
+#  With --workers, tokenize and stem run in the worker processes, which hand their stages over along with every
+#  batch, their times are then summed over the workers and can exceed the wall clock time of the build.
+#  A progress line is logged every PROGRESS_INTERVAL seconds and a JSON report is written at the end of the build.
+
+PROGRESS_INTERVAL = 10  # seconds
+
+
+def get_peak_rss():
+    """Max. resident set size of this process so far, in bytes (0 if unknown)."""
+    if resource is None:
+        return 0
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024  # kilobytes on linux
+
+
+class BuildProfile:
+    stages = OrderedDict()  # name -> {"wall": seconds, "cpu": seconds, "calls": n, "peak_rss": bytes}
+    counters = defaultdict(int)  # name -> count
+    started = time.perf_counter()
+    started_cpu = time.process_time()
+    last_progress = started
+
+    @staticmethod
+    def start():
+        BuildProfile.stages = OrderedDict()
+        BuildProfile.counters = defaultdict(int)
+        BuildProfile.started = BuildProfile.last_progress = time.perf_counter()
+        BuildProfile.started_cpu = time.process_time()
+
+    @staticmethod
+    def get_stage(name):
+        stage = BuildProfile.stages.get(name)
+        if stage is None:
+            stage = BuildProfile.stages[name] = {"wall": 0.0, "cpu": 0.0, "calls": 0, "peak_rss": 0}
+        return stage
+
+    @staticmethod
+    def add_time(name, wall, cpu):
+        stage = BuildProfile.get_stage(name)
+        stage["wall"] += wall
+        stage["cpu"] += cpu
+        stage["calls"] += 1
+        stage["peak_rss"] = get_peak_rss()
+
+    @staticmethod
+    @contextmanager
+    def stage(name):
+        start, start_cpu = time.perf_counter(), time.thread_time()
+        try:
+            yield
+        finally:
+            BuildProfile.add_time(name, time.perf_counter() - start, time.thread_time() - start_cpu)
+
+    @staticmethod
+    def timed_iter(name, iterable):
+        """Yields the items of iterable, the time taken to produce each one being that of stage name."""
+        iterator = iter(iterable)
+        while True:
+            start, start_cpu = time.perf_counter(), time.thread_time()
+            try:
+                item = next(iterator)
+            except StopIteration:
+                return
+            finally:
+                BuildProfile.add_time(name, time.perf_counter() - start, time.thread_time() - start_cpu)
+            yield item
+
+    @staticmethod
+    def count(name, n=1):
+        BuildProfile.counters[name] += n
+
+    @staticmethod
+    def pop_stages():
+        """Used by indexing worker processes to hand their stages and counters over to the main process."""
+        stages, counters = BuildProfile.stages, BuildProfile.counters
+        BuildProfile.stages, BuildProfile.counters = OrderedDict(), defaultdict(int)
+        return stages, dict(counters)
+
+    @staticmethod
+    def merge(stages, counters):
+        """Merge the stages and counters of a worker process into those of this process."""
+        for name, worker_stage in stages.items():
+            stage = BuildProfile.get_stage(name)
+            stage["wall"] += worker_stage["wall"]
+            stage["cpu"] += worker_stage["cpu"]
+            stage["calls"] += worker_stage["calls"]
+            stage["peak_rss"] = max(stage["peak_rss"], worker_stage["peak_rss"])
+        for name, n in counters.items():
+            BuildProfile.counters[name] += n
+
+    @staticmethod
+    def progress():
+        """Logs a progress line if the last one is more than PROGRESS_INTERVAL seconds old."""
+        now = time.perf_counter()
+        if now - BuildProfile.last_progress < PROGRESS_INTERVAL:
+            return
+        BuildProfile.last_progress = now
+        elapsed = now - BuildProfile.started
+        counters = BuildProfile.counters
+        log.info("%d pages (%.0f/s), %d tokens (%.0f/s), %d postings, %d blocks, peak memory %.0f MB",
+                 counters["pages"], counters["pages"] / elapsed, counters["tokens"], counters["tokens"] / elapsed,
+                 counters["postings"], counters["blocks"], get_peak_rss() / (1 << 20))
+
+    @staticmethod
+    def report(output_dir=None, extra=None, exclude=()):
+        """
+        Returns the report of the build so far: elapsed time, stages, counters and their rates,
+        along with the size of every file in output_dir (but the paths in exclude) if given and the items of extra.
+        """
+        elapsed = time.perf_counter() - BuildProfile.started
+        stem_time = BuildProfile.stages.get("stem", {}).get("wall", 0.0)
+        report = {
+            "wall": elapsed,
+            "cpu": time.process_time() - BuildProfile.started_cpu,
+            "peak_rss": get_peak_rss(),
+            "peak_rss_workers": resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss * 1024 if resource else 0,
+            "stages": BuildProfile.stages,
+            "counters": BuildProfile.counters,
+            "rates": {f"{name}_per_sec": n / elapsed for name, n in BuildProfile.counters.items()},
+        }
+        if stem_time:
+            report["rates"]["stems_computed_per_sec"] = BuildProfile.counters["stem_misses"] / stem_time
+        if output_dir is not None:
+            paths = {name: os.path.abspath(f"{output_dir}/{name}") for name in sorted(os.listdir(output_dir))}
+            report["files"] = {name: os.path.getsize(path) for name, path in paths.items()
+                               if os.path.isfile(path) and path not in exclude}
+        if extra:
+            report.update(extra)
+        return report
+
+    @staticmethod
+    def write_report(path, output_dir=None, extra=None):
+        report = BuildProfile.report(output_dir, extra, exclude=[os.path.abspath(path)])
+        with open(path, "w") as fp:
+            json.dump(report, fp, indent=2)
+        for name, stage in report["stages"].items():
+            log.info("%-16s wall %8.3fs  cpu %8.3fs  calls %9d  peak memory %6.0f MB", name, stage["wall"],
+                     stage["cpu"], stage["calls"], stage["peak_rss"] / (1 << 20))
+        log.info("Build profile written to %s", path)
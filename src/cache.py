@@ -0,0 +1,121 @@
+import sys
+from collections import OrderedDict
+
+# Caches used at query time (see search.py):
+#  the result cache maps a normalized query to its results,
+#  the postings cache holds the decoded posting lists of the terms queried most (lazy segments only, eager ones
+#  keep every list decoded anyway). A list is decoded in full and admitted only on its admit_after-th request,
+#  before that the cursors decode just the blocks they visit, so terms queried once don't evict hot ones.
+#  Both are bounded LRU caches, the postings cache by the estimated memory of its lists.
+
+POSTINGS_CACHE_ADMIT_AFTER = 2
+POSTINGS_CACHE_REQUESTS_SIZE = 100000  # no. of uncached lists whose requests are counted for admission
+
+
+class LRUCache:
+    """Bounded mapping that evicts the least recently used entry, with hit/miss/eviction counters."""
+
+    def __init__(self, maxsize, sizeof=None):
+        # maxsize bounds the no. of entries, or the sum of sizeof(value) over the entries if sizeof is given
+        self.maxsize = maxsize
+        self.sizeof = sizeof
+        self.data = OrderedDict()
+        self.sizes = {}  # key -> sizeof(value), if sizeof is given
+        self.used = 0  # no. of entries, or sum of their sizes
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key, default=None):
+        try:
+            value = self.data[key]
+        except KeyError:
+            self.misses += 1
+            return default
+        self.data.move_to_end(key)
+        self.hits += 1
+        return value
+
+    def put(self, key, value):
+        size = self.sizeof(value) if self.sizeof else 1
+        if size > self.maxsize:
+            return  # would evict everything else and still not fit
+        if key in self.data:
+            self.used -= self.sizes.pop(key, 1)
+        self.data[key] = value
+        self.data.move_to_end(key)
+        if self.sizeof:
+            self.sizes[key] = size
+        self.used += size
+        while self.used > self.maxsize:
+            evicted, _ = self.data.popitem(last=False)
+            self.used -= self.sizes.pop(evicted, 1)
+            self.evictions += 1
+
+    def items(self):
+        return self.data.items()
+
+    def clear(self):
+        self.data.clear()
+        self.sizes.clear()
+        self.used = 0
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        stats = {
+            "size": len(self.data),
+            "maxsize": self.maxsize,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+        }
+        if self.sizeof:
+            stats["used"] = self.used
+        return stats
+
+    def __len__(self):
+        return len(self.data)
+
+    def __contains__(self, key):
+        return key in self.data
+
+
+def sizeof_postings(postings):
+    """Estimated no. of bytes held by decoded (docids, masks, tfs), small ints being shared by Python."""
+    docids, masks, tfs = postings
+    size = sys.getsizeof(docids) + sys.getsizeof(masks) + sys.getsizeof(tfs)
+    if docids:
+        size += len(docids) * sys.getsizeof(docids[-1]) + sum(sys.getsizeof(doc_tfs) for doc_tfs in tfs)
+    return size
+
+
+class PostingsCache:
+    """Decoded posting lists within a memory budget (bytes), keyed by (segment path, termid)."""
+
+    def __init__(self, budget, admit_after=POSTINGS_CACHE_ADMIT_AFTER):
+        self.lists = LRUCache(budget, sizeof_postings)
+        self.admit_after = admit_after
+        self.requests = LRUCache(POSTINGS_CACHE_REQUESTS_SIZE)  # key -> no. of requests of an uncached list
+
+    def get(self, key, decode):
+        """Returns the cached posting list of key, or decode() it if it has been requested often enough, else None"""
+        postings = self.lists.get(key)
+        if postings is not None:
+            return postings
+        requests = self.requests.get(key, 0) + 1
+        if requests < self.admit_after:
+            self.requests.put(key, requests)
+            return None
+        postings = decode()
+        self.lists.put(key, postings)
+        if key not in self.lists:
+            self.requests.put(key, float("-inf"))  # larger than the budget, never decode it in full again
+        return postings
+
+    def clear(self):
+        self.lists.clear()
+        self.requests.clear()
+
+    def stats(self):
+        return self.lists.stats()
@@ -0,0 +1,180 @@
+# Posting list compression.
+#  Posting lists hold sorted docids, so they are stored as gaps (differences between consecutive docids),
+#  which are small numbers for frequent terms. The gaps are followed by the field mask of every docid
+#  (bit i set if the term occurs in the i-th field of constants.FIELDS) and then by the term frequencies
+#  of every docid in each field of its mask.
+#  Both are then written using either
+#  variable-byte (varint) encoding: 7 bits per byte, high bit set on all bytes except the last one of a number
+#  or Elias-gamma encoding: unary length followed by the binary offset, padded to a whole byte per block.
+#
+# Skip pointers: a posting list is split into blocks of SKIP_INTERVAL postings, each encoded on its own
+#  (gaps of the first docid of a block are relative to the last docid of the previous block).
+#  The list starts with a skip table holding varint(last docid of block - last docid of previous block)
+#  varint(no. of bytes of block) for every block, so a reader can jump to the block that may contain
+#  a docid and decode only that block.
+
+VARINT = "varint"
+GAMMA = "gamma"
+
+SKIP_INTERVAL = 128
+
+POPCOUNT = [bin(mask).count("1") for mask in range(256)]  # no. of fields in a field mask
+
+
+def delta_encode(docids):
+    gaps = []
+    prev = 0
+    for docid in docids:
+        gaps.append(docid - prev)
+        prev = docid
+    return gaps
+
+
+def delta_decode(gaps):
+    docids = []
+    docid = 0
+    for gap in gaps:
+        docid += gap
+        docids.append(docid)
+    return docids
+
+
+def encode_varint(numbers):
+    buf = bytearray()
+    for number in numbers:
+        while number >= 0x80:
+            buf.append((number & 0x7F) | 0x80)
+            number >>= 7
+        buf.append(number)
+    return bytes(buf)
+
+
+def decode_varint(buf, offset=0, count=None):
+    """
+    Decode count numbers (or till the end of buf) starting at offset.
+    Returns the numbers and the offset just after the last decoded byte.
+    """
+    numbers = []
+    end = len(buf)
+    number = shift = 0
+    while offset < end and (count is None or len(numbers) < count):
+        byte = buf[offset]
+        offset += 1
+        number |= (byte & 0x7F) << shift
+        if byte & 0x80:
+            shift += 7
+        else:
+            numbers.append(number)
+            number = shift = 0
+    return numbers, offset
+
+
+def encode_gamma(numbers):
+    # gamma can't encode 0, so every number is shifted by one
+    bits = []
+    for number in numbers:
+        binary = bin(number + 1)[2:]
+        bits.append("0" * (len(binary) - 1))
+        bits.append(binary)
+    bits = "".join(bits)
+    if not bits:
+        return b""
+    bits += "0" * (-len(bits) % 8)  # pad to a whole no. of bytes
+    return int(bits, 2).to_bytes(len(bits) // 8, "big")
+
+
+def decode_gamma(buf, count):
+    return read_gamma(bin(int.from_bytes(buf, "big"))[2:].zfill(len(buf) * 8), 0, count)[0]
+
+
+def read_gamma(bits, pos, count):
+    """Decode count numbers from the string of bits starting at pos, returns them and the position after them."""
+    numbers = []
+    while len(numbers) < count:
+        length = 0
+        while bits[pos] == "0":
+            length += 1
+            pos += 1
+        numbers.append(int(bits[pos:pos + length + 1], 2) - 1)
+        pos += length + 1
+    return numbers, pos
+
+
+def encode_numbers(numbers, codec):
+    if codec == GAMMA:
+        return encode_gamma(numbers)
+    return encode_varint(numbers)
+
+
+def encode_postings(docids, masks, tfs, codec=VARINT):
+    """tfs holds, for every docid, the tuple of its term frequencies in the fields of its mask."""
+    skips = []
+    blocks = []
+    prev = 0
+    for start in range(0, len(docids), SKIP_INTERVAL):
+        block_docids = docids[start:start + SKIP_INTERVAL]
+        gaps = delta_encode(block_docids)
+        gaps[0] -= prev
+        block_tfs = [tf for doc_tfs in tfs[start:start + SKIP_INTERVAL] for tf in doc_tfs]
+        block = encode_numbers(gaps + list(masks[start:start + SKIP_INTERVAL]) + block_tfs, codec)
+
+        skips += [block_docids[-1] - prev, len(block)]
+        blocks.append(block)
+        prev = block_docids[-1]
+    return encode_varint(skips) + b"".join(blocks)
+
+
+def decode_skips(buf, count):
+    """
+    Returns the last docid of every block, the offset of every block in buf
+    and the offset just after the last block.
+    """
+    no_of_blocks = -(-count // SKIP_INTERVAL)
+    skips, offset = decode_varint(buf, 0, 2 * no_of_blocks)
+
+    last_docids = delta_decode(skips[0::2])
+    block_offsets = []
+    for size in skips[1::2]:
+        block_offsets.append(offset)
+        offset += size
+    return last_docids, block_offsets, offset
+
+
+def decode_block(buf, start, end, base_docid, count, codec=VARINT):
+    """
+    Decode the count postings stored in buf[start:end], base_docid is the last docid of the previous block.
+    Returns the docids, their field masks and the tuples of their term frequencies.
+    """
+    if codec == GAMMA:
+        bits = bin(int.from_bytes(buf[start:end], "big"))[2:].zfill((end - start) * 8)
+        numbers, pos = read_gamma(bits, 0, 2 * count)
+        flat_tfs, _ = read_gamma(bits, pos, sum(POPCOUNT[mask] for mask in numbers[count:]))
+    else:
+        numbers, offset = decode_varint(buf, start, 2 * count)
+        flat_tfs, _ = decode_varint(buf, offset, sum(POPCOUNT[mask] for mask in numbers[count:]))
+    numbers[0] += base_docid
+    masks = numbers[count:]
+
+    tfs = []
+    pos = 0
+    for mask in masks:
+        tfs.append(tuple(flat_tfs[pos:pos + POPCOUNT[mask]]))
+        pos += POPCOUNT[mask]
+    return delta_decode(numbers[:count]), masks, tfs
+
+
+def decode_postings(buf, count, codec=VARINT):
+    """Returns the docids, field masks and term frequencies of a posting list holding count docids."""
+    last_docids, block_offsets, end = decode_skips(buf, count)
+    block_ends = block_offsets[1:] + [end]
+
+    docids, masks, tfs = [], [], []
+    base_docid = 0
+    for i, start in enumerate(block_offsets):
+        block_docids, block_masks, block_tfs = decode_block(buf, start, block_ends[i], base_docid,
+                                                            min(SKIP_INTERVAL, count - i * SKIP_INTERVAL), codec)
+        docids += block_docids
+        masks += block_masks
+        tfs += block_tfs
+        base_docid = last_docids[i]
+    return docids, masks, tfs
@@ -1,17 +1,64 @@
 DEFAULT_DUMP_PATH = "dumps/sample26.xml"
 DEFAULT_INDEX_DIR = "indexes"
 POSTINGS_FILE_NAME = "postings.txt"
+BINARY_POSTINGS_FILE_NAME = "postings.bin"
+POSTINGS_OFFSETS_FILE_NAME = "postings-offsets.bin"
+POSITIONS_FILE_NAME = "positions.bin"
+POSITIONS_OFFSETS_FILE_NAME = "positions-offsets.bin"
 TERM_ID_MAPPING_FILE_NAME = "term-termid-map.txt"
-DOC_ID_TITLE_MAPPING_FILE_NAME = "docid-title-map.txt"
+TERM_DICT_FILE_NAME = "term-dict.bin"
+TERM_DICT_INDEX_FILE_NAME = "term-dict-index.bin"
+TERM_DICT_IDS_FILE_NAME = "term-dict-ids.bin"
+TITLES_FILE_NAME = "titles.bin"
+TITLES_INDEX_FILE_NAME = "titles-index.bin"
+TITLES_RUN_FILE_NAME = "titles-run-{}.bin"
+BLOCK_FILE_NAME = "block-{}.bin"
+SEGMENTS_FILE_NAME = "segments.txt"
+SEGMENT_DIR_NAME = "segment-{}"
+TOMBSTONES_FILE_NAME = "tombstones.bin"
+INDEX_LOCK_FILE_NAME = "index.lock"
+MERGE_LOCK_FILE_NAME = "merge.lock"
+MERGE_LOG_FILE_NAME = "merge.log"
+
+STEM_TABLE_FILE_NAME = "stems.txt"
+BUILD_PROFILE_FILE_NAME = "build-profile.json"
 
 STOPWORDS_FILE_PATH = "stopwords.txt"
+STEM_CACHE_SIZE = 100000  # max. no. of words whose stems are memoized (besides the preloaded stem table)
+RESULT_CACHE_SIZE = 10000  # max. no. of queries whose results are cached
+POSTINGS_CACHE_BUDGET = 64 << 20  # max. bytes of decoded posting lists cached when the index is memory-mapped
 
 TERM_POSTINGS_SEP = ":"
 DOCIDS_SEP = ","
-POS_SEP = ""
-FIELD_SEP = ""
+TF_SEP = ";"
+
+POSTINGS_FORMAT = "varint"  # one of varint, gamma, text
 
 QUERY_FILE = "dumps/queryfile"
 OUTPUT_FILE = "dumps/output.txt"
 
+SERVER_HOST = "127.0.0.1"
+SERVER_PORT = 8765
+
 FIELD_QUERY_OPERATOR = "OR"
+
+# query types
+ONE_WORD_QUERY = "ONE_WORD_QUERY"
+FREE_TEXT_QUERY = "FREE_TEXT_QUERY"
+FIELD_QUERY = "FIELD_QUERY"
+PROXIMITY_QUERY = "PROXIMITY_QUERY"
+
+FIELDS = "TBICRL"  # title, body, infobox, category, references, links
+STATS_FILE_NAME = "stats.txt"
+
+# BM25 ranking, the score of a document is the weighted sum of its per field BM25 scores
+BM25_K1 = 1.2
+BM25_B = 0.75
+FIELD_WEIGHTS = {
+    "T": 3.0,
+    "I": 2.0,
+    "B": 1.0,
+    "C": 1.0,
+    "R": 0.5,
+    "L": 0.5,
+}
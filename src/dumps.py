@@ -0,0 +1,79 @@
+import bz2
+import io
+import logging as log
+import multiprocessing
+import os
+
+from src.parser import iter_pages
+
+# Multistream bz2 dumps (enwiki-*-pages-articles-multistream.xml.bz2) are a concatenation of independent bz2
+#  streams of (at most) 100 pages each, preceded by a stream holding the <mediawiki><siteinfo> header and
+#  followed by one holding the closing </mediawiki>.
+#  They come with an index (enwiki-*-pages-articles-multistream-index.txt.bz2) with one "offset:pageid:title"
+#  line per page, offset being the byte position in the dump of the stream that holds the page.
+# Since the streams are independent they are decompressed and parsed by a pool of worker processes,
+#  and their pages are handed to the indexer in dump order.
+
+MULTISTREAM_SUFFIX = "-multistream.xml.bz2"
+MULTISTREAM_INDEX_SUFFIX = "-multistream-index.txt.bz2"
+STREAMS_PER_TASK = 4
+
+
+def find_multistream_index(path):
+    """Returns the path of the index of the multistream dump at path if it exists, else None"""
+    if not path.endswith(MULTISTREAM_SUFFIX):
+        return None
+    index_path = path[:-len(MULTISTREAM_SUFFIX)] + MULTISTREAM_INDEX_SUFFIX
+    return index_path if os.path.exists(index_path) else None
+
+
+def read_stream_offsets(index_path):
+    """Returns the sorted byte offsets of the streams listed in the multistream index."""
+    offsets = set()
+    with bz2.open(index_path, "rt", encoding="utf-8") as fp:
+        for line in fp:
+            offset, _, _ = line.partition(":")
+            offsets.add(int(offset))
+    return sorted(offsets)
+
+
+def read_stream(task):
+    """
+    Runs inside a worker process.
+    Decompresses the bz2 stream at dump_path[start:end] and returns its pages.
+    """
+    dump_path, start, end = task
+    with open(dump_path, "rb") as fp:
+        fp.seek(start)
+        data = bz2.decompress(fp.read(end - start))
+
+    # a stream is a run of <page> elements, without the root element around them
+    first = data.find(b"<page>")
+    if first == -1:
+        return []  # header or footer stream
+    last = data.rfind(b"</page>") + len(b"</page>")
+    return list(iter_pages(io.BytesIO(b"<mediawiki>" + data[first:last] + b"</mediawiki>")))
+
+
+def iter_multistream_pages(path, index_path, workers):
+    """Yields the pages of the multistream dump at path in dump order, decompressing streams in parallel."""
+    offsets = read_stream_offsets(index_path)
+    boundaries = [0] + offsets + [os.path.getsize(path)]
+    tasks = [(path, start, end) for start, end in zip(boundaries, boundaries[1:]) if start < end]
+    log.info("Reading %d streams of %s", len(tasks), path)
+
+    with multiprocessing.Pool(workers) as pool:
+        for pages in pool.imap(read_stream, tasks, chunksize=STREAMS_PER_TASK):
+            yield from pages
+
+
+def iter_dump_pages(path, workers=1, index_path=None):
+    """
+    Yields the pages of the dump at path (plain xml, .bz2 or .gz).
+    Multistream dumps whose index is given or found next to them are decompressed by workers processes.
+    """
+    index_path = index_path or find_multistream_index(path)
+    if index_path and workers > 1:
+        yield from iter_multistream_pages(path, index_path, workers)
+    else:
+        yield from iter_pages(path)
@@ -1,8 +1,12 @@
+from src import constants
+from src.stemmer import CachedStemmer
+
+
 class Helpers:
     stopwords = set()
+    stemmer = CachedStemmer(constants.STEM_CACHE_SIZE)  # shared by the tokenizer and search
     docid_docname_map = {}
-    term_termid_map = {}
-    termid_term_map = {}
+    term_termid_map = {}  # term -> termid, the same termid in every field
 
     @staticmethod
     def load_stopwords(path):
@@ -1,17 +1,226 @@
-# TODO:
-#  Implement either Blocked sort-based indexing
-#  or Single-pass in-memory indexing
+import heapq
+import logging as log
+import os
+import struct
+from array import array
+from collections import defaultdict
 
-INDEX_BLOCK_MAX_SIZE = 1000000
+from src import constants
+from src.buildprofile import BuildProfile
+from src.compression import POPCOUNT
+from src.ranking import bm25_tf
+from src.titles import TitleStore
+
+# Single-pass in-memory indexing (SPIMI):
+#  postings are inverted into an in-memory block which is written to disk,
+#  sorted by termid, whenever it holds INDEX_BLOCK_MAX_SIZE postings.
+#  The sorted blocks are then k-way merged (using a heap) into the final postings file,
+#  so peak memory depends on the block size and not on the size of the dump.
+#
+# The postings of a term in the block are packed in a single array of machine integers rather than held as one
+#  Python object each: docid, field mask, tf in each field of the mask, for every posting in document order,
+#  each followed by its positions in each field of the mask for a positional index.
+#  That is about 20 bytes per posting (without positions) instead of about 70 for a formatted string,
+#  and nothing but the distinct termids of the block has to be sorted when writing it.
+#  A block file holds, for every termid of the block in increasing order, a BLOCK_RUN header followed by the
+#  array of the term, in native byte order (blocks are only read back by the process that wrote them).
+
+INDEX_BLOCK_MAX_SIZE = 3000000
+BLOCK_RUN = struct.Struct("<IIB")  # termid, no. of values, whether they hold positions
 
 
 class Indexer:
-    termid_docid_list = []
+    index_dir = constants.DEFAULT_INDEX_DIR
+    # termid -> array of docid1, mask1, tf1, tf2, [positions,] docid2, mask2, tf1, [positions,]... for the current block
+    block = defaultdict(lambda: array("I"))
+    block_size = 0  # no. of postings in current block
+    block_positional = False  # whether the postings of the current block hold positions
+    block_paths = []
+    title_store = None  # TitleStoreWriter of the index being built
+    no_of_docs = 0
+    total_field_lengths = defaultdict(int)  # field -> sum of the lengths of that field over all docs
 
     @staticmethod
     def bsbi():
         pass
 
     @staticmethod
-    def spimi():
-        pass
+    def add_document(docid, title, termid_freq_map, field_lengths, termid_positions_map=None):
+        with BuildProfile.stage("invert"):
+            Indexer.title_store.add(docid, title, field_lengths)
+            Indexer.no_of_docs += 1
+            for field in field_lengths:
+                Indexer.total_field_lengths[field] += field_lengths[field]
+            Indexer.spimi(docid, termid_freq_map, termid_positions_map)
+        BuildProfile.count("pages")
+        BuildProfile.count("tokens", sum(field_lengths.values()))
+        BuildProfile.count("postings", len(termid_freq_map))
+        BuildProfile.progress()
+
+    @staticmethod
+    def spimi(docid, termid_freq_map, termid_positions_map=None):
+        """
+        Invert a single document into the current block, along with the positions of its terms if given.
+        The block is flushed to disk once it holds INDEX_BLOCK_MAX_SIZE postings.
+        """
+        docid = int(docid)  # docids come as strings from the dump
+        Indexer.block_positional = termid_positions_map is not None
+        for termid, freqs in termid_freq_map.items():
+            mask = 0
+            for field_no, freq in enumerate(freqs):
+                if freq:
+                    mask |= 1 << field_no
+            values = Indexer.block[termid]
+            values.append(docid)
+            values.append(mask)
+            values.extend([freq for freq in freqs if freq])
+            if termid_positions_map is not None:
+                for field_positions in termid_positions_map[termid]:
+                    values.extend(field_positions)  # empty for the fields not in mask
+        Indexer.block_size += len(termid_freq_map)
+
+        if Indexer.block_size >= INDEX_BLOCK_MAX_SIZE:
+            Indexer.flush_block()
+
+    @staticmethod
+    def flush_block():
+        if not Indexer.block:
+            return
+
+        path = f"{Indexer.index_dir}/{constants.BLOCK_FILE_NAME.format(len(Indexer.block_paths))}"
+        log.debug("Writing block %s with %d postings", path, Indexer.block_size)
+        with BuildProfile.stage("flush_block"):
+            with open(path, "wb") as fp:
+                for termid in sorted(Indexer.block):
+                    values = Indexer.block[termid]
+                    fp.write(BLOCK_RUN.pack(termid, len(values), Indexer.block_positional))
+                    values.tofile(fp)
+        BuildProfile.count("blocks")
+        BuildProfile.count("block_bytes", os.path.getsize(path))
+
+        Indexer.block_paths.append(path)
+        Indexer.block = defaultdict(lambda: array("I"))
+        Indexer.block_size = 0
+
+    @staticmethod
+    def iter_block_postings(values, positional):
+        """Yields (docid, mask, tfs, positions in each field or None) for every posting packed in values."""
+        i = 0
+        while i < len(values):
+            docid, mask = values[i], values[i + 1]
+            tfs = tuple(values[i + 2:i + 2 + POPCOUNT[mask]])
+            i += 2 + len(tfs)
+            positions = None
+            if positional:
+                positions = []
+                for tf in tfs:
+                    positions.append(values[i:i + tf].tolist())
+                    i += tf
+            yield docid, mask, tfs, positions
+
+    @staticmethod
+    def read_block(fp):
+        """Yields (termid, (array of the postings of termid, whether they hold positions)) for every run of a block."""
+        while True:
+            header = fp.read(BLOCK_RUN.size)
+            if not header:
+                return
+            termid, size, positional = BLOCK_RUN.unpack(header)
+            values = array("I")
+            values.fromfile(fp, size)
+            yield termid, (values, positional)
+
+    @staticmethod
+    def merge_blocks(writer):
+        """
+        Flush the last (partial) block and k-way merge all blocks into the postings writer.
+        Blocks are read as streams, so only the postings of one term per block are held in memory at a time.
+        The title store must have been written (closed) already.
+        """
+        Indexer.flush_block()
+
+        # needed to compute the max. BM25 tf component of every posting list
+        avg_field_lengths = Indexer.get_avg_field_lengths()
+        title_store = TitleStore(Indexer.index_dir)
+        block_fps = [open(path, "rb") for path in Indexer.block_paths]
+        try:
+            # heapq.merge is stable, so postings of a termid spread over several blocks
+            # are concatenated in block (i.e. document) order
+            merged = heapq.merge(*[Indexer.read_block(fp) for fp in block_fps], key=lambda entry: entry[0])
+
+            current_termid, current_postings = None, []
+            for termid, postings in merged:
+                if termid != current_termid and current_postings:
+                    Indexer.write_postings(writer, current_termid, current_postings, title_store, avg_field_lengths)
+                    current_postings = []
+                current_termid = termid
+                current_postings.append(postings)
+
+            if current_postings:
+                Indexer.write_postings(writer, current_termid, current_postings, title_store, avg_field_lengths)
+        finally:
+            for block_fp in block_fps:
+                block_fp.close()
+            title_store.close()
+
+        for path in Indexer.block_paths:
+            os.remove(path)
+        Indexer.block_paths = []
+
+    @staticmethod
+    def write_postings(writer, termid, block_postings, title_store, avg_field_lengths):
+        """block_postings holds the postings of termid read from every block, see read_block()"""
+        postings = []
+        for values, positional in block_postings:
+            for docid, mask, tfs, positions in Indexer.iter_block_postings(values, positional):
+                postings.append(((docid, mask, tfs), positions))
+        # docids need to be sorted for gap encoding, dumps are not guaranteed to be in docid order
+        postings.sort(key=lambda posting: posting[0][0])
+        positions = [posting_positions for _, posting_positions in postings]
+        Indexer.add_postings(writer, termid, [posting for posting, _ in postings], title_store,
+                             avg_field_lengths, None if None in positions else positions)
+
+    @staticmethod
+    def add_postings(writer, termid, postings, title_store, avg_field_lengths, positions=None):
+        """
+        Write the sorted (docid, mask, tfs) postings of termid along with the document frequency
+        and the max. BM25 tf component of the term in each field, and their positions if given.
+        Field lengths are read from title_store, the TitleStore of the documents.
+        """
+        field_counts = [0] * len(constants.FIELDS)
+        max_scores = [0.0] * len(constants.FIELDS)
+        avg_lengths = [avg_field_lengths[field] or 1 for field in constants.FIELDS]
+        position = 0
+        for docid, mask, tfs in postings:
+            # postings and title store entries are both in docid order: search only the entries after the last one
+            position = title_store.position(docid, position)
+            lengths = title_store.get_lengths(position)
+            i = 0
+            for field_no in range(len(constants.FIELDS)):
+                if mask & (1 << field_no):
+                    field_counts[field_no] += 1
+                    max_scores[field_no] = max(max_scores[field_no],
+                                               bm25_tf(tfs[i], lengths[field_no], avg_lengths[field_no]))
+                    i += 1
+
+        BuildProfile.count("terms")
+        writer.add(termid, [docid for docid, _, _ in postings], [mask for _, mask, _ in postings],
+                   [tfs for _, _, tfs in postings], field_counts, max_scores, positions)
+
+    @staticmethod
+    def get_avg_field_lengths():
+        return {field: Indexer.total_field_lengths[field] / Indexer.no_of_docs if Indexer.no_of_docs else 0
+                for field in constants.FIELDS}
+
+    @staticmethod
+    def write_stats(index_dir, no_of_docs=None, avg_field_lengths=None):
+        """
+        Collection statistics needed for BM25: no. of documents and average length of each field.
+        Those of the documents added so far unless given.
+        """
+        if no_of_docs is None:
+            no_of_docs, avg_field_lengths = Indexer.no_of_docs, Indexer.get_avg_field_lengths()
+        with open(f"{index_dir}/{constants.STATS_FILE_NAME}", "w") as fp:
+            print(f"no_of_docs:{no_of_docs}", file=fp)
+            for field in constants.FIELDS:
+                print(f"avg_length_{field}:{avg_field_lengths[field]!r}", file=fp)
@@ -0,0 +1,80 @@
+import bisect
+import math
+import time
+from collections import deque
+
+# Latency percentiles over the most recent LATENCY_WINDOW_SIZE samples, so that a long-running server reports
+# its current latencies rather than those of its whole life. Samples are sorted only when stats are asked for.
+# A LatencyHistogram instead counts every sample ever recorded in buckets of exponentially growing latencies,
+# in constant memory, its percentiles being the upper bound of the bucket they fall in.
+
+LATENCY_WINDOW_SIZE = 10000
+HISTOGRAM_BUCKETS_MS = [0.1, 0.25, 0.5, 1, 2.5, 5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000, 10000]
+
+
+def percentile(sorted_samples, p):
+    """Nearest-rank p-th percentile (0 < p <= 100) of sorted samples, 0 if there are none."""
+    if not sorted_samples:
+        return 0.0
+    return sorted_samples[max(0, math.ceil(p / 100 * len(sorted_samples)) - 1)]
+
+
+class LatencyWindow:
+    def __init__(self, size=LATENCY_WINDOW_SIZE):
+        self.samples = deque(maxlen=size)  # seconds
+        self.count = 0  # no. of samples recorded so far, including those out of the window
+        self.started = time.perf_counter()
+
+    def record(self, seconds):
+        self.samples.append(seconds)
+        self.count += 1
+
+    def stats(self):
+        samples = sorted(self.samples)
+        elapsed = time.perf_counter() - self.started
+        return {
+            "count": self.count,
+            "per_sec": self.count / elapsed if elapsed else 0.0,
+            "mean_ms": 1000 * sum(samples) / len(samples) if samples else 0.0,
+            "p50_ms": 1000 * percentile(samples, 50),
+            "p99_ms": 1000 * percentile(samples, 99),
+            "max_ms": 1000 * samples[-1] if samples else 0.0,
+        }
+
+
+class LatencyHistogram:
+    def __init__(self, buckets_ms=HISTOGRAM_BUCKETS_MS):
+        self.buckets_ms = buckets_ms  # upper bounds, samples above the last one go to an overflow bucket
+        self.counts = [0] * (len(buckets_ms) + 1)
+        self.count = 0
+        self.total = 0.0  # seconds
+        self.max = 0.0
+
+    def record(self, seconds):
+        self.counts[bisect.bisect_left(self.buckets_ms, 1000 * seconds)] += 1
+        self.count += 1
+        self.total += seconds
+        self.max = max(self.max, seconds)
+
+    def percentile_ms(self, p):
+        """Upper bound of the bucket of the nearest-rank p-th percentile, the max. for the overflow bucket."""
+        if not self.count:
+            return 0.0
+        rank = max(1, math.ceil(p / 100 * self.count))
+        seen = 0
+        for bucket, count in enumerate(self.counts):
+            seen += count
+            if seen >= rank:
+                return self.buckets_ms[bucket] if bucket < len(self.buckets_ms) else 1000 * self.max
+        return 1000 * self.max
+
+    def stats(self):
+        return {
+            "count": self.count,
+            "mean_ms": 1000 * self.total / self.count if self.count else 0.0,
+            "p50_ms": self.percentile_ms(50),
+            "p99_ms": self.percentile_ms(99),
+            "max_ms": 1000 * self.max,
+            # upper bound (ms) => no. of samples, "inf" for the overflow bucket
+            "buckets": {str(bound): count for bound, count in zip(self.buckets_ms + ["inf"], self.counts)},
+        }
@@ -1,22 +1,37 @@
+import bz2
+import gzip
 import logging as log
 import xml.sax
+from collections import namedtuple
 
+from src.buildprofile import BuildProfile
 from src.helpers import Helpers
 from src.indexer import Indexer
 from src.tokenizer import Tokenizer
 
+# The dump is parsed as a stream of Page records:
+#  the SAX handler only collects the id, title and text of each page, it does not tokenize or index anything,
+#  so the pages can be consumed one by one, in batches, or handed to other processes (see src/pipeline.py).
+#  The dump is fed to the parser READ_CHUNK_SIZE bytes at a time and the pages completed by each chunk are
+#  yielded right away, so memory use does not depend on the size of the dump.
+#  .bz2 and .gz dumps are decompressed on the fly (see src/dumps.py for parallel reading of multistream dumps).
+
+READ_CHUNK_SIZE = 1 << 20
+
+Page = namedtuple("Page", ["id", "title", "text"])
+
 
 class WikipediaHandler(xml.sax.ContentHandler):
     def __init__(self):
-        self.tokenizer = None
+        super().__init__()
         self.tag = None
+        self.pages = []  # completed pages, drained by iter_pages()
+
         # title and text and id(documentID) are available as field
-        self.title = ""
+        # character data may arrive in many chunks, they are collected in lists and joined once per page
+        self.title = []
         self.text = []
-        self.id = ""
-
-        # need extra processing for following fields:-
-        # infobox , categories , external , references
+        self.id = []
 
         # Some booleans to determine nesting
         # there is another tag named id which is nested inside revision tag
@@ -28,42 +43,17 @@ class WikipediaHandler(xml.sax.ContentHandler):
         Signals the start of an element in non-namespace mode.
         """
         self.tag = tag  # for identification in characters() method
-        if tag == "title":
-            log.debug("%s start", tag)
-            self.title = ""  # reset for new title
-        elif tag == "text":
-            log.debug("%s start", tag)
-            self.text = ""  # reset for new text
+        if tag == "page":
+            self.title, self.text, self.id = [], [], []
         elif tag == "revision":
-            log.debug("%s start", tag)
             self.insideRevision = True
-        elif tag == "id":
-            log.debug("%s start", tag)
 
     def endElement(self, tag):
         """
         Signals the end of an element in non-namespace mode.
         """
-        if tag == "title":
-            # initialize a new document with title ==self.title
-            self.tokenizer = Tokenizer(self.title)
-            self.tokenizer.set_title(self.title)
-
-        elif tag == "text":
-            # By now the document title and id fields must have been extracted
-            Helpers.docid_docname_map[self.tokenizer.get_doc_id()] = self.tokenizer.get_title()
-            # add text body to that document    # TODO: use append
-            termid_freq_map = self.tokenizer.tokenize(self.text)
-
-            # print("term_termid_map", Helpers.term_termid_map)
-            for term in termid_freq_map:
-                # accumulate (termid: docid) pairs
-                Indexer.termid_docid_list.append((term, self.tokenizer.get_doc_id()))
-
-        elif tag == "id" and not self.insideRevision:
-            # DoNOT set id if inside <revision> <id>XXX</id>
-            self.tokenizer.set_doc_id(self.id)
-
+        if tag == "page":
+            self.pages.append(Page("".join(self.id), "".join(self.title), "".join(self.text)))
         elif tag == "revision":
             self.insideRevision = False  # </revision> encountered
 
@@ -78,24 +68,74 @@ class WikipediaHandler(xml.sax.ContentHandler):
         or they may split it into several chunks;
         """
         if self.tag == "title":
-            self.title = content
+            self.title.append(content)
         elif self.tag == "text":
-            # Using append instead of assignment to handle case where text is received in multiple chunks
-            self.text += content
+            self.text.append(content)
         elif self.tag == "id" and not self.insideRevision:
-            self.id = content
+            # DoNOT set id if inside <revision> <id>XXX</id>
+            self.id.append(content)
+
+
+def open_dump(path):
+    """Opens the dump at path for reading bytes, decompressing it if it ends with .bz2 or .gz"""
+    if path.endswith(".bz2"):
+        return bz2.open(path, "rb")  # also reads multistream dumps, one stream after the other
+    if path.endswith(".gz"):
+        return gzip.open(path, "rb")
+    return open(path, "rb")
+
+
+def iter_pages(source, chunk_size=READ_CHUNK_SIZE):
+    """Yields a Page for every page of the dump. source is a path or an already open (text or binary) file."""
+    if isinstance(source, str):
+        with open_dump(source) as fp:
+            yield from iter_pages(fp, chunk_size)
+        return
+
+    parser = xml.sax.make_parser()
+    parser.setFeature(xml.sax.handler.feature_namespaces, 0)
+    handler = WikipediaHandler()
+    parser.setContentHandler(handler)
+
+    while True:
+        chunk = source.read(chunk_size)
+        if not chunk:
+            break
+        parser.feed(chunk)
+        if handler.pages:
+            yield from handler.pages
+            handler.pages = []
+    parser.close()
+    yield from handler.pages
+
+
+def tokenize_page(page):
+    """
+    Returns (docid, title, {termid: freq}, {field: no. of terms}, {termid: positions in each field}) of page,
+    the positions being None unless Tokenizer.positional.
+    """
+    misses = Helpers.stemmer.cache.misses
+    with BuildProfile.stage("tokenize"):
+        tokenizer = Tokenizer(page.title)
+        tokenizer.set_doc_id(page.id)
+        termid_freq_map = tokenizer.tokenize(page.text)
+    BuildProfile.add_time("stem", tokenizer.stem_time, tokenizer.stem_cpu_time)
+    BuildProfile.count("stem_misses", Helpers.stemmer.cache.misses - misses)
+    termid_positions_map = tokenizer.termid_positions_map if Tokenizer.positional else None
+    return tokenizer.get_doc_id(), tokenizer.get_title(), termid_freq_map, tokenizer.field_lengths, \
+        termid_positions_map
+
+
+def as_pages(source):
+    """Page records of source: a dump path, an open file or an iterable of Page records."""
+    if isinstance(source, str) or hasattr(source, "read"):
+        return iter_pages(source)
+    return source
 
 
 class XMLParser:
-    def parse(self, path):
-        # Create a XMLReader
-        parser = xml.sax.make_parser()
-
-        # turn off namespaces
-        parser.setFeature(xml.sax.handler.feature_namespaces, 0)
-
-        # override the default ContextHandler
-        handler = WikipediaHandler()
-        parser.setContentHandler(handler)
-
-        parser.parse(path)
+    def parse(self, source):
+        """Parse, tokenize and index every page of source (see as_pages()), one page at a time."""
+        for page in as_pages(source):
+            Indexer.add_document(*tokenize_page(page))
+            log.debug("Indexed page %s", page.id)
@@ -0,0 +1,88 @@
+import logging as log
+import multiprocessing
+
+from src import constants
+from src.buildprofile import BuildProfile
+from src.helpers import Helpers
+from src.indexer import Indexer
+from src.parser import as_pages, tokenize_page
+from src.stemmer import CachedStemmer
+from src.tokenizer import Tokenizer
+
+# Parallel indexing:
+#  the reader (main process) parses the dump into Page records (src/parser.py) and groups them in batches,
+#  a pool of worker processes tokenizes and stems each batch using a private term dictionary,
+#  and the main process remaps the per-batch termids to global termids before inverting the documents.
+#  Batches are consumed in dump order so posting lists stay in document order.
+
+PAGE_BATCH_SIZE = 500
+
+
+def batched(pages, batch_size=PAGE_BATCH_SIZE):
+    """Group an iterable of pages into lists of batch_size pages."""
+    batch = []
+    for page in pages:
+        batch.append(page)
+        if len(batch) == batch_size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def init_worker(stem_cache_size, stem_table_path, positional):
+    Helpers.load_stopwords(constants.STOPWORDS_FILE_PATH)
+    Tokenizer.positional = positional
+    Helpers.stemmer = CachedStemmer(stem_cache_size, record_new_stems=True)
+    if stem_table_path:
+        Helpers.stemmer.load_table(stem_table_path)
+
+
+def tokenize_batch(pages):
+    """
+    Runs inside a worker process.
+    Returns the batch-local term dictionary as a list (local termid i is terms[i - 1]),
+    (docid, title, {local termid: [freq in each field]}, {field: length}, {local termid: positions} or None)
+    for each page
+    the stems computed along with the stem cache hits and misses of this batch,
+    and the stages and counters of this batch (see src/buildprofile.py).
+    """
+    Helpers.term_termid_map.clear()  # termids are local to this batch
+    hits, misses = Helpers.stemmer.cache.hits, Helpers.stemmer.cache.misses
+
+    documents = []
+    for page in pages:
+        docid, title, termid_freq_map, field_lengths, termid_positions_map = tokenize_page(page)
+        if termid_positions_map is not None:
+            termid_positions_map = dict(termid_positions_map)
+        documents.append((docid, title, dict(termid_freq_map), dict(field_lengths), termid_positions_map))
+
+    stems = (Helpers.stemmer.pop_new_stems(), Helpers.stemmer.cache.hits - hits, Helpers.stemmer.cache.misses - misses)
+    return list(Helpers.term_termid_map), documents, stems, BuildProfile.pop_stages()
+
+
+def index_parallel(source, workers, batch_size=PAGE_BATCH_SIZE, stem_table_path=None):
+    """Index the pages of source (a dump path, an open file or an iterable of Page records) using workers processes."""
+    pages = as_pages(source)
+    with multiprocessing.Pool(workers, initializer=init_worker,
+                              initargs=(Helpers.stemmer.cache.maxsize, stem_table_path, Tokenizer.positional)) as pool:
+        for terms, documents, stems, profile in pool.imap(tokenize_batch, batched(pages, batch_size)):
+            Helpers.stemmer.merge(*stems)
+            BuildProfile.merge(*profile)
+
+            # remap batch-local termids to global termids
+            termids = []
+            with BuildProfile.stage("remap_termids"):
+                for term in terms:
+                    Helpers.addto_term_termid_map(term)
+                    termids.append(Helpers.get_termid(term))
+
+            for doc_id, title, termid_freq_map, field_lengths, termid_positions_map in documents:
+                if termid_positions_map is not None:
+                    termid_positions_map = {termids[termid - 1]: positions
+                                            for termid, positions in termid_positions_map.items()}
+                Indexer.add_document(doc_id, title,
+                                     {termids[termid - 1]: freqs for termid, freqs in termid_freq_map.items()},
+                                     field_lengths, termid_positions_map)
+
+            log.debug("Indexed batch of %d pages", len(documents))
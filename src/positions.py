@@ -0,0 +1,177 @@
+import mmap
+import os
+import struct
+
+from src import constants
+from src.compression import encode_varint, decode_varint, SKIP_INTERVAL
+
+# Positional index (optional, build_index.py --positions):
+#  the position of a term in a field is the no. of terms (stopwords removed) before it in that field,
+#  so "bank of america" matches the query terms bank america at consecutive positions.
+#
+# positions.bin holds one list per termid, aligned with its posting list (see src/postings.py):
+#  varint(no. of bytes of every block of SKIP_INTERVAL postings) followed by the blocks, a block holding
+#  for every posting, for every field of its mask, the gaps between its sorted positions in that field.
+#  The no. of positions of a posting in a field is its term frequency there, so it is not stored.
+#  A cursor on a posting finds its positions by decoding the block of the posting only.
+# positions-offsets.bin holds one POSITIONS_OFFSET_ENTRY (byte offset, no. of bytes) per termid.
+#
+# Phrase and proximity (NEAR/k) operators are answered by positional intersection (see positional_match()).
+
+POSITIONS_OFFSET_ENTRY = struct.Struct("<QI")
+
+
+def encode_positions(positions):
+    """positions holds, for every posting, the sorted positions of the term in each field of its mask."""
+    blocks = []
+    for start in range(0, len(positions), SKIP_INTERVAL):
+        gaps = []
+        for doc_positions in positions[start:start + SKIP_INTERVAL]:
+            for field_positions in doc_positions:
+                prev = 0
+                for position in field_positions:
+                    gaps.append(position - prev)
+                    prev = position
+        blocks.append(encode_varint(gaps))
+    return encode_varint([len(block) for block in blocks]) + b"".join(blocks)
+
+
+def decode_positions_block(buf, block, count):
+    """
+    Returns the flat list of position gaps of the block-th block of the encoded list in buf,
+    count being the no. of postings of the list.
+    """
+    sizes, offset = decode_varint(buf, 0, -(-count // SKIP_INTERVAL))
+    offset += sum(sizes[:block])
+    return decode_varint(buf[offset:offset + sizes[block]])[0]
+
+
+def split_positions(gaps, start, tfs):
+    """Positions in each field of a posting whose tfs are tfs and whose gaps start at gaps[start]."""
+    positions = []
+    for tf in tfs:
+        field_positions = []
+        position = 0
+        for gap in gaps[start:start + tf]:
+            position += gap
+            field_positions.append(position)
+        positions.append(field_positions)
+        start += tf
+    return positions
+
+
+class PositionsWriter:
+    def __init__(self, index_dir):
+        self.fp = open(f"{index_dir}/{constants.POSITIONS_FILE_NAME}", "wb")
+        self.offsets_fp = open(f"{index_dir}/{constants.POSITIONS_OFFSETS_FILE_NAME}", "wb")
+        self.offset = 0
+        self.last_termid = 0
+
+    def add(self, termid, positions):
+        payload = encode_positions(positions)
+        self.fp.write(payload)
+        # termids are added in increasing order, termids without postings get an empty entry
+        self.offsets_fp.write(POSITIONS_OFFSET_ENTRY.pack(0, 0) * (termid - self.last_termid - 1))
+        self.offsets_fp.write(POSITIONS_OFFSET_ENTRY.pack(self.offset, len(payload)))
+        self.last_termid = termid
+        self.offset += len(payload)
+
+    def close(self):
+        self.fp.close()
+        self.offsets_fp.close()
+
+
+class MappedPositions:
+    """Decodes the positions of single postings out of a memory-mapped positions file."""
+
+    def __init__(self, index_dir):
+        self.positions = self.offsets = None
+        with open(f"{index_dir}/{constants.POSITIONS_FILE_NAME}", "rb") as fp:
+            if fp.seek(0, 2):  # mmap can't map an empty file
+                self.positions = mmap.mmap(fp.fileno(), 0, access=mmap.ACCESS_READ)
+        with open(f"{index_dir}/{constants.POSITIONS_OFFSETS_FILE_NAME}", "rb") as fp:
+            if fp.seek(0, 2):
+                self.offsets = mmap.mmap(fp.fileno(), 0, access=mmap.ACCESS_READ)
+
+    @staticmethod
+    def exists(index_dir):
+        return os.path.exists(f"{index_dir}/{constants.POSITIONS_FILE_NAME}")
+
+    def get_buffer(self, termid):
+        """Zero-copy view of the encoded positions of termid."""
+        offset, size = POSITIONS_OFFSET_ENTRY.unpack_from(self.offsets, (termid - 1) * POSITIONS_OFFSET_ENTRY.size)
+        return memoryview(self.positions)[offset:offset + size]
+
+    def read(self, termid, tfs):
+        """Returns the positions of every posting of termid, whose term frequencies are tfs."""
+        buf = self.get_buffer(termid)
+        positions = []
+        for block, start in enumerate(range(0, len(tfs), SKIP_INTERVAL)):
+            gaps = decode_positions_block(buf, block, len(tfs))
+            offset = 0
+            for doc_tfs in tfs[start:start + SKIP_INTERVAL]:
+                positions.append(split_positions(gaps, offset, doc_tfs))
+                offset += sum(doc_tfs)
+        return positions
+
+    def close(self):
+        for mapped in (self.positions, self.offsets):
+            if mapped:
+                mapped.close()
+
+
+class PositionList:
+    """
+    Positions of the postings of a term, for a cursor over its posting list.
+    The gaps of the last block asked for are kept, cursors move forward and mostly ask for the same block.
+    """
+
+    def __init__(self, buf, count):
+        self.buf = buf
+        self.count = count
+        self.block = -1
+        self.gaps = []
+
+    def get(self, block, tfs, block_start, index):
+        """
+        Positions in each field of the posting whose tfs are tfs[index],
+        the postings of its block starting with tfs[block_start].
+        """
+        if block != self.block:
+            self.gaps = decode_positions_block(self.buf, block, self.count)
+            self.block = block
+        return split_positions(self.gaps, sum(sum(doc_tfs) for doc_tfs in tfs[block_start:index]), tfs[index])
+
+
+def get_field_positions(mask, positions, field_mask=None):
+    """{field no.: positions} of a posting from its mask and positions, only the fields of field_mask if given."""
+    field_positions = {}
+    i = 0
+    for field_no in range(len(constants.FIELDS)):
+        if mask & (1 << field_no):
+            if field_mask is None or field_mask & (1 << field_no):
+                field_positions[field_no] = positions[i]
+            i += 1
+    return field_positions
+
+
+def positional_match(position_lists, windows):
+    """
+    Whether there are positions p1 in position_lists[0], p2 in position_lists[1]... such that
+    lo <= p(i + 1) - p(i) <= hi for windows[i] = (lo, hi): (1, 1) for a phrase, (-k, k) for NEAR/k.
+    Each list is merged once with the positions of the previous term that can still start a match.
+    """
+    matches = position_lists[0]
+    for positions, (lo, hi) in zip(position_lists[1:], windows):
+        next_matches = []
+        i = 0
+        for position in positions:
+            # the previous positions x with lo <= position - x <= hi are in [position - hi, position - lo]
+            while i < len(matches) and matches[i] < position - hi:
+                i += 1
+            if i < len(matches) and matches[i] <= position - lo:
+                next_matches.append(position)
+        if not next_matches:
+            return False
+        matches = next_matches
+    return bool(matches)
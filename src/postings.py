@@ -0,0 +1,194 @@
+import mmap
+import os
+import struct
+
+from src import compression
+from src import constants
+from src.compression import encode_varint, decode_varint
+from src.positions import PositionsWriter
+
+# A term has a single posting list covering all fields: every posting holds a docid, the mask of the fields
+#  of the document the term occurs in (bit i => i-th field of constants.FIELDS) and the term frequency in
+#  each of those fields. Field queries read the same list and skip postings whose mask misses their fields.
+#
+# Binary postings file format:
+#  header: POSTINGS_MAGIC followed by one byte identifying the codec
+#  then for every term: varint(termid) varint(no. of docids) varint(no. of bytes)
+#  <encoded docid gaps, field masks and tfs>
+# The offsets file holds one fixed-width OFFSET_ENTRY per termid (termid 1 at position 0)
+#  locating the encoded posting list of that term inside the postings file, so that a single
+#  posting list can be decoded from a memory-mapped postings file without reading the rest of it.
+#  It also holds, for every field, the document frequency of the term in that field and the maximum BM25 tf
+#  component over the postings of that field, an upper bound used for dynamic pruning.
+# The text format (termid:docid1;mask1;tf1;tf2,docid2;mask2;tf1,...) is kept around for debugging.
+# Positions, when indexed, go to their own files (see src/positions.py), only binary postings have them.
+
+TEXT = "text"
+POSTINGS_MAGIC = b"IREPOST"
+CODEC_IDS = {
+    compression.VARINT: 0,
+    compression.GAMMA: 1,
+}
+# byte offset of encoded posting list, no. of docids, no. of bytes,
+# document frequency in each of constants.FIELDS, max. BM25 tf component in each of constants.FIELDS
+OFFSET_ENTRY = struct.Struct(f"<QII{len(constants.FIELDS)}I{len(constants.FIELDS)}d")
+EMPTY_OFFSET_ENTRY = OFFSET_ENTRY.pack(0, 0, 0, *[0] * len(constants.FIELDS), *[0.0] * len(constants.FIELDS))
+
+
+def unpack_offset_entry(buf, termid):
+    """Returns (offset, no. of docids, no. of bytes, document frequencies, max. BM25 tf components) of termid."""
+    entry = OFFSET_ENTRY.unpack_from(buf, (termid - 1) * OFFSET_ENTRY.size)
+    no_of_fields = len(constants.FIELDS)
+    return entry[0], entry[1], entry[2], entry[3:3 + no_of_fields], entry[3 + no_of_fields:]
+
+
+class PostingsWriter:
+    def __init__(self, path, codec=compression.VARINT, offsets_path=None, positions_dir=None):
+        self.codec = codec
+        self.positions_writer = PositionsWriter(positions_dir) if positions_dir else None
+        self.fp = open(path, "wb")
+        self.fp.write(POSTINGS_MAGIC + bytes([CODEC_IDS[codec]]))
+        self.offset = len(POSTINGS_MAGIC) + 1
+        self.offsets_fp = open(offsets_path, "wb") if offsets_path else None
+        self.last_termid = 0
+
+    def add(self, termid, docids, masks, tfs, field_counts, max_scores, positions=None):
+        payload = compression.encode_postings(docids, masks, tfs, self.codec)
+        if self.positions_writer:
+            self.positions_writer.add(termid, positions)
+        header = encode_varint((termid, len(docids), len(payload)))
+        self.fp.write(header)
+        self.fp.write(payload)
+
+        if self.offsets_fp:
+            # termids are added in increasing order, termids without postings get an empty entry
+            self.offsets_fp.write(EMPTY_OFFSET_ENTRY * (termid - self.last_termid - 1))
+            self.offsets_fp.write(OFFSET_ENTRY.pack(self.offset + len(header), len(docids), len(payload),
+                                                    *field_counts, *max_scores))
+            self.last_termid = termid
+        self.offset += len(header) + len(payload)
+
+    def close(self):
+        self.fp.close()
+        if self.offsets_fp:
+            self.offsets_fp.close()
+        if self.positions_writer:
+            self.positions_writer.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+class TextPostingsWriter(PostingsWriter):
+    def __init__(self, path):
+        self.fp = open(path, "w")
+        self.offsets_fp = None
+        self.positions_writer = None
+
+    def add(self, termid, docids, masks, tfs, field_counts, max_scores, positions=None):
+        # format=> termid:docid1;mask1;tf1;tf2,docid2;mask2;tf1....\n
+        postings = constants.DOCIDS_SEP.join(format_posting(docid, mask, doc_tfs)
+                                             for docid, mask, doc_tfs in zip(docids, masks, tfs))
+        print(f"{termid}{constants.TERM_POSTINGS_SEP}{postings}", file=self.fp)
+
+
+def format_posting(docid, mask, tfs):
+    """docid;mask;tf1;tf2... as written to text postings"""
+    return constants.TF_SEP.join([str(docid), str(mask)] + [str(tf) for tf in tfs])
+
+
+def parse_posting(posting):
+    """Returns the docid, field mask and tfs of a posting formatted by format_posting()"""
+    numbers = [int(number) for number in posting.split(constants.TF_SEP)]
+    return numbers[0], numbers[1], tuple(numbers[2:])
+
+
+def postings_writer(index_dir, postings_format=constants.POSTINGS_FORMAT, positional=False):
+    """positional => the positions of the postings are written as well (binary formats only)"""
+    if postings_format == TEXT:
+        return TextPostingsWriter(f"{index_dir}/{constants.POSTINGS_FILE_NAME}")
+    return PostingsWriter(f"{index_dir}/{constants.BINARY_POSTINGS_FILE_NAME}", postings_format,
+                          f"{index_dir}/{constants.POSTINGS_OFFSETS_FILE_NAME}", index_dir if positional else None)
+
+
+class MappedPostings:
+    """
+    Lazily decodes posting lists out of a memory-mapped binary postings file.
+    Only the offsets entry and the encoded docids of a requested termid are ever touched.
+    """
+
+    def __init__(self, index_dir):
+        with open(f"{index_dir}/{constants.BINARY_POSTINGS_FILE_NAME}", "rb") as fp:
+            self.postings = mmap.mmap(fp.fileno(), 0, access=mmap.ACCESS_READ)
+        with open(f"{index_dir}/{constants.POSTINGS_OFFSETS_FILE_NAME}", "rb") as fp:
+            self.offsets = mmap.mmap(fp.fileno(), 0, access=mmap.ACCESS_READ)
+
+        if self.postings[:len(POSTINGS_MAGIC)] != POSTINGS_MAGIC:
+            raise ValueError(f"{index_dir}/{constants.BINARY_POSTINGS_FILE_NAME} is not a postings file")
+        self.codec = {codec_id: codec for codec, codec_id in CODEC_IDS.items()}[self.postings[len(POSTINGS_MAGIC)]]
+
+    def get(self, termid):
+        if termid is None or termid < 1 or termid * OFFSET_ENTRY.size > len(self.offsets):
+            return None
+        offset, count, size, _, _ = unpack_offset_entry(self.offsets, termid)
+        if count == 0:
+            return None
+        return self.decode(offset, size, count)
+
+    def get_max_scores(self, termid):
+        if termid is None or termid < 1 or termid * OFFSET_ENTRY.size > len(self.offsets):
+            return (0.0,) * len(constants.FIELDS)
+        return unpack_offset_entry(self.offsets, termid)[4]
+
+    def get_buffer(self, offset, size):
+        """Zero-copy view of an encoded posting list, for cursors that decode it block by block."""
+        return memoryview(self.postings)[offset:offset + size]
+
+    def decode(self, offset, size, count):
+        """Returns the docids, field masks and term frequencies of the posting list."""
+        return compression.decode_postings(self.postings[offset:offset + size], count, self.codec)
+
+    def close(self):
+        self.postings.close()
+        self.offsets.close()
+
+
+def read_postings(index_dir):
+    """
+    Yield (termid, [docid1, docid2, ...], [mask1, mask2, ...], [(tfs of docid1), ...])
+    from whichever postings file exists in index_dir.
+    """
+    binary_path = f"{index_dir}/{constants.BINARY_POSTINGS_FILE_NAME}"
+    if not os.path.exists(binary_path):
+        yield from read_text_postings(f"{index_dir}/{constants.POSTINGS_FILE_NAME}")
+        return
+
+    with open(binary_path, "rb") as fp:
+        buf = fp.read()
+
+    if not buf.startswith(POSTINGS_MAGIC):
+        raise ValueError(f"{binary_path} is not a postings file")
+    codec = {codec_id: codec for codec, codec_id in CODEC_IDS.items()}[buf[len(POSTINGS_MAGIC)]]
+
+    offset = len(POSTINGS_MAGIC) + 1
+    while offset < len(buf):
+        (termid, count, size), offset = decode_varint(buf, offset, 3)
+        docids, masks, tfs = compression.decode_postings(buf[offset:offset + size], count, codec)
+        yield termid, docids, masks, tfs
+        offset += size
+
+
+def read_text_postings(path):
+    with open(path, "r") as fp:
+        for line in fp:
+            termid, postings = line.rstrip("\n").split(constants.TERM_POSTINGS_SEP)
+            docids, masks, tfs = [], [], []
+            for posting in postings.split(constants.DOCIDS_SEP):
+                docid, mask, doc_tfs = parse_posting(posting)
+                docids.append(docid)
+                masks.append(mask)
+                tfs.append(doc_tfs)
+            yield int(termid), docids, masks, tfs
@@ -0,0 +1,128 @@
+import cProfile
+import io
+import json
+import logging as log
+import pstats
+import time
+from collections import defaultdict
+
+from src.latency import LatencyHistogram
+
+# Query-time instrumentation (search.py and server.py --profile-queries):
+#  QueryProfiler.attach(search) wraps the methods of that Search instance (and of no other) that make up the phases
+#  of a query, so a Search without a profiler runs exactly the code it runs without instrumentation.
+#  The time of each phase excludes that of the phases it calls, e.g. postings excludes the lookups done by
+#  get_cursors(), so the phases of a query add up to its latency. Every query answered (Search.answer()) is
+#  recorded in a latency histogram of its type; those slower than slow_query_ms are logged along with their phases
+#  (and appended as a JSON line to slow_query_log if given).
+#  With cprofile_every = n, every n-th query runs under cProfile, whose statistics are written by dump_cprofile().
+
+SLOW_QUERY_MS = 100
+CPROFILE_TOP = 25  # no. of functions logged by dump_cprofile()
+
+# phase => method of Search
+PHASES = {
+    "cache": "search",  # result cache lookup
+    "terms": "get_terms",  # normalization, stopword removal and stemming
+    "lookup": "lookup",  # term dictionary lookups in every segment
+    "postings": "get_cursors",  # posting list fetches (or skip tables when lazy) and cursors over them
+    "scoring": "score_postings",  # decoding and scoring of whole posting lists (exhaustive evaluation)
+    "evaluate": "evaluate",  # query parsing, WAND / intersection of the cursors, merging of the results
+    "titles": "get_doc_names_from_ids",  # title resolution
+}
+
+
+class QueryProfiler:
+    def __init__(self, slow_query_ms=SLOW_QUERY_MS, slow_query_log=None, cprofile_every=0):
+        self.slow_query_ms = slow_query_ms
+        self.slow_query_fp = open(slow_query_log, "a") if slow_query_log else None
+        self.cprofile_every = cprofile_every  # 0 => never
+        self.cprofile = cProfile.Profile() if cprofile_every else None
+        self.profiled_queries = 0
+        self.histograms = defaultdict(LatencyHistogram)  # query type -> latencies
+        self.phase_totals = defaultdict(float)  # phase -> seconds, over every query
+        self.no_of_queries = 0
+        self.slow_queries = 0
+        self.phases = defaultdict(float)  # phase -> seconds, of the current query
+        self.nested = []  # seconds spent in the phases called by each running phase
+
+    def attach(self, search):
+        for phase, method_name in PHASES.items():
+            setattr(search, method_name, self.timed(phase, getattr(search, method_name)))
+        search.answer = self.timed_query(search, search.answer)
+        return search
+
+    def timed(self, phase, method):
+        def timed_method(*args, **kwargs):
+            self.nested.append(0.0)
+            start = time.perf_counter()
+            try:
+                return method(*args, **kwargs)
+            finally:
+                elapsed = time.perf_counter() - start
+                self.phases[phase] += elapsed - self.nested.pop()
+                if self.nested:
+                    self.nested[-1] += elapsed
+
+        return timed_method
+
+    def timed_query(self, search, answer):
+        def timed_answer(query):
+            self.phases = defaultdict(float)
+            self.no_of_queries += 1
+            cprofile = self.cprofile if self.cprofile and self.no_of_queries % self.cprofile_every == 0 else None
+            start = time.perf_counter()
+            if cprofile:
+                self.profiled_queries += 1
+                cprofile.enable()
+            try:
+                return answer(query)
+            finally:
+                if cprofile:
+                    cprofile.disable()
+                self.record(search.get_query_type(query), query, time.perf_counter() - start)
+
+        return timed_answer
+
+    def record(self, query_type, query, seconds):
+        self.histograms[query_type].record(seconds)
+        for phase, phase_seconds in self.phases.items():
+            self.phase_totals[phase] += phase_seconds
+        if 1000 * seconds >= self.slow_query_ms:
+            self.slow_queries += 1
+            phases_ms = {phase: round(1000 * phase_seconds, 3) for phase, phase_seconds in self.phases.items()}
+            log.warning("Slow query (%.1f ms, %s): %r %s", 1000 * seconds, query_type, query.strip(), phases_ms)
+            if self.slow_query_fp:
+                print(json.dumps({"time": time.time(), "latency_ms": 1000 * seconds, "type": query_type,
+                                  "query": query.strip(), "phases_ms": phases_ms}), file=self.slow_query_fp)
+                self.slow_query_fp.flush()
+
+    def stats(self):
+        return {
+            "queries": self.no_of_queries,
+            "slow_queries": self.slow_queries,
+            "types": {query_type: histogram.stats() for query_type, histogram in self.histograms.items()},
+            "phases_ms": {phase: 1000 * seconds for phase, seconds in self.phase_totals.items()},
+        }
+
+    def log_stats(self):
+        for query_type, histogram in self.histograms.items():
+            stats = histogram.stats()
+            log.info("%s: %d queries, mean %.2f ms, p50 <= %s ms, p99 <= %s ms, max %.2f ms", query_type,
+                     stats["count"], stats["mean_ms"], stats["p50_ms"], stats["p99_ms"], stats["max_ms"])
+        total = sum(self.phase_totals.values()) or 1
+        log.info("Time per phase: %s", ", ".join(f"{phase} {100 * seconds / total:.1f}%"
+                                                 for phase, seconds in self.phase_totals.items()))
+
+    def dump_cprofile(self, path):
+        """Writes the cProfile statistics of the sampled queries to path and logs their hottest functions."""
+        if not self.profiled_queries:
+            return
+        self.cprofile.dump_stats(path)
+        out = io.StringIO()
+        pstats.Stats(self.cprofile, stream=out).sort_stats("cumulative").print_stats(CPROFILE_TOP)
+        log.info("cProfile of 1 query in %d, written to %s\n%s", self.cprofile_every, path, out.getvalue())
+
+    def close(self):
+        if self.slow_query_fp:
+            self.slow_query_fp.close()
@@ -0,0 +1,20 @@
+import math
+
+from src.constants import BM25_K1, BM25_B
+
+# BM25: score(term, doc) = idf(term) * tf * (k1 + 1) / (tf + k1 * (1 - b + b * length(doc) / avg length))
+# The part after idf only depends on the posting, so the indexer stores its maximum over each posting list
+# as the upper bound used for dynamic pruning at query time.
+
+# scores are computed in a different order at index and query time, the bounds are
+# inflated by this factor so that floating point rounding never makes them smaller than a real score
+UPPER_BOUND_SLACK = 1 + 1e-9
+
+
+def bm25_idf(df, no_of_docs):
+    # never negative, WAND upper bounds assume that no term lowers the score of a document
+    return max(0.0, math.log(1 + (no_of_docs - df + 0.5) / (df + 0.5)))
+
+
+def bm25_tf(tf, length, avg_length):
+    return tf * (BM25_K1 + 1) / (tf + BM25_K1 * (1 - BM25_B + BM25_B * length / avg_length))
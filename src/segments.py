@@ -0,0 +1,562 @@
+import logging as log
+import math
+import os
+import re
+import shutil
+import struct
+from collections import Counter
+from contextlib import contextmanager
+
+try:
+    import fcntl  # not available on Windows
+except ImportError:
+    fcntl = None
+
+from src import constants
+from src.indexer import Indexer
+from src.postings import read_postings, postings_writer, MappedPostings, OFFSET_ENTRY, TEXT, unpack_offset_entry
+from src.positions import MappedPositions, PositionList
+from src.termdict import TermDictionary, write_term_dictionary, write_term_termid_map
+from src.titles import TitleStore, TitleStoreWriter
+from src.topk import PostingCursor, BlockPostingCursor
+
+# Index segments (incremental indexing):
+#  An index folder holds one or more segments, each a complete index (postings, term dictionary, title store,
+#  stats) of some of the pages. A full build writes a single segment in the index folder itself ("."),
+#  each incremental build (build_index.py --incremental) indexes a delta dump into a new segment-N folder.
+#  segments.txt lists the segments of the index, oldest first, one per line (no file => just ".").
+#
+# Tombstones: a page indexed again in a newer segment, or deleted, stays in the postings of the older segments
+#  but is marked in their tombstones.bin: a bitmap with bit i set if the i-th document (in docid order, see
+#  src/titles.py) of the segment is dead, after the no. of dead documents and the sum of their field lengths.
+#  Search skips dead documents and leaves them out of the statistics.
+#
+# Merging (log-structured merge): small segments would make every query open and search many posting lists,
+#  so after an incremental build, whenever a size tier holds MERGE_FACTOR segments, MERGE_FACTOR adjacent segments
+#  are merged into one, dropping their dead documents: the run with the fewest documents among those of the lowest
+#  tiers (see choose_merge()). Segments of a full tier need not be adjacent, nor do small segments ever get stranded
+#  between larger ones: at most MERGE_FACTOR - 1 segments per tier are left, a no. of segments logarithmic in the
+#  no. of documents. The merged segment takes their place in segments.txt, which is replaced
+#  atomically, so readers see either the old segments or the merged one.
+#
+# Concurrency: build_index.py --incremental publishes its segment and leaves the merging to a detached process,
+#  so an incremental build can run while an older one's merge is still going. Whatever changes segments.txt or
+#  tombstones (creating a segment folder, publishing a segment, swapping merged segments in) holds index.lock.
+#  A merge reads its segments without the lock, then, holding it, carries over to the merged segment the documents
+#  that died in the merged segments meanwhile before swapping it in, so no delete is lost.
+#  merge.lock lets a single merge process run per index, which keeps merging till no tier is full, so segments
+#  published while it runs get merged too. Without fcntl (Windows) nothing is locked: only one process
+#  may then write to an index folder at a time.
+
+ROOT_SEGMENT = "."
+MERGE_FACTOR = 4  # no. of segments merged at once, a tier holds segments of MERGE_FACTOR^tier docs
+SEGMENT_FILE_NAMES = [constants.POSTINGS_FILE_NAME, constants.BINARY_POSTINGS_FILE_NAME,
+                      constants.POSTINGS_OFFSETS_FILE_NAME, constants.POSITIONS_FILE_NAME,
+                      constants.POSITIONS_OFFSETS_FILE_NAME, constants.TERM_ID_MAPPING_FILE_NAME,
+                      constants.TERM_DICT_FILE_NAME, constants.TERM_DICT_INDEX_FILE_NAME,
+                      constants.TERM_DICT_IDS_FILE_NAME, constants.TITLES_FILE_NAME,
+                      constants.TITLES_INDEX_FILE_NAME, constants.STATS_FILE_NAME, constants.TOMBSTONES_FILE_NAME]
+
+
+def read_segment_names(index_dir):
+    """Returns the segments of the index, oldest first."""
+    path = f"{index_dir}/{constants.SEGMENTS_FILE_NAME}"
+    if not os.path.exists(path):
+        return [ROOT_SEGMENT]
+    with open(path, "r") as fp:
+        return [line.rstrip("\n") for line in fp if line.strip()]
+
+
+def write_segment_names(index_dir, names):
+    path = f"{index_dir}/{constants.SEGMENTS_FILE_NAME}"
+    with open(f"{path}.tmp", "w") as fp:
+        for name in names:
+            print(name, file=fp)
+    os.replace(f"{path}.tmp", path)  # atomic, readers never see a partial list
+
+
+@contextmanager
+def index_lock(index_dir, lock_file_name=constants.INDEX_LOCK_FILE_NAME, blocking=True):
+    """
+    Holds an exclusive lock on the lock file of index_dir, yields False instead of waiting
+    if not blocking and another process holds it.
+    """
+    if fcntl is None:
+        yield True
+        return
+    with open(f"{index_dir}/{lock_file_name}", "a") as fp:
+        try:
+            fcntl.flock(fp, fcntl.LOCK_EX if blocking else fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            yield False
+            return
+        try:
+            yield True
+        finally:
+            fcntl.flock(fp, fcntl.LOCK_UN)
+
+
+def create_segment(index_dir):
+    """Creates the folder of a new segment, returns its name and path."""
+    with index_lock(index_dir):
+        numbers = [int(name.rsplit("-", 1)[1]) for name in os.listdir(index_dir)
+                   if name.startswith(constants.SEGMENT_DIR_NAME.format(""))]
+        name = constants.SEGMENT_DIR_NAME.format(max(numbers, default=0) + 1)
+        os.mkdir(f"{index_dir}/{name}")
+    return name, f"{index_dir}/{name}"
+
+
+# no. of dead documents, sum of the lengths of each of constants.FIELDS over them
+TOMBSTONES_HEADER = struct.Struct(f"<I{len(constants.FIELDS)}Q")
+
+
+class Tombstones:
+    """
+    The dead documents of a segment. tombstones.bin holds TOMBSTONES_HEADER then the bitmap,
+    so that the statistics of the live documents are known without walking the bitmap.
+    """
+
+    def __init__(self, no_of_docs):
+        self.no_of_dead = 0
+        self.dead_field_lengths = [0] * len(constants.FIELDS)
+        self.bitmap = bytearray(-(-no_of_docs // 8))
+
+    @staticmethod
+    def exists(path):
+        return os.path.exists(f"{path}/{constants.TOMBSTONES_FILE_NAME}")
+
+    @classmethod
+    def read(cls, path, no_of_docs):
+        """Returns the tombstones of the segment at path, none dead if it has no tombstones.bin."""
+        tombstones = cls(no_of_docs)
+        try:
+            with open(f"{path}/{constants.TOMBSTONES_FILE_NAME}", "rb") as fp:
+                data = fp.read()
+        except FileNotFoundError:
+            return tombstones
+        tombstones.no_of_dead, *tombstones.dead_field_lengths = TOMBSTONES_HEADER.unpack_from(data)
+        tombstones.bitmap = bytearray(data[TOMBSTONES_HEADER.size:])
+        return tombstones
+
+    def write(self, path):
+        with open(f"{path}/{constants.TOMBSTONES_FILE_NAME}", "wb") as fp:
+            fp.write(TOMBSTONES_HEADER.pack(self.no_of_dead, *self.dead_field_lengths))
+            fp.write(self.bitmap)
+
+    def is_dead(self, position):
+        return self.bitmap[position >> 3] & (1 << (position & 7))
+
+    def kill(self, position, field_lengths):
+        """Marks the document at position, with field_lengths (as in constants.FIELDS), dead."""
+        self.bitmap[position >> 3] |= 1 << (position & 7)
+        self.no_of_dead += 1
+        for field_no, length in enumerate(field_lengths):
+            self.dead_field_lengths[field_no] += length
+
+    def dead_positions(self):
+        """Yields the position of every dead document, in docid order."""
+        for match in re.finditer(rb"[^\x00]", self.bitmap):  # zero bytes (8 live documents) are skipped in C
+            byte_no, byte = match.start(), match.group()[0]
+            for bit in range(8):
+                if byte & (1 << bit):
+                    yield (byte_no << 3) | bit
+
+
+class Segment:
+    def __init__(self, path, lazy=False):
+        self.path = path
+        # lazy => posting lists are decoded on demand from the memory-mapped postings file
+        self.lazy = lazy
+        self.index = {}  # termid -> (docids, masks, tfs), unless lazy
+        # termid -> (document frequency, max. BM25 tf component) in each field, unless lazy
+        self.field_counts = {}
+        self.max_scores = {}
+        self.term_termid_map = {}  # term -> termid, for text postings only
+        self.mapped_postings = None
+        self.term_dictionary = None  # TermDictionary, but for text postings
+        self.positions = None  # MappedPositions, if the segment has a positional index
+        self.postings_cache = None  # PostingsCache shared by the lazy segments of an index, see src/cache.py
+        self.title_store = None
+        self.doc_field_lengths = {}  # docid -> length of each field, filled up front unless lazy
+        self.no_of_docs = 0  # including the dead ones
+        self.avg_field_lengths = {}
+        self.deleted = frozenset()  # docids of the dead documents
+        self.live_field_lengths = {}  # field -> sum of the lengths of that field over the live documents
+
+    def load(self):
+        if self.lazy and not os.path.exists(f"{self.path}/{constants.BINARY_POSTINGS_FILE_NAME}"):
+            log.warning("%s has text postings, which can't be memory-mapped: loading them instead", self.path)
+            self.lazy = False
+        if self.lazy:
+            self.open_index()
+        else:
+            self.load_index()
+            if os.path.exists(f"{self.path}/{constants.TERM_DICT_FILE_NAME}"):
+                self.term_dictionary = TermDictionary(self.path)  # terms are resolved through it in both modes
+            else:
+                self.load_term_termid()  # text postings come with term-termid-map.txt instead
+        if MappedPositions.exists(self.path):
+            self.positions = MappedPositions(self.path)  # memory-mapped in both modes, phrase queries are rare
+        self.load_docid_title()
+        self.load_stats()
+        self.load_tombstones()
+
+    def load_docid_title(self):
+        self.title_store = TitleStore(self.path)
+        if not self.lazy:
+            for i in range(len(self.title_store)):
+                entry = self.title_store.get_entry(i)
+                self.doc_field_lengths[entry[0]] = entry[3:]
+
+    def load_stats(self):
+        with open(f"{self.path}/{constants.STATS_FILE_NAME}", "r") as fp:
+            for line in fp:
+                key, value = line.rstrip("\n").split(":")
+                if key == "no_of_docs":
+                    self.no_of_docs = int(value)
+                elif key.startswith("avg_length_"):
+                    self.avg_field_lengths[key[len("avg_length_"):]] = float(value)
+
+    def load_tombstones(self):
+        self.live_field_lengths = {field: self.avg_field_lengths.get(field, 0) * self.no_of_docs
+                                   for field in constants.FIELDS}
+        if not Tombstones.exists(self.path):
+            return  # nothing ever died in this segment
+        tombstones = Tombstones.read(self.path, len(self.title_store))
+        self.deleted = frozenset(self.title_store.get_entry(position)[0] for position in tombstones.dead_positions())
+        for field, length in zip(constants.FIELDS, tombstones.dead_field_lengths):
+            self.live_field_lengths[field] -= length
+
+    @property
+    def no_of_live_docs(self):
+        return self.no_of_docs - len(self.deleted)
+
+    def load_term_termid(self):
+        with open(f"{self.path}/{constants.TERM_ID_MAPPING_FILE_NAME}", 'r') as fp:
+            for line in fp:
+                term, termid = line.split(":")
+                self.term_termid_map[term] = int(termid)
+
+    def load_index(self):
+        offsets_path = f"{self.path}/{constants.POSTINGS_OFFSETS_FILE_NAME}"
+        offsets = b""
+        if os.path.exists(offsets_path):  # text postings don't have upper bounds, so can't be pruned
+            with open(offsets_path, "rb") as fp:
+                offsets = fp.read()
+
+        for termid, docids, masks, tfs in read_postings(self.path):
+            self.index[termid] = (docids, masks, tfs)
+            if termid * OFFSET_ENTRY.size <= len(offsets):
+                _, _, _, self.field_counts[termid], self.max_scores[termid] = unpack_offset_entry(offsets, termid)
+            else:
+                self.field_counts[termid] = tuple(sum(1 for mask in masks if mask & (1 << field_no))
+                                                  for field_no in range(len(constants.FIELDS)))
+                self.max_scores[termid] = (float("inf"),) * len(constants.FIELDS)
+
+    def open_index(self):
+        self.mapped_postings = MappedPostings(self.path)
+        self.term_dictionary = TermDictionary(self.path)
+
+    def lookup(self, term, field_mask=None):
+        """
+        Returns (no. of docids, document frequency in each field, max. BM25 tf component in each field,
+        posting list, termid) of term or None if it has no postings in the fields of field_mask (None => any field),
+        the posting list being (docids, masks, tfs) or, when lazy, the (offset, no. of bytes) of the encoded list.
+        """
+        if self.lazy:
+            entry = self.term_dictionary.lookup(term, field_mask)
+            if entry is None:
+                return None
+            termid, offset, size, count, field_counts, max_scores = entry
+            return count, field_counts, max_scores, (offset, size), termid
+        if self.term_dictionary is not None:
+            termid, _ = self.term_dictionary.get_termid(term) or (None, None)
+        else:
+            termid = self.term_termid_map.get(term)
+        postings = self.index.get(termid)
+        if not postings:
+            return None
+        field_counts = self.field_counts[termid]
+        if field_mask is not None and not any(count for field_no, count in enumerate(field_counts)
+                                              if field_mask & (1 << field_no)):
+            return None
+        return len(postings[0]), field_counts, self.max_scores[termid], postings, termid
+
+    def get_cached_postings(self, entry):
+        """Returns the decoded posting list of a lazy entry from the postings cache, None if it is not cached."""
+        if self.postings_cache is None:
+            return None
+        count, _, _, postings, termid = entry
+        return self.postings_cache.get((self.path, termid), lambda: self.mapped_postings.decode(*postings, count))
+
+    def get_postings(self, entry):
+        """Returns the (docids, masks, tfs) of an entry returned by lookup()."""
+        count, _, _, postings, _ = entry
+        if self.lazy:
+            return self.get_cached_postings(entry) or self.mapped_postings.decode(*postings, count)
+        return postings
+
+    def get_cursor(self, entry, upper_bound, score, field_mask=None):
+        """
+        Returns a cursor over the postings of an entry returned by lookup() having the term in a field of
+        field_mask (None => every posting).
+        When lazy, the cursor decodes the memory-mapped posting list one block at a time,
+        unless the list is in the postings cache.
+        The cursor gives the positions of its postings if the segment has a positional index.
+        """
+        count, _, _, postings, termid = entry
+        decoded = self.get_cached_postings(entry) if self.lazy else postings
+        if decoded is None:
+            cursor = BlockPostingCursor(self.mapped_postings.get_buffer(*postings), count,
+                                        self.mapped_postings.codec, upper_bound, score, field_mask)
+        else:
+            cursor = PostingCursor(*decoded, upper_bound, score, field_mask)
+        if self.positions:
+            cursor.positions = PositionList(self.positions.get_buffer(termid), count)
+        return cursor
+
+    def get_field_lengths(self, docid):
+        """Returns the no. of terms in each of constants.FIELDS for docid."""
+        if self.lazy:
+            entry = self.title_store.find(docid)
+            return entry[3:] if entry else (0,) * len(constants.FIELDS)
+        return self.doc_field_lengths.get(docid, (0,) * len(constants.FIELDS))
+
+    def get_title(self, docid):
+        """Returns the title of docid, None if docid is not a live document of this segment."""
+        if docid in self.deleted:
+            return None
+        return self.title_store.get(docid)
+
+    def close(self):
+        for mapped in (self.title_store, self.mapped_postings, self.term_dictionary, self.positions):
+            if mapped:
+                mapped.close()
+
+
+def delete_documents(path, docids):
+    """
+    Mark docids dead in the segment at path (docids not in the segment are ignored),
+    returns the no. of documents that were live till then.
+    """
+    title_store = TitleStore(path)
+    tombstones = Tombstones.read(path, len(title_store))
+    deleted = 0
+    for docid in docids:
+        position = title_store.position(docid)
+        if position != -1 and not tombstones.is_dead(position):
+            tombstones.kill(position, title_store.get_entry(position)[3:])
+            deleted += 1
+    title_store.close()
+    if deleted:
+        tombstones.write(path)
+    return deleted
+
+
+def publish_segment(index_dir, name, deleted_docids=()):
+    """
+    Add the segment name to the index, after marking dead in the older segments
+    the pages it holds again and the deleted_docids. Returns the no. of pages replaced or deleted.
+    """
+    title_store = TitleStore(f"{index_dir}/{name}")
+    docids = {title_store.get_entry(i)[0] for i in range(len(title_store))}
+    no_of_pages = len(title_store)
+    title_store.close()
+    docids.update(int(docid) for docid in deleted_docids)
+
+    deleted = 0
+    with index_lock(index_dir):
+        names = read_segment_names(index_dir)
+        for old_name in names:
+            deleted += delete_documents(f"{index_dir}/{old_name}", docids)
+        write_segment_names(index_dir, names + [name])
+    log.info("Added segment %s with %d pages, %d pages replaced or deleted", name, no_of_pages, deleted)
+    return deleted
+
+
+def iter_term_postings(path):
+    """
+    Yields (term, docids, masks, tfs, positions) of every posting list of the segment at path, sorted by term,
+    positions being None unless the segment has a positional index.
+    """
+    if not os.path.exists(f"{path}/{constants.TERM_DICT_FILE_NAME}"):
+        # text postings, no sorted dictionary to walk
+        segment = Segment(path)
+        segment.load_term_termid()
+        termid_term_map = {termid: term for term, termid in segment.term_termid_map.items()}
+        postings = [(termid_term_map[termid], docids, masks, tfs, None)
+                    for termid, docids, masks, tfs in read_postings(path)]
+        postings.sort(key=lambda term_postings: term_postings[0])
+        yield from postings
+        return
+
+    term_dictionary = TermDictionary(path)
+    mapped_postings = MappedPostings(path)
+    positions = MappedPositions(path) if MappedPositions.exists(path) else None
+    try:
+        for term, termid, _ in term_dictionary:
+            _, offset, size, count, _, _ = term_dictionary.lookup(term)
+            docids, masks, tfs = mapped_postings.decode(offset, size, count)
+            yield term, docids, masks, tfs, positions.read(termid, tfs) if positions else None
+    finally:
+        if positions:
+            positions.close()
+        mapped_postings.close()
+        term_dictionary.close()
+
+
+def merge_segments(index_dir, names, postings_format=constants.POSTINGS_FORMAT):
+    """Merge the (adjacent) segments names into a new segment which takes their place, dropping dead documents."""
+    merged_name, merged_path = create_segment(index_dir)
+    segments = []
+    for name in names:
+        segment = Segment(f"{index_dir}/{name}")
+        segment.load_docid_title()
+        segment.load_stats()
+        segment.load_tombstones()
+        segments.append(segment)
+
+    # title store and statistics of the live documents
+    no_of_docs = 0
+    total_field_lengths = dict.fromkeys(constants.FIELDS, 0)
+    with TitleStoreWriter(merged_path) as title_store:
+        for segment in segments:
+            for position in range(len(segment.title_store)):
+                entry = segment.title_store.get_entry(position)
+                if entry[0] in segment.deleted:
+                    continue
+                field_lengths = dict(zip(constants.FIELDS, entry[3:]))
+                title_store.add(entry[0], segment.title_store.get_title(entry), field_lengths)
+                no_of_docs += 1
+                for field in constants.FIELDS:
+                    total_field_lengths[field] += field_lengths[field]
+    merged_title_store = TitleStore(merged_path)
+    avg_field_lengths = {field: total_field_lengths[field] / no_of_docs if no_of_docs else 0
+                         for field in constants.FIELDS}
+
+    # k-way merge of the posting lists of every segment by term, termids are reassigned in term order
+    # positions are kept only if every merged segment has them
+    positional = postings_format != TEXT and all(MappedPositions.exists(segment.path) for segment in segments)
+    term_termid_map = {}
+    streams = [iter_term_postings(segment.path) for segment in segments]
+    heads = [next(stream, None) for stream in streams]
+    with postings_writer(merged_path, postings_format, positional) as writer:
+        while any(heads):
+            term = min(head[0] for head in heads if head)
+            postings = []  # ((docid, mask, tfs), positions)
+            for i, head in enumerate(heads):
+                if head and head[0] == term:
+                    positions = head[4] if positional else [None] * len(head[1])
+                    postings += [(posting, posting_positions)
+                                 for posting, posting_positions in zip(zip(head[1], head[2], head[3]), positions)
+                                 if posting[0] not in segments[i].deleted]
+                    heads[i] = next(streams[i], None)
+            if not postings:
+                continue  # only dead documents had the term
+            postings.sort(key=lambda posting: posting[0][0])
+
+            term_termid_map[term] = len(term_termid_map) + 1
+            Indexer.add_postings(writer, term_termid_map[term], [posting for posting, _ in postings],
+                                 merged_title_store, avg_field_lengths,
+                                 [positions for _, positions in postings] if positional else None)
+
+    if postings_format != TEXT:
+        write_term_dictionary(merged_path, term_termid_map)
+    else:
+        write_term_termid_map(merged_path, term_termid_map)
+    Indexer.write_stats(merged_path, no_of_docs, avg_field_lengths)
+    merged_title_store.close()
+    for segment in segments:
+        segment.close()
+
+    # publish the merged segment in place of the merged ones, then remove them
+    with index_lock(index_dir):
+        carry_over_deletes(segments, merged_path)
+        all_names = read_segment_names(index_dir)
+        first = all_names.index(names[0])
+        write_segment_names(index_dir, all_names[:first] + [merged_name] + all_names[first + len(names):])
+        for name in names:
+            remove_segment(index_dir, name)
+    log.info("Merged segments %s into %s (%d pages)", ", ".join(names), merged_name, no_of_docs)
+    return merged_name
+
+
+def carry_over_deletes(segments, merged_path):
+    """
+    Mark dead in the merged segment at merged_path the documents that died in the merged segments
+    since they were loaded (by a build publishing a segment while they were being merged).
+    """
+    deleted = []
+    for segment in segments:
+        title_store = TitleStore(segment.path)
+        for position in Tombstones.read(segment.path, len(title_store)).dead_positions():
+            docid = title_store.get_entry(position)[0]
+            if docid not in segment.deleted:
+                deleted.append(docid)
+        title_store.close()
+    if deleted:
+        delete_documents(merged_path, deleted)
+        log.info("%d pages deleted while merging", len(deleted))
+
+
+def remove_segment(index_dir, name):
+    if name != ROOT_SEGMENT:
+        shutil.rmtree(f"{index_dir}/{name}")
+        return
+    # the root segment shares the index folder with the other segments, remove only its own files
+    for file_name in SEGMENT_FILE_NAMES:
+        if os.path.exists(f"{index_dir}/{file_name}"):
+            os.remove(f"{index_dir}/{file_name}")
+
+
+def get_no_of_live_docs(path):
+    """No. of live documents of the segment at path, from its stats and the header of its tombstones."""
+    segment = Segment(path)
+    segment.load_stats()
+    return segment.no_of_docs - Tombstones.read(path, segment.no_of_docs).no_of_dead
+
+
+def get_tier(no_of_live_docs):
+    """Size tier of a segment: log of its no. of live documents in base MERGE_FACTOR."""
+    return int(math.log(max(no_of_live_docs, 1), MERGE_FACTOR))
+
+
+def choose_merge(sizes):
+    """
+    Given the no. of live documents of every segment (in segments.txt order), returns the start of the
+    MERGE_FACTOR adjacent segments to merge, None if no tier holds MERGE_FACTOR segments.
+    These are the ones with the fewest documents among the runs whose tiers are all <= t,
+    t being the lowest tier (from that of the lowest full tier up) having such a run.
+    """
+    tiers = [get_tier(size) for size in sizes]
+    full_tiers = [tier for tier, count in Counter(tiers).items() if count >= MERGE_FACTOR]
+    if not full_tiers:
+        return None
+    starts = range(len(sizes) - MERGE_FACTOR + 1)
+    for tier in range(min(full_tiers), max(tiers) + 1):
+        runs = [start for start in starts if max(tiers[start:start + MERGE_FACTOR]) <= tier]
+        if runs:
+            return min(runs, key=lambda start: sum(sizes[start:start + MERGE_FACTOR]))
+    return None
+
+
+def find_merge(index_dir):
+    """Returns the names of the segments to merge (see choose_merge()), None if there are none."""
+    names = read_segment_names(index_dir)
+    start = choose_merge([get_no_of_live_docs(f"{index_dir}/{name}") for name in names])
+    return None if start is None else names[start:start + MERGE_FACTOR]
+
+
+def merge_policy(index_dir, postings_format=constants.POSTINGS_FORMAT):
+    """
+    Keep merging segments till no tier holds MERGE_FACTOR segments,
+    unless another process is already merging the segments of index_dir.
+    """
+    with index_lock(index_dir, constants.MERGE_LOCK_FILE_NAME, blocking=False) as locked:
+        if not locked:
+            log.info("Segments of %s are already being merged", index_dir)
+            return
+        names = find_merge(index_dir)
+        while names:
+            merge_segments(index_dir, names, postings_format)
+            names = find_merge(index_dir)
@@ -30,6 +30,8 @@ release 2: July 2008
 
 import sys
 
+from src.cache import LRUCache
+
 
 class PorterStemmer:
 
@@ -402,6 +404,67 @@ class PorterStemmer:
         return self.b[self.k0:self.k + 1]
 
 
+class CachedStemmer:
+    """
+    Memoizes PorterStemmer.stem() per surface form.
+    Word frequencies follow Zipf's law, so a small cache answers most lookups.
+    A stem table (word:stem per line) saved next to an index can be preloaded,
+    preloaded entries are kept in a dict of their own and are never evicted.
+    """
+
+    def __init__(self, maxsize=100000, record_new_stems=False):
+        self.stemmer = PorterStemmer()
+        self.table = {}
+        self.cache = LRUCache(maxsize)
+        # only indexing worker processes record the stems they compute, which they hand over with every batch,
+        # anywhere else (a serial build, search) nothing would ever empty new_stems
+        self.record_new_stems = record_new_stems
+        self.new_stems = {}  # stems computed since the last call to pop_new_stems()
+
+    def stem(self, word):
+        stem = self.table.get(word)
+        if stem is not None:
+            self.cache.hits += 1
+            return stem
+        stem = self.cache.get(word)
+        if stem is None:  # counted in cache.misses
+            stem = self.stemmer.stem(word, 0, len(word) - 1)
+            self.cache.put(word, stem)
+            if self.record_new_stems:
+                self.new_stems[word] = stem
+        return stem
+
+    def pop_new_stems(self):
+        """Used by indexing worker processes to hand the stems they computed over to the main process."""
+        new_stems, self.new_stems = self.new_stems, {}
+        return new_stems
+
+    def merge(self, new_stems, hits, misses):
+        """Merge the stems and counters of a worker process into this cache."""
+        for word, stem in new_stems.items():
+            self.cache.put(word, stem)
+        self.cache.hits += hits
+        self.cache.misses += misses
+
+    def load_table(self, path):
+        with open(path, "r") as fp:
+            for line in fp:
+                word, stem = line.rstrip("\n").split(":")
+                self.table[word] = stem
+
+    def save_table(self, path):
+        """Save the preloaded table along with everything currently cached."""
+        with open(path, "w") as fp:
+            for word, stem in self.table.items():
+                print(f"{word}:{stem}", file=fp)
+            for word, stem in self.cache.items():
+                if word not in self.table:
+                    print(f"{word}:{stem}", file=fp)
+
+    def stats(self):
+        return dict(self.cache.stats(), table_size=len(self.table))
+
+
 if __name__ == '__main__':
     p = PorterStemmer()
     if len(sys.argv) > 1:
@@ -0,0 +1,177 @@
+import mmap
+import struct
+
+from src import constants
+from src.compression import encode_varint, decode_varint
+from src.postings import OFFSET_ENTRY, unpack_offset_entry
+
+# On-disk term dictionary, a sorted front-coded array:
+#  term-dict.bin holds the terms sorted, in blocks of TERM_DICT_BLOCK_SIZE terms. Every term is written as
+#      varint(length of the prefix shared with the previous term of the block) varint(length of the rest)
+#      <rest of the term> varint(termid) byte(bitmask of the fields the term has postings in)
+#  the first term of a block shares nothing, so a block can be decoded on its own.
+#  term-dict-index.bin holds the byte offset (TERM_DICT_OFFSET) of every block in term-dict.bin.
+#  term-dict-ids.bin holds the position of every termid (termid 1 first) in the sorted array.
+# term -> termid binary searches the first terms of the blocks and decodes one block,
+# termid -> term decodes the block holding the position of termid. Prefix and range lookups walk the
+# blocks from the position of the lower bound. Everything is memory-mapped, nothing is loaded up front.
+# The postings entry of the termid is then read from the offsets file (see src/postings.py).
+
+TERM_DICT_BLOCK_SIZE = 64
+TERM_DICT_OFFSET = struct.Struct("<Q")
+TERM_DICT_POSITION = struct.Struct("<I")
+
+
+def write_term_dictionary(index_dir, term_termid_map):
+    """Write the front-coded term dictionary of the terms with postings, using the offsets table."""
+    with open(f"{index_dir}/{constants.POSTINGS_OFFSETS_FILE_NAME}", "rb") as fp:
+        offsets = fp.read()
+
+    positions = [0] * len(term_termid_map)
+    with open(f"{index_dir}/{constants.TERM_DICT_FILE_NAME}", "wb") as dict_fp, \
+            open(f"{index_dir}/{constants.TERM_DICT_INDEX_FILE_NAME}", "wb") as index_fp:
+        position = 0
+        previous = b""
+        for term in sorted(term_termid_map):
+            termid = term_termid_map[term]
+            if termid * OFFSET_ENTRY.size > len(offsets):
+                continue  # term without postings
+            mask = 0
+            for field_no, field_count in enumerate(unpack_offset_entry(offsets, termid)[3]):
+                if field_count:
+                    mask |= 1 << field_no
+            if not mask:
+                continue
+
+            encoded = term.encode()
+            if position % TERM_DICT_BLOCK_SIZE == 0:
+                index_fp.write(TERM_DICT_OFFSET.pack(dict_fp.tell()))
+                previous = b""
+            prefix = 0
+            while prefix < min(len(previous), len(encoded)) and previous[prefix] == encoded[prefix]:
+                prefix += 1
+            dict_fp.write(encode_varint((prefix, len(encoded) - prefix)) + encoded[prefix:] +
+                          encode_varint((termid,)) + bytes([mask]))
+            positions[termid - 1] = position
+            previous = encoded
+            position += 1
+
+    with open(f"{index_dir}/{constants.TERM_DICT_IDS_FILE_NAME}", "wb") as fp:
+        for position in positions:
+            fp.write(TERM_DICT_POSITION.pack(position))
+
+
+def write_term_termid_map(index_dir, term_termid_map):
+    """
+    term:termid per line, the dictionary of text postings (which only hold termids),
+    binary postings have the front-coded term dictionary instead.
+    """
+    with open(f"{index_dir}/{constants.TERM_ID_MAPPING_FILE_NAME}", "w") as fp:
+        for term in term_termid_map:
+            print(f"{term}:{term_termid_map[term]}", file=fp)
+
+
+class TermDictionary:
+    def __init__(self, index_dir):
+        self.dictionary = self.index = self.ids = self.offsets = None
+        with open(f"{index_dir}/{constants.TERM_DICT_FILE_NAME}", "rb") as fp:
+            if fp.seek(0, 2):  # mmap can't map an empty file
+                self.dictionary = mmap.mmap(fp.fileno(), 0, access=mmap.ACCESS_READ)
+        with open(f"{index_dir}/{constants.TERM_DICT_INDEX_FILE_NAME}", "rb") as fp:
+            if fp.seek(0, 2):
+                self.index = mmap.mmap(fp.fileno(), 0, access=mmap.ACCESS_READ)
+        with open(f"{index_dir}/{constants.TERM_DICT_IDS_FILE_NAME}", "rb") as fp:
+            if fp.seek(0, 2):
+                self.ids = mmap.mmap(fp.fileno(), 0, access=mmap.ACCESS_READ)
+        with open(f"{index_dir}/{constants.POSTINGS_OFFSETS_FILE_NAME}", "rb") as fp:
+            if fp.seek(0, 2):
+                self.offsets = mmap.mmap(fp.fileno(), 0, access=mmap.ACCESS_READ)
+        self.no_of_blocks = len(self.index) // TERM_DICT_OFFSET.size if self.index else 0
+
+    def get_block_offset(self, block):
+        return TERM_DICT_OFFSET.unpack_from(self.index, block * TERM_DICT_OFFSET.size)[0]
+
+    def get_first_term(self, block):
+        (_, length), offset = decode_varint(self.dictionary, self.get_block_offset(block), 2)
+        return self.dictionary[offset:offset + length]
+
+    def read_block(self, block):
+        """Returns the (term, termid, field mask) of every term of the block."""
+        offset = self.get_block_offset(block)
+        end = self.get_block_offset(block + 1) if block + 1 < self.no_of_blocks else len(self.dictionary)
+        entries = []
+        term = b""
+        while offset < end:
+            (prefix, length), offset = decode_varint(self.dictionary, offset, 2)
+            term = term[:prefix] + self.dictionary[offset:offset + length]
+            (termid,), offset = decode_varint(self.dictionary, offset + length, 1)
+            entries.append((term.decode(), termid, self.dictionary[offset]))
+            offset += 1
+        return entries
+
+    def find_block(self, term):
+        """Returns the last block whose first term is <= term (-1 if there is none)."""
+        target = term.encode()
+        lo, hi = 0, self.no_of_blocks
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if self.get_first_term(mid) <= target:
+                lo = mid + 1
+            else:
+                hi = mid
+        return lo - 1
+
+    def get_termid(self, term):
+        """Returns (termid, field mask) of term or None."""
+        block = self.find_block(term)
+        if block < 0:
+            return None
+        for entry_term, termid, mask in self.read_block(block):
+            if entry_term == term:
+                return termid, mask
+        return None
+
+    def get_term(self, termid):
+        """Returns the term of termid or None."""
+        if termid < 1 or termid * TERM_DICT_POSITION.size > len(self.ids or b""):
+            return None
+        position = TERM_DICT_POSITION.unpack_from(self.ids, (termid - 1) * TERM_DICT_POSITION.size)[0]
+        entry_term, entry_termid, _ = self.read_block(position // TERM_DICT_BLOCK_SIZE)[
+            position % TERM_DICT_BLOCK_SIZE]
+        return entry_term if entry_termid == termid else None  # termids without postings are not in the array
+
+    def iter_range(self, start="", stop=None):
+        """Yields (term, termid, field mask) of every term in [start, stop) in sorted order, stop=None => till the end"""
+        block = max(self.find_block(start), 0)
+        for block in range(block, self.no_of_blocks):
+            for entry in self.read_block(block):
+                if stop is not None and entry[0] >= stop:
+                    return
+                if entry[0] >= start:
+                    yield entry
+
+    def prefix(self, prefix):
+        """Yields (term, termid, field mask) of every term starting with prefix in sorted order."""
+        for entry in self.iter_range(prefix):
+            if not entry[0].startswith(prefix):
+                return
+            yield entry
+
+    def __iter__(self):
+        return self.iter_range()
+
+    def lookup(self, term, field_mask=None):
+        """
+        Returns (termid, postings offset, no. of bytes, no. of docids, document frequency in each field,
+        max. BM25 tf component in each field) of term, None if term has no postings in the fields of field_mask.
+        """
+        entry = self.get_termid(term)
+        if entry is None or (field_mask is not None and not entry[1] & field_mask):
+            return None
+        offset, count, size, field_counts, max_scores = unpack_offset_entry(self.offsets, entry[0])
+        return entry[0], offset, size, count, field_counts, max_scores
+
+    def close(self):
+        for mapped in (self.dictionary, self.index, self.ids, self.offsets):
+            if mapped:
+                mapped.close()
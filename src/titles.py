@@ -0,0 +1,179 @@
+import bisect
+import heapq
+import mmap
+import os
+import shutil
+import struct
+import sys
+
+from src import constants
+
+# Title store:
+#  titles.bin is a blob of utf-8 encoded titles packed one after the other (in the order the pages were parsed)
+#  titles-index.bin holds one fixed-width TITLE_ENTRY per document, sorted by docid,
+#  giving the position of the document's title inside the blob and the length of each of its fields.
+# Both files are memory-mapped at search time, so only the titles of the results being printed are ever read.
+
+# docid, offset of title in blob, no. of bytes, no. of terms in each of constants.FIELDS
+TITLE_ENTRY = struct.Struct(f"<IQI{len(constants.FIELDS)}I")
+FIELD_LENGTHS = struct.Struct(f"<{len(constants.FIELDS)}I")  # the last member of TITLE_ENTRY
+TITLE_RUN_SIZE = 250000  # no. of entries sorted in memory at a time by TitleStoreWriter
+
+
+class TitleStoreWriter:
+    """
+    Entries are packed as they are added, no Python object is kept per document. Every TITLE_RUN_SIZE entries
+    they are sorted by docid and spilled to a run file, and close() k-way merges the runs into titles-index.bin
+    (or just concatenates them if the pages came in docid order, as they do in wikipedia dumps).
+    """
+
+    def __init__(self, index_dir):
+        self.index_dir = index_dir
+        self.blob_fp = open(f"{index_dir}/{constants.TITLES_FILE_NAME}", "wb")
+        self.offset = 0
+        self.entries = bytearray()  # packed TITLE_ENTRYs of the current run
+        self.run_paths = []
+        self.last_docid = -1
+        self.in_order = True  # whether the docids came in increasing order so far
+
+    def add(self, docid, title, field_lengths):
+        docid = int(docid)
+        encoded = title.encode("utf-8")
+        self.blob_fp.write(encoded)
+        self.entries += TITLE_ENTRY.pack(docid, self.offset, len(encoded), *[field_lengths.get(field, 0)
+                                                                             for field in constants.FIELDS])
+        self.offset += len(encoded)
+        if docid < self.last_docid:
+            self.in_order = False
+        self.last_docid = docid
+        if len(self.entries) >= TITLE_RUN_SIZE * TITLE_ENTRY.size:
+            self.spill()
+
+    def spill(self):
+        """Write the entries of the current run to a run file, sorted by docid."""
+        path = f"{self.index_dir}/{constants.TITLES_RUN_FILE_NAME.format(len(self.run_paths))}"
+        with open(path, "wb") as fp:
+            if self.in_order:
+                fp.write(self.entries)
+            else:
+                for entry in sorted(TITLE_ENTRY.iter_unpack(self.entries)):
+                    fp.write(TITLE_ENTRY.pack(*entry))
+        self.run_paths.append(path)
+        self.entries = bytearray()
+
+    @staticmethod
+    def read_run(path):
+        """Yields the entries of a run file."""
+        with open(path, "rb") as fp:
+            while True:
+                chunk = fp.read(TITLE_ENTRY.size * 4096)
+                if not chunk:
+                    return
+                yield from TITLE_ENTRY.iter_unpack(chunk)
+
+    def close(self):
+        self.blob_fp.close()
+        self.spill()
+        with open(f"{self.index_dir}/{constants.TITLES_INDEX_FILE_NAME}", "wb") as fp:
+            if self.in_order:
+                for path in self.run_paths:
+                    with open(path, "rb") as run_fp:
+                        shutil.copyfileobj(run_fp, fp)
+            else:
+                for entry in heapq.merge(*[self.read_run(path) for path in self.run_paths]):
+                    fp.write(TITLE_ENTRY.pack(*entry))
+        for path in self.run_paths:
+            os.remove(path)
+        self.run_paths = []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+class TitleStore:
+    def __init__(self, index_dir):
+        self.blob = self.entries = None
+        with open(f"{index_dir}/{constants.TITLES_FILE_NAME}", "rb") as fp:
+            if fp.seek(0, 2):  # mmap can't map an empty file
+                self.blob = mmap.mmap(fp.fileno(), 0, access=mmap.ACCESS_READ)
+        with open(f"{index_dir}/{constants.TITLES_INDEX_FILE_NAME}", "rb") as fp:
+            if fp.seek(0, 2):
+                self.entries = mmap.mmap(fp.fileno(), 0, access=mmap.ACCESS_READ)
+        self.no_of_entries = len(self.entries) // TITLE_ENTRY.size if self.entries else 0
+        # docid of every entry, a strided view of the mapped entries (no copy) which bisect searches in C,
+        # when the native byte order is that of the file
+        self.docid_views = []
+        self.docids = None
+        if self.entries and sys.byteorder == "little":
+            words = memoryview(self.entries).cast("I")
+            self.docid_views = [words, words[::TITLE_ENTRY.size // words.itemsize]]
+            self.docids = self.docid_views[-1]
+
+    def find(self, docid):
+        """Binary search the fixed-width entries for docid, returns the unpacked entry or None."""
+        position = self.position(docid)
+        return None if position == -1 else self.get_entry(position)
+
+    def position(self, docid, lo=0):
+        """
+        Returns the position of the entry of docid in docid order, -1 if docid is unknown.
+        Only the entries from position lo on are searched.
+        """
+        docid = int(docid)
+        if self.docids is not None:
+            position = bisect.bisect_left(self.docids, docid, lo)
+            return position if position < self.no_of_entries and self.docids[position] == docid else -1
+        hi = self.no_of_entries
+        while lo < hi:
+            mid = (lo + hi) // 2
+            entry_docid = TITLE_ENTRY.unpack_from(self.entries, mid * TITLE_ENTRY.size)[0]
+            if entry_docid == docid:
+                return mid
+            if entry_docid < docid:
+                lo = mid + 1
+            else:
+                hi = mid
+        return -1
+
+    def get_entry(self, i):
+        """Returns the i-th entry in docid order."""
+        return TITLE_ENTRY.unpack_from(self.entries, i * TITLE_ENTRY.size)
+
+    def get_lengths(self, i):
+        """Returns the no. of terms in each of constants.FIELDS of the i-th entry in docid order."""
+        return FIELD_LENGTHS.unpack_from(self.entries, (i + 1) * TITLE_ENTRY.size - FIELD_LENGTHS.size)
+
+    def get(self, docid):
+        """Returns the title of docid (None if docid is unknown)."""
+        entry = self.find(docid)
+        if entry is None:
+            return None
+        return self.get_title(entry)
+
+    def get_title(self, entry):
+        """Returns the title of the document of entry."""
+        _, offset, size = entry[:3]
+        return self.blob[offset:offset + size].decode("utf-8")
+
+    def get_field_lengths(self, docid):
+        """Returns {field: no. of terms} of docid."""
+        entry = self.find(docid)
+        if entry is None:
+            return dict.fromkeys(constants.FIELDS, 0)
+        return dict(zip(constants.FIELDS, entry[3:]))
+
+    def __len__(self):
+        return self.no_of_entries
+
+    def close(self):
+        for view in reversed(self.docid_views):
+            view.release()  # a mapping can't be closed while views of it exist
+        self.docid_views = []
+        self.docids = None
+        if self.blob:
+            self.blob.close()
+        if self.entries:
+            self.entries.close()
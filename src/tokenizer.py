@@ -1,23 +1,46 @@
 import re
+import time
 from collections import defaultdict
 
 from src import constants
 from src.helpers import Helpers
-from src.stemmer import PorterStemmer
 
 infobox_pattern = "{{infobox"
 category_pattern = "\\[\\[category:(.*?)\\]\\]"
 references_pattern = "(?s){{[Cc]ite(.*?)}}"
 
+# Single-pass wikitext scanner:
+#  markup_pattern finds every piece of markup that can change the field the text after it belongs to.
+#  The scanner walks these matches once, keeping a stack of open constructs ({{template}}, [[link]],
+#  [external link], <ref>) each with the field its text goes to (None => dropped), and sends the
+#  text between matches to the field on top of the stack:
+#      {{infobox ...}} => I, {{cite ...}} => R, [[category:...]] => C, urls in the external links section => L
+#      other templates, internal links, external links, <ref>s, comments and tags are dropped from the body
+#      (<references> and other tags only lose the tag itself, so does a named <ref name=...>),
+#      everything else => B
+#  Constructs nested inside an infobox or a citation stay in that field.
+#  A closer closes the innermost open construct of its kind (and any left open inside it), a closer with nothing to
+#  close is ignored. A [ not closed on its line and a construct never closed before the end of the page are read as
+#  plain text, as the original tokenizer does, instead of dropping the rest of the page.
+markup_pattern = re.compile(r"<!--|<ref(?:\s[^>]*?)?/>|<ref(?:\s[^>]*)?>|</ref>|<[^>]*>|{{|}}|\[\[|\]\]\]|\]\]|\[|\]"
+                            r"|==\s?external links\s?=="
+                            r"|(?:http[s]?|ftp|file)://[-a-zA-Z0-9+&@#/%?=~_|!:,.;]*[-a-zA-Z0-9+&@#/%=~_|]")
+TEMPLATE, LINK, EXTERNAL_LINK, REF = range(4)
+
 
 class Tokenizer:
+    positional = False  # also record the positions of the terms, for the positional index (see src/positions.py)
 
     def __init__(self, title):
         self.title = title
         self.doc_id = -1
         self.body_text = []
 
-        self.termid_freq_map = defaultdict(int)
+        self.termid_freq_map = defaultdict(lambda: [0] * len(constants.FIELDS))  # termid -> tf in each field
+        self.field_lengths = defaultdict(int)  # no. of terms in each field, needed for BM25
+        # termid -> positions in each field, when positional
+        self.termid_positions_map = defaultdict(lambda: [[] for _ in constants.FIELDS])
+        self.stem_time = self.stem_cpu_time = 0.0  # spent stemming the words of this page, see tokenize_page()
 
     def set_title(self, title):
         self.title = title
@@ -39,14 +62,124 @@ class Tokenizer:
         # body_text = " ".join(body_text)  # TODO uncomment when receiving body text as list
         body_text = body_text.lower()
 
-        # todo:
-        self.extract_body(body_text)
-        self.extract_infobox(body_text)
-        self.extract_categories(body_text)
-        self.extract_links(body_text)
-        self.extract_references(body_text)
+        for field, spans in self.scan(body_text).items():
+            self.extract_token(" ".join(spans), field)
         return self.termid_freq_map
 
+    @staticmethod
+    def scan(text):
+        """Walk the wikitext once and return {field: [text spans of that field]}."""
+        literal = set()  # starts of the openers read as plain text
+        while True:
+            spans, unclosed = Tokenizer.scan_spans(text, literal)
+            if unclosed is None:
+                return spans
+            # a construct that is never closed would swallow the rest of the page, the original tokenizer keeps
+            # that text: read its opener as plain text and walk the page again (rare, most pages are balanced)
+            literal.add(unclosed)
+
+    @staticmethod
+    def scan_spans(text, literal):
+        """
+        Returns ({field: [text spans of that field]}, start of the outermost construct left open or None),
+        the openers starting at a position in literal being read as plain text.
+        """
+        spans = {"B": [], "I": [], "C": [], "R": [], "L": []}
+        stack = [(None, "B", -1)]  # (construct, field its text goes to, start of its opener)
+        links_end = -1  # end of the external links section, if we are inside it
+
+        pos = 0
+        for match in markup_pattern.finditer(text):
+            start = match.start()
+            if start < pos:
+                continue  # inside a comment skipped below
+            markup = match.group()
+            if start in literal and not markup.startswith("<"):
+                continue  # stays in the text span around it
+            field = stack[-1][1]
+            if field and start > pos:
+                spans[field].append(text[pos:start])
+            pos = match.end()
+
+            if markup == "{{":
+                if field == "I" or field == "R":
+                    stack.append((TEMPLATE, field, start))
+                elif text.startswith("infobox", pos):
+                    stack.append((TEMPLATE, "I", start))
+                    spans["I"].append("infobox")
+                    pos += len("infobox")
+                elif text.startswith("cite", pos):
+                    stack.append((TEMPLATE, "R", start))
+                    pos += len("cite")
+                else:
+                    stack.append((TEMPLATE, None, start))
+            elif markup == "[[":
+                if text.startswith("category:", pos):
+                    stack.append((LINK, "C", start))
+                    pos += len("category:")
+                elif field == "I" or field == "R":
+                    stack.append((LINK, field, start))
+                else:
+                    stack.append((LINK, None, start))
+            elif markup == "[":
+                line_end = text.find("\n", pos)
+                if text.find("]", pos, len(text) if line_end == -1 else line_end) == -1:
+                    # not closed on its line ([citation needed, [0, 1)...): plain text, as for the original tokenizer
+                    if field:
+                        spans[field].append(markup)
+                else:
+                    stack.append((EXTERNAL_LINK, field if field == "I" or field == "R" else None, start))
+            elif markup == "]]]":
+                # [[link ... [external link]]] or [external link [[link]]]
+                if stack[-1][0] == EXTERNAL_LINK:
+                    Tokenizer.close(stack, EXTERNAL_LINK)
+                    Tokenizer.close(stack, LINK)
+                else:
+                    Tokenizer.close(stack, LINK)
+                    Tokenizer.close(stack, EXTERNAL_LINK)
+            elif markup == "}}":
+                Tokenizer.close(stack, TEMPLATE)
+            elif markup == "]]":
+                Tokenizer.close(stack, LINK)
+            elif markup == "]":
+                Tokenizer.close(stack, EXTERNAL_LINK)
+            elif markup.startswith("<!--"):
+                end = text.find("-->", pos)
+                pos = len(text) if end == -1 else end + 3
+            elif markup.startswith("<ref") and not markup[4].isalpha():  # not <references>
+                if not markup.endswith("/>") and start not in literal:  # an unclosed <ref> only loses the tag
+                    # like the original tokenizer, the text of a named <ref name=...> stays in the field around it
+                    stack.append((REF, None if markup == "<ref>" else field, start))
+            elif markup == "</ref>":
+                Tokenizer.close(stack, REF)
+            elif markup.startswith("<"):
+                pass  # other tags are dropped, their content is not
+            elif markup.startswith("=="):
+                if field:
+                    spans[field].append(markup)  # the heading itself is body text
+                links_end = text.find("[[category:", pos)
+                if links_end == -1:
+                    links_end = len(text)
+            else:  # url
+                if start < links_end:
+                    spans["L"].append(markup)
+                elif field:
+                    spans[field].append(markup)
+
+        if len(stack) > 1:
+            return spans, stack[1][2]
+        if pos < len(text):
+            spans["B"].append(text[pos:])
+        return spans, None
+
+    @staticmethod
+    def close(stack, construct):
+        """Closes the innermost open construct of that kind and those opened inside it, if there is one."""
+        for depth in range(len(stack) - 1, 0, -1):
+            if stack[depth][0] == construct:
+                del stack[depth:]
+                return
+
     def extract_token(self, content, field_type):
         # FIXME: will replace accented chars with spaces
         text = re.sub(r'[^a-z0-9 ]', ' ', content)  # replaces all non-alphanumeric chars by spaces
@@ -54,20 +187,51 @@ class Tokenizer:
         tokens = re.split("[ ]", text)
 
         # stopwords removal
-        # tokens = [term for term in tokens if term not in Helpers.get_stopwords() and not term.isspace()]
-        tokens = set(tokens) - Helpers.get_stopwords()
-
-        # stemming
-        stemmer = PorterStemmer()
-        terms = [stemmer.stem(word, 0, len(word) - 1) for word in tokens]
+        # every occurrence is kept (no set()), term frequencies are needed for ranking
+        stopwords = Helpers.get_stopwords()
+        tokens = [token for token in tokens if token and token not in stopwords]
+
+        # stemming, timed once per field (not per word)
+        start, start_cpu = time.perf_counter(), time.thread_time()
+        terms = [Helpers.stemmer.stem(word) for word in tokens]
+        self.stem_time += time.perf_counter() - start
+        self.stem_cpu_time += time.thread_time() - start_cpu
         # Add term to global dict
         # add no of occurrences in current doc in a map
+        start = self.field_lengths[field_type]
+        self.field_lengths[field_type] += len(terms)
+        field_no = constants.FIELDS.index(field_type)
         for term in terms:
-            term_with_field = f"{term}{constants.FIELD_SEP}{field_type}"
-            Helpers.addto_term_termid_map(term_with_field)
-            termid = Helpers.get_termid(term_with_field)
-            self.termid_freq_map[termid] += 1
+            Helpers.addto_term_termid_map(term)
+            self.termid_freq_map[Helpers.get_termid(term)][field_no] += 1
             # self.termid_freq_map[term_with_field] += 1
+        if self.positional:
+            for position, term in enumerate(terms, start):
+                self.termid_positions_map[Helpers.get_termid(term)][field_no].append(position)
+
+
+class RegexTokenizer(Tokenizer):
+    """
+    The original multi-pass tokenizer: one chain of re.sub/findall calls over the whole page per field.
+    Kept as the reference implementation the single-pass scanner is checked against
+    (see tests/test_tokenizer.py and benchmarks/bench_tokenizer.py).
+    """
+
+    def tokenize(self, body_text):
+        # tokenize title
+        self.extract_token(self.title.lower(), 'T')
+
+        # tokenize body text
+        # body_text = " ".join(body_text)  # TODO uncomment when receiving body text as list
+        body_text = body_text.lower()
+
+        # todo:
+        self.extract_body(body_text)
+        self.extract_infobox(body_text)
+        self.extract_categories(body_text)
+        self.extract_links(body_text)
+        self.extract_references(body_text)
+        return self.termid_freq_map
 
     def extract_body(self, body_text):
         body_text = re.sub("<ref>.*?</ref>", "", body_text)
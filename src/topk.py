@@ -0,0 +1,255 @@
+import bisect
+import heapq
+
+from src.compression import decode_skips, decode_block, SKIP_INTERVAL
+from src.positions import get_field_positions
+
+# Top-k query evaluation using WAND (Broder et al., 2003).
+#  Every posting list is traversed by a cursor that knows an upper bound of the score any of its documents
+#  can contribute. Cursors are kept sorted by their current docid and the "pivot" is the first cursor at which
+#  the sum of upper bounds reaches the score of the k-th best document found so far (the threshold).
+#  No document before the pivot docid can make it into the top k, so those cursors skip straight to it.
+#  Only the k best (score, docid) pairs are kept, in a min-heap.
+#
+# Conjunctive (AND) queries are evaluated document-at-a-time: the shortest posting list leads and every
+#  other cursor is advanced to its docid (using the skip table of an encoded list, or galloping search over
+#  a decoded one). Evaluation stops as soon as any list runs out, so the cost follows the rarest term.
+#
+# A cursor walks the single posting list of a term (see src/postings.py). Given a field mask it only stops on
+#  the postings of the documents having the term in one of those fields, which is how field queries are
+#  answered from the same list.
+#
+# Cursors over the posting lists of a positional index also give the positions of their current posting,
+#  which intersect() uses to keep only the documents matching a phrase or proximity query.
+#
+# Both skip the docids in deleted (documents of an index segment that were deleted or replaced later on,
+#  see src/segments.py) and can return the scores along with the docids, so that the results of several
+#  segments can be merged.
+
+END_OF_LIST = float("inf")
+
+
+class PostingCursor:
+    """Cursor over a decoded posting list."""
+
+    def __init__(self, docids, masks, tfs, upper_bound, score, field_mask=None):
+        self.docids = docids
+        self.masks = masks
+        self.tfs = tfs
+        self.count = len(docids)
+        self.upper_bound = upper_bound
+        # score(docid, mask, tfs) -> contribution of this posting list to the score of docid
+        self.score = score
+        self.field_mask = field_mask  # None => every posting
+        self.positions = None  # PositionList of the posting list, for a positional index
+        self.pos = 0
+        self.skip_filtered()
+
+    @property
+    def docid(self):
+        return self.docids[self.pos] if self.pos < self.count else END_OF_LIST
+
+    def step(self):
+        """Move to the next posting, whatever its fields."""
+        self.pos += 1
+
+    def skip_filtered(self):
+        """Move past the postings of documents not having the term in a field of self.field_mask."""
+        if self.field_mask is None:
+            return
+        while self.docid != END_OF_LIST and not self.masks[self.pos] & self.field_mask:
+            self.step()
+
+    def next(self):
+        self.step()
+        self.skip_filtered()
+
+    def advance(self, target):
+        """Move to the first docid >= target, galloping from the current position."""
+        docids = self.docids
+        lo = hi = self.pos
+        step = 1
+        while hi < self.count and docids[hi] < target:
+            lo = hi + 1
+            hi = lo + step
+            step *= 2
+        self.pos = bisect.bisect_left(docids, target, lo, min(hi + 1, self.count))
+        self.skip_filtered()
+
+    def current_score(self):
+        return self.score(self.docids[self.pos], self.masks[self.pos], self.tfs[self.pos])
+
+    def current_positions(self):
+        """{field no.: positions} of the current posting, in the fields of self.field_mask."""
+        block_start = self.pos - self.pos % SKIP_INTERVAL
+        positions = self.positions.get(block_start // SKIP_INTERVAL, self.tfs, block_start, self.pos)
+        return get_field_positions(self.masks[self.pos], positions, self.field_mask)
+
+
+class BlockPostingCursor(PostingCursor):
+    """
+    Cursor over an encoded posting list (see src/compression.py).
+    Only the skip table is decoded up front, blocks are decoded when the cursor moves into them.
+    """
+
+    def __init__(self, buf, count, codec, upper_bound, score, field_mask=None):
+        self.buf = buf
+        self.codec = codec
+        self.last_docids, self.block_offsets, end = decode_skips(buf, count)
+        self.block_ends = self.block_offsets[1:] + [end]
+        self.block = 0
+        self.load_block(0, count)
+        super().__init__(self.docids, self.masks, self.tfs, upper_bound, score)
+        self.count = count  # needed to load the next blocks, set before skipping filtered postings moves into them
+        self.field_mask = field_mask
+        self.skip_filtered()
+
+    def load_block(self, block, count=None):
+        count = self.count if count is None else count
+        self.block = block
+        self.pos = 0
+        if block < len(self.block_offsets):
+            self.docids, self.masks, self.tfs = decode_block(self.buf, self.block_offsets[block],
+                                                             self.block_ends[block],
+                                                             self.last_docids[block - 1] if block else 0,
+                                                             min(SKIP_INTERVAL, count - block * SKIP_INTERVAL),
+                                                             self.codec)
+        else:
+            self.docids, self.masks, self.tfs = [], [], []
+
+    @property
+    def docid(self):
+        return self.docids[self.pos] if self.pos < len(self.docids) else END_OF_LIST
+
+    def step(self):
+        self.pos += 1
+        if self.pos == len(self.docids) and self.block < len(self.block_offsets):
+            self.load_block(self.block + 1)
+
+    def advance(self, target):
+        if self.docid >= target:
+            return
+        if target > self.last_docids[self.block]:
+            # skip every block whose last docid is smaller than target
+            self.load_block(bisect.bisect_left(self.last_docids, target, self.block + 1))
+        self.pos = bisect.bisect_left(self.docids, target, self.pos)
+        self.skip_filtered()
+
+    def current_positions(self):
+        positions = self.positions.get(self.block, self.tfs, 0, self.pos)
+        return get_field_positions(self.masks[self.pos], positions, self.field_mask)
+
+
+class UnionCursor:
+    """Cursor over the OR of several cursors, used as a single operand of an AND."""
+
+    def __init__(self, cursors):
+        self.cursors = cursors
+        self.count = sum(cursor.count for cursor in cursors)
+        self.upper_bound = sum(cursor.upper_bound for cursor in cursors)
+
+    @property
+    def docid(self):
+        return min(cursor.docid for cursor in self.cursors)
+
+    def next(self):
+        docid = self.docid
+        for cursor in self.cursors:
+            if cursor.docid == docid:
+                cursor.next()
+
+    def advance(self, target):
+        for cursor in self.cursors:
+            cursor.advance(target)
+
+    def current_score(self):
+        docid = self.docid
+        return sum(cursor.current_score() for cursor in self.cursors if cursor.docid == docid)
+
+
+def push_result(heap, k, score, docid):
+    """Keep (score, -docid) in heap if it is one of the k best."""
+    if len(heap) < k:
+        heapq.heappush(heap, (score, -docid))
+    elif (score, -docid) > heap[0]:
+        heapq.heapreplace(heap, (score, -docid))
+
+
+def sorted_results(heap, scored=False):
+    """docids in heap (or (score, docid) pairs if scored) by decreasing score, ties broken by increasing docid"""
+    if scored:
+        return [(score, -docid) for score, docid in sorted(heap, reverse=True)]
+    return [-docid for score, docid in sorted(heap, reverse=True)]
+
+
+def intersect(cursors, k, deleted=frozenset(), scored=False, accept=None):
+    """
+    Returns the k best docids present in every cursor (and not in deleted),
+    for which accept() returns True if given. accept() is called with every cursor on the docid.
+    """
+    if not cursors:
+        return []
+    cursors = sorted(cursors, key=lambda cursor: cursor.count)  # shortest list leads
+    lead, others = cursors[0], cursors[1:]
+    heap = []
+
+    while lead.docid != END_OF_LIST:
+        candidate = lead.docid
+        for cursor in others:
+            cursor.advance(candidate)
+            if cursor.docid != candidate:
+                break
+        else:
+            if candidate not in deleted and (accept is None or accept()):
+                push_result(heap, k, sum(cursor.current_score() for cursor in cursors), candidate)
+            lead.next()
+            continue
+
+        if cursor.docid == END_OF_LIST:
+            break  # no more docids can be common to all lists
+        lead.advance(cursor.docid)
+
+    return sorted_results(heap, scored)
+
+
+def wand(cursors, k, deleted=frozenset(), scored=False):
+    """Returns the k best docids not in deleted (sorted by decreasing score, ties broken by increasing docid)."""
+    heap = []  # (score, -docid) of the best k docs, worst one on top
+    cursors = [cursor for cursor in cursors if cursor.docid != END_OF_LIST]
+
+    while cursors:
+        cursors.sort(key=lambda cursor: cursor.docid)
+        threshold = heap[0][0] if len(heap) == k else float("-inf")
+
+        pivot = None
+        upper_bound = 0
+        for i, cursor in enumerate(cursors):
+            upper_bound += cursor.upper_bound
+            # >= because a document scoring exactly the threshold can still win on the docid tie break
+            if upper_bound >= threshold:
+                pivot = i
+                break
+        if pivot is None:
+            break  # even all the remaining lists together can't beat the threshold
+
+        pivot_docid = cursors[pivot].docid
+        if cursors[0].docid == pivot_docid:
+            # all cursors up to the pivot are on pivot_docid, evaluate it fully
+            live = pivot_docid not in deleted
+            score = 0
+            for cursor in cursors:
+                if cursor.docid != pivot_docid:
+                    break
+                if live:
+                    score += cursor.current_score()
+                cursor.next()
+
+            if live:
+                push_result(heap, k, score, pivot_docid)
+        else:
+            for cursor in cursors[:pivot]:
+                cursor.advance(pivot_docid)
+
+        cursors = [cursor for cursor in cursors if cursor.docid != END_OF_LIST]
+
+    return sorted_results(heap, scored)
@@ -0,0 +1,28 @@
+import os
+
+import pytest
+
+from benchmarks.generate_dump import generate_dump, generate_queries
+from tests.helpers import build_index
+
+
+@pytest.fixture(scope="session")
+def segmented_index(tmp_path_factory):
+    """
+    An index of 300 pages and 2 delta segments (no merge), the deltas replacing most of the older pages
+    (generated pages get the same ids from any seed) and deleting some, along with queries over its vocabulary.
+    """
+    work_dir = str(tmp_path_factory.mktemp("segmented"))
+    index_dir = f"{work_dir}/index"
+    os.makedirs(index_dir)
+    vocabulary = generate_dump(f"{work_dir}/base.xml", 300, vocabulary_size=2000, seed=1)
+    build_index(f"{work_dir}/base.xml", index_dir)
+    deleted_ids = f"{work_dir}/deleted.txt"
+    with open(deleted_ids, "w") as fp:
+        for page_id in range(5, 200, 7):
+            print(page_id, file=fp)
+    for seed in (2, 3):
+        generate_dump(f"{work_dir}/delta-{seed}.xml", 200, vocabulary_size=2000, seed=seed)
+        build_index(f"{work_dir}/delta-{seed}.xml", index_dir, "--incremental", "--no-merge",
+                    "--deleted-ids", deleted_ids)
+    return index_dir, vocabulary, generate_queries(vocabulary, 100, seed=4)
@@ -0,0 +1,23 @@
+import os
+import subprocess
+import sys
+
+from search import Search
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def build_index(*args):
+    subprocess.run([sys.executable, "build_index.py", *map(str, args)], cwd=REPO_DIR, check=True,
+                   stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+
+
+def load_search(index_dir, **options):
+    search = Search(result_cache_size=0, **options)
+    cwd = os.getcwd()
+    os.chdir(REPO_DIR)  # stopwords are read from a relative path
+    try:
+        search.load(index_dir)
+    finally:
+        os.chdir(cwd)
+    return search
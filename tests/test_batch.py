@@ -0,0 +1,27 @@
+import subprocess
+import sys
+
+import pytest
+
+from src.batch import BatchSearch
+from tests.helpers import REPO_DIR, load_search
+
+
+@pytest.mark.skipif(not BatchSearch.available(), reason="needs numpy")
+@pytest.mark.parametrize("lazy", [False, True])
+def test_same_results_as_exhaustive(segmented_index, lazy):
+    index_dir, _, queries = segmented_index
+    queries = [query for type_queries in queries.values() for query in type_queries]
+    search = load_search(index_dir, lazy=lazy, pruning=False)
+    assert BatchSearch(search).search_batch(queries) == [search.search(query) for query in queries]
+
+
+@pytest.mark.skipif(BatchSearch.available(), reason="numpy is installed")
+def test_batch_without_numpy(segmented_index, tmp_path):
+    index_dir, _, _ = segmented_index
+    queryfile = tmp_path / "queries.txt"
+    queryfile.write_text("gandhi\n")
+    process = subprocess.run([sys.executable, "search.py", index_dir, str(queryfile), str(tmp_path / "output.txt"),
+                              "--batch"], cwd=REPO_DIR, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+    assert process.returncode == 2
+    assert b"--batch needs numpy" in process.stderr
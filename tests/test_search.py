@@ -0,0 +1,53 @@
+import itertools
+
+import pytest
+
+import search as search_module
+from search import field_type_map
+from tests.helpers import load_search
+
+
+def brute_force_and(search, query):
+    """Live docids having a term of the first field:terms part of query and every term of the others."""
+    clauses = search.parse_field_query(query)
+    docids = set()
+    for segment in search.segments:
+        def matching(term, field):
+            entry = segment.lookup(term)
+            if entry is None:
+                return set()
+            docids, masks, _ = segment.get_postings(entry)
+            field_bit = 1 << search_module.constants.FIELDS.index(field)
+            return {docid for docid, mask in zip(docids, masks) if mask & field_bit} - segment.deleted
+
+        field, terms = clauses[0]
+        segment_docids = set().union(*[matching(term, field) for term in terms])
+        for field, terms in clauses[1:]:
+            for term in terms:
+                segment_docids &= matching(term, field)
+        docids |= segment_docids
+    return docids
+
+
+@pytest.mark.parametrize("lazy", [False, True])
+def test_and_field_queries_match_brute_force(segmented_index, monkeypatch, lazy):
+    index_dir, vocabulary, queries = segmented_index
+    monkeypatch.setattr(search_module, "FIELD_QUERY_OPERATOR", "AND")
+    search = load_search(index_dir, lazy=lazy, top_k=10 ** 6)
+    top_10 = load_search(index_dir, lazy=lazy)
+
+    # generated queries (one term per field) and queries ORing several terms of the first field
+    common = vocabulary[:12]
+    field_queries = queries["field"] + [
+        f"{first}:{a},{b} {other}:{c}" for (first, other), (a, b, c) in
+        zip(itertools.permutations(field_type_map, 2), itertools.combinations(common, 3))]
+    matched = 0
+    for query in field_queries:
+        expected = brute_force_and(search, query)
+        results = search.search(query)
+        assert len(results) == len(set(results)), query
+        assert set(results) == expected, query
+        assert top_10.search(query) == results[:10], query
+        matched += bool(expected)
+    assert matched > 10  # the intersections are not all empty
+    assert any(segment.deleted for segment in search.segments)
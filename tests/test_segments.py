@@ -0,0 +1,116 @@
+import os
+import random
+from collections import Counter
+
+import pytest
+
+from benchmarks.generate_dump import generate_dump
+from src import constants, segments
+from src.indexer import Indexer
+from tests.helpers import build_index, load_search
+
+
+@pytest.mark.parametrize("lazy", [False, True])
+def test_wand_matches_exhaustive_with_tombstones(segmented_index, lazy):
+    index_dir, _, queries = segmented_index
+    wand_search = load_search(index_dir, lazy=lazy)
+    exhaustive_search = load_search(index_dir, lazy=lazy, pruning=False)
+    assert len(wand_search.segments) == 3
+    assert any(segment.deleted for segment in wand_search.segments)
+
+    for query in [query for type_queries in queries.values() for query in type_queries]:
+        assert wand_search.search(query) == exhaustive_search.search(query), query
+
+
+def test_idf_is_not_negative_for_common_terms(segmented_index):
+    index_dir, vocabulary, _ = segmented_index
+    search = load_search(index_dir, lazy=True)
+    all_fields = dict.fromkeys(search.field_weights, 1)
+    for term in search.get_terms(" ".join(vocabulary[:20])):
+        entries = search.lookup(term)
+        df = sum(entry[1][field_no] for _, entry in entries for field_no in range(len(entry[1])))
+        assert df, term
+        for _, weighted_idf in search.get_weighted_idfs(entries, all_fields):
+            assert weighted_idf >= 0, term
+
+
+@pytest.mark.parametrize("lazy", [False, True])
+def test_live_statistics_match_the_live_documents(segmented_index, lazy):
+    index_dir, _, _ = segmented_index
+    for segment in load_search(index_dir, lazy=lazy).segments:
+        tombstones = segments.Tombstones.read(segment.path, len(segment.title_store))
+        deleted, live_field_lengths = set(), dict.fromkeys(constants.FIELDS, 0)
+        for position in range(len(segment.title_store)):
+            entry = segment.title_store.get_entry(position)
+            if tombstones.is_dead(position):
+                deleted.add(entry[0])
+            else:
+                for field, length in zip(constants.FIELDS, entry[3:]):
+                    live_field_lengths[field] += length
+        assert segment.deleted == deleted
+        assert segment.no_of_live_docs == len(segment.title_store) - len(deleted)
+        for field in constants.FIELDS:
+            assert segment.live_field_lengths[field] == pytest.approx(live_field_lengths[field]), field
+
+
+def test_deletes_during_a_merge_are_kept(tmp_path, monkeypatch):
+    index_dir = str(tmp_path / "index")
+    os.makedirs(index_dir)
+    generate_dump(str(tmp_path / "base.xml"), 100, vocabulary_size=500, seed=1)
+    build_index(str(tmp_path / "base.xml"), index_dir)
+    generate_dump(str(tmp_path / "delta.xml"), 20, vocabulary_size=500, seed=2)
+    build_index(str(tmp_path / "delta.xml"), index_dir, "--incremental", "--no-merge")
+    names = segments.read_segment_names(index_dir)
+    search = load_search(index_dir)
+    no_of_docs = search.no_of_docs
+    victims = [docid for docid in sorted(search.segments[0].doc_field_lengths)
+               if search.get_title(docid) is not None][-5:]
+
+    write_stats = Indexer.write_stats
+
+    def write_stats_then_delete(*args):
+        # runs once the merged segment is written, before it takes the place of the merged ones:
+        # delete documents of a merged segment, as publishing a segment would
+        write_stats(*args)
+        with segments.index_lock(index_dir):
+            assert segments.delete_documents(f"{index_dir}/{names[0]}", victims) == len(victims)
+
+    monkeypatch.setattr(Indexer, "write_stats", write_stats_then_delete)
+    merged_name = segments.merge_segments(index_dir, names)
+    assert segments.read_segment_names(index_dir) == [merged_name]
+
+    search = load_search(index_dir)
+    assert search.no_of_docs == no_of_docs - len(victims)
+    for docid in victims:
+        assert search.get_title(docid) is None
+
+
+@pytest.mark.parametrize("seed", range(5))
+def test_merge_policy_bounds_the_no_of_segments(seed):
+    # live documents of every segment after many increments of mixed sizes, some deleting older pages
+    rng = random.Random(seed)
+    sizes = [100000]
+    for _ in range(500):
+        if rng.random() < 0.3:
+            victim = rng.randrange(len(sizes))
+            sizes[victim] -= rng.randint(0, sizes[victim])
+        sizes.append(rng.choice([1, 3, 20, 70, 300, 1500]) * rng.randint(1, 3))
+        start = segments.choose_merge(sizes)
+        while start is not None:
+            sizes[start:start + segments.MERGE_FACTOR] = [sum(sizes[start:start + segments.MERGE_FACTOR])]
+            start = segments.choose_merge(sizes)
+
+        tiers = Counter(segments.get_tier(size) for size in sizes)
+        assert max(tiers.values()) < segments.MERGE_FACTOR
+        assert len(sizes) < segments.MERGE_FACTOR * (segments.get_tier(sum(sizes)) + 1)
+
+
+def test_stranded_segments_get_merged():
+    # tiers 4, 0, 1, 1, 2, 2, 0, 1, 2, 1: no MERGE_FACTOR adjacent segments of the same tier
+    sizes = [300, 1, 5, 6, 20, 30, 2, 7, 25, 9]
+    start = segments.choose_merge(sizes)
+    assert start is not None
+    while start is not None:
+        sizes[start:start + segments.MERGE_FACTOR] = [sum(sizes[start:start + segments.MERGE_FACTOR])]
+        start = segments.choose_merge(sizes)
+    assert max(Counter(segments.get_tier(size) for size in sizes).values()) < segments.MERGE_FACTOR
@@ -0,0 +1,63 @@
+import asyncio
+import json
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+from server import SearchServer, SearchWorker
+from tests.helpers import load_search
+
+
+@pytest.fixture(scope="module")
+def server(segmented_index):
+    index_dir, _, _ = segmented_index
+    SearchWorker.search = load_search(index_dir, lazy=True)
+    SearchWorker.profiler = None
+    executor = ThreadPoolExecutor(max_workers=1)
+    yield SearchServer(executor)
+    executor.shutdown()
+
+
+def respond(server, request):
+    return asyncio.run(server.respond(json.dumps(request)))
+
+
+def test_batch(server, segmented_index):
+    _, _, queries = segmented_index
+    batch = queries["one_word"][:5] + queries["field"][:5]
+    response = respond(server, {"queries": batch})
+    assert "error" not in response
+    assert response["results"] == [SearchWorker.search.answer(query) for query in batch]
+
+
+def test_empty_batch(server):
+    response = respond(server, {"queries": []})
+    assert response["results"] == []
+
+
+@pytest.mark.parametrize("query", ["foo:bar", "title:gandhi india"])
+def test_invalid_field_query(server, query):
+    response = respond(server, {"query": query})
+    assert "results" not in response
+    assert "is not field:terms" in response["error"]
+
+
+def test_request_longer_than_limit(server, segmented_index):
+    _, _, queries = segmented_index
+    query = queries["one_word"][0]
+
+    async def exchange():
+        tcp_server = await asyncio.start_server(server.handle, "127.0.0.1", 0, limit=1024)
+        async with tcp_server:
+            port = tcp_server.sockets[0].getsockname()[1]
+            reader, writer = await asyncio.open_connection("127.0.0.1", port)
+            writer.write(json.dumps({"query": "x" * 5000}).encode() + b"\n")
+            writer.write(json.dumps({"query": query}).encode() + b"\n")
+            await writer.drain()
+            responses = [json.loads(await reader.readline()) for _ in range(2)]
+            writer.close()
+            return responses
+
+    too_long, answered = asyncio.run(exchange())
+    assert "request longer than" in too_long["error"]
+    assert answered["results"] == SearchWorker.search.answer(query)
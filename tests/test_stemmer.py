@@ -0,0 +1,22 @@
+from src.stemmer import CachedStemmer
+
+
+def test_cache_is_bounded():
+    stemmer = CachedStemmer(100)
+    for i in range(1000):
+        stemmer.stem(f"running{i}s")
+    assert len(stemmer.cache) <= 100
+    assert not stemmer.new_stems
+
+
+def test_workers_hand_new_stems_over():
+    worker_stemmer = CachedStemmer(100, record_new_stems=True)
+    assert worker_stemmer.stem("running") == "run"
+    assert worker_stemmer.stem("running") == "run"
+    new_stems = worker_stemmer.pop_new_stems()
+    assert new_stems == {"running": "run"}
+    assert not worker_stemmer.new_stems
+
+    stemmer = CachedStemmer(100)
+    stemmer.merge(new_stems, 1, 1)
+    assert stemmer.cache.get("running") == "run"
@@ -0,0 +1,30 @@
+import os
+import random
+
+import pytest
+
+from src import constants, titles
+from src.titles import TitleStore, TitleStoreWriter
+
+
+@pytest.mark.parametrize("in_order", [True, False])
+def test_entries_are_sorted_across_runs(tmp_path, monkeypatch, in_order):
+    monkeypatch.setattr(titles, "TITLE_RUN_SIZE", 7)
+    docids = list(range(10, 1000, 9))
+    if not in_order:
+        random.Random(1).shuffle(docids)
+    with TitleStoreWriter(str(tmp_path)) as writer:
+        for docid in docids:
+            writer.add(docid, f"Page {docid}", {"T": 2, "B": docid})
+    assert sorted(os.listdir(tmp_path)) == [constants.TITLES_INDEX_FILE_NAME, constants.TITLES_FILE_NAME]
+
+    title_store = TitleStore(str(tmp_path))
+    assert [title_store.get_entry(i)[0] for i in range(len(title_store))] == sorted(docids)
+    position = 0
+    for docid in sorted(docids):
+        position = title_store.position(docid, position)
+        assert title_store.get(docid) == f"Page {docid}"
+        assert title_store.get_lengths(position) == (2, docid) + (0,) * (len(constants.FIELDS) - 2)
+    assert title_store.get(11) is None
+    assert title_store.position(2000) == -1
+    title_store.close()
@@ -0,0 +1,91 @@
+import os
+from collections import Counter
+
+import pytest
+
+from src import constants
+from src.helpers import Helpers
+from src.tokenizer import Tokenizer, RegexTokenizer
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# the single-pass tokenizer must extract the same terms as the original regex tokenizer in every field
+SNIPPETS = {
+    "plain": "Mahatma Gandhi was born in Porbandar. He studied law in London.",
+    "cite": "Gandhi led the salt march.<ref>{{cite book |title=Salt satyagraha |publisher=Navajivan}}</ref> "
+            "He was arrested.",
+    "named_ref": 'Tagore wrote poems.<ref name="nobel">{{cite web |title=Nobel lecture |year=1913}}</ref> '
+                 'Later essays.<ref name="nobel" />',
+    "self_closing_refs": 'Alpha beta.<ref name="a" />Gamma delta.<ref/>Epsilon.',
+    "references": "Intro alpha.<ref>cite beta</ref>\n<references>\n<ref name=x>gamma</ref>\n</references>\n"
+                  "Afterward delta epsilon zeta.",
+    "references_self_closing": "Intro alpha.<ref>{{cite news |title=Beta}}</ref>\n== References ==\n"
+                               "<references />\nAfterward delta.",
+    "comment": "Visible text here.<!-- hidden remark about cricket -->More visible words.",
+    "internal_links": "The [[Ganges]] flows into the [[Bay of Bengal|bay]] near Kolkata.",
+    "external_links": "Body words.\n== External links ==\n* [http://www.example.org/gandhi Official site]\n"
+                      "* [https://archive.org/details/salt Archive]\n[[Category:Indian activists]]",
+    "categories": "Some body.\n[[Category:Rivers of India]]\n[[Category:Sacred rivers]]",
+    "one_line_infobox": "{{Infobox river | name = Ganges | mouth = Bay of Bengal}} The Ganges flows east.",
+    # constructs that are never closed, or closed by a closer of another kind, must not swallow the text after them
+    "link_ending_in_external_link": "Before.\n[[File:x.jpg|thumb|caption [http://a b]]]\nAfter the image, "
+                                    "delta epsilon.",
+    "stray_bracket": "The claim is disputed [citation needed\nThe river floods every monsoon.",
+    "interval": "Values in [0, 1) are accepted.\nLater text about rivers.",
+    "unclosed_template": "Start words {{unfinished template\nThe valley is fertile and green.",
+    "bracket_in_infobox": "{{Infobox x | a = [b }} The lake is deep and cold.",
+    "unclosed_ref": "Alpha words.<ref>beta gamma\nDelta epsilon follow here.",
+}
+
+# multi-line templates leak into the body of the original tokenizer (its {{.*?}} doesn't cross lines), their
+# lines are kept out of the body by design: only the body is checked against the expected terms for these
+MULTI_LINE_TEMPLATES = {
+    "infobox": ("{{Infobox river\n| name = Ganges\n| mouth = Bay of Bengal\n| length = 2525\n}}\n"
+                "The Ganges flows east.", "The Ganges flows east."),
+    "nested_templates": ("{{Infobox person\n| name = Tagore\n| awards = {{nowrap|Nobel prize}}\n"
+                         "| birth = {{birth date|1861|5|7}}\n}}\nTagore wrote poems.", "Tagore wrote poems."),
+}
+
+
+@pytest.fixture(scope="module", autouse=True)
+def stopwords():
+    Helpers.load_stopwords(os.path.join(REPO_DIR, constants.STOPWORDS_FILE_PATH))
+
+
+def tokenize(tokenizer_class, text, title="Page"):
+    """Returns {field: {term: tf}} of the terms extracted from a page."""
+    termid_tfs = tokenizer_class(title).tokenize(text)
+    term_of = {termid: term for term, termid in Helpers.term_termid_map.items()}
+    fields = {field: Counter() for field in constants.FIELDS}
+    for termid, tfs in termid_tfs.items():
+        for field, tf in zip(constants.FIELDS, tfs):
+            if tf:
+                fields[field][term_of[termid]] = tf
+    return fields
+
+
+@pytest.mark.parametrize("name", SNIPPETS)
+def test_same_terms_as_regex_tokenizer(name):
+    single_pass = tokenize(Tokenizer, SNIPPETS[name])
+    regex = tokenize(RegexTokenizer, SNIPPETS[name])
+    for field in constants.FIELDS:
+        assert single_pass[field] == regex[field], field
+
+
+@pytest.mark.parametrize("name", MULTI_LINE_TEMPLATES)
+def test_multi_line_templates(name):
+    text, body = MULTI_LINE_TEMPLATES[name]
+    single_pass = tokenize(Tokenizer, text)
+    regex = tokenize(RegexTokenizer, text)
+    for field in constants.FIELDS:
+        if field != "B":
+            assert single_pass[field] == regex[field], field
+    assert single_pass["B"] == tokenize(Tokenizer, body)["B"]
+    assert single_pass["I"]
+
+
+def test_text_after_references_is_kept():
+    body = tokenize(Tokenizer, SNIPPETS["references"])["B"]
+    for term in ("afterward", "delta", "epsilon", "zeta", "gamma"):
+        assert term in body, term
+    assert "beta" not in body
@@ -0,0 +1,33 @@
+import pytest
+
+from src.compression import VARINT, GAMMA, SKIP_INTERVAL, encode_postings
+from src.topk import PostingCursor, BlockPostingCursor, END_OF_LIST
+
+TITLE, BODY = 1, 2  # field masks
+
+
+def walk(cursor):
+    docids = []
+    while cursor.docid != END_OF_LIST:
+        docids.append(cursor.docid)
+        cursor.next()
+    return docids
+
+
+@pytest.mark.parametrize("codec", [VARINT, GAMMA])
+@pytest.mark.parametrize("filtered_blocks", [1, 2])
+def test_field_filtered_cursor_skips_whole_blocks(codec, filtered_blocks):
+    # the first blocks only have the term in the body, a title field query must skip them all
+    count = SKIP_INTERVAL * (filtered_blocks + 1) + 7
+    docids = list(range(3, 3 + 2 * count, 2))
+    masks = [BODY if i < SKIP_INTERVAL * filtered_blocks else TITLE | BODY if i % 3 else TITLE for i in range(count)]
+    tfs = [(1,) * bin(mask).count("1") for mask in masks]
+    buf = encode_postings(docids, masks, tfs, codec)
+
+    expected = [docid for docid, mask in zip(docids, masks) if mask & TITLE]
+    assert walk(PostingCursor(docids, masks, tfs, 0, None, TITLE)) == expected
+    assert walk(BlockPostingCursor(buf, count, codec, 0, None, TITLE)) == expected
+
+    cursor = BlockPostingCursor(buf, count, codec, 0, None, TITLE)
+    cursor.advance(expected[5] - 1)
+    assert cursor.docid == expected[5]